@@ -1,14 +1,24 @@
 import os 
-import requests
 from dotenv import load_dotenv
 load_dotenv()
 
 from flask import Flask, render_template, request, flash, redirect, session, g, jsonify
 from flask_debugtoolbar import DebugToolbarExtension
 # from secret import API_SECRET_KEY, TEST_API_SECRET_KEY
-from models import db, connect_db, User, Favorites, Recipe, toggle_favorites, Rating
+from models import db, connect_db, end_transaction, User, Favorites, Recipe, toggle_favorites, toggle_favorites_bulk, Rating
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 from forms import UserAddForm, LoginForm
+from upstream import spoonacular, connect_upstream, UpstreamError
+from cache import TTLCache, shared_backend_from_config
+from auth import UserLoader, LazyUser
+from converter import convert
+from ingredients import ingredient_index
+from catalog import json_to_recipe, recipe_to_json, get_recipe, get_recipes, connect_catalog
+from matcher import recipe_matcher, connect_matcher
+from metrics import connect_metrics
+from passwords import connect_passwords, HashingBusyError
+from throttle import login_throttle, connect_throttle
 
 #remove this eventually
 CURR_USER_KEY = "curr_user"
@@ -21,14 +31,81 @@ app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', "postgres:///usemyfood_db")
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+#DB connections per worker; gunicorn.conf.py shares DB_MAX_CONNECTIONS out between the workers
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+    'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+    'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+}
 app.config['SQLALCHEMY_ECHO'] = False
 app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', "it's a secret")
 app.config['API_SECRET_KEY'] = os.environ.get('API_SECRET_KEY')
 API_SECRET_KEY = os.environ.get('API_SECRET_KEY')
+#Set API_CACHE_BACKEND to "sqlite" so all gunicorn workers share one on-disk cache
+app.config['API_CACHE_BACKEND'] = os.environ.get('API_CACHE_BACKEND', 'memory')
+app.config['API_CACHE_PATH'] = os.environ.get('API_CACHE_PATH', 'api_cache.sqlite3')
+app.config['API_CACHE_MAX_ENTRIES'] = int(os.environ.get('API_CACHE_MAX_ENTRIES', 5000))
+app.config['SPOONACULAR_BASE_URL'] = os.environ.get('SPOONACULAR_BASE_URL', "https://api.spoonacular.com")
+app.config['UPSTREAM_POOL_SIZE'] = int(os.environ.get('UPSTREAM_POOL_SIZE', 10))
+app.config['UPSTREAM_CONNECT_TIMEOUT'] = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 3.05))
+app.config['UPSTREAM_READ_TIMEOUT'] = float(os.environ.get('UPSTREAM_READ_TIMEOUT', 10))
+app.config['UPSTREAM_RETRIES'] = int(os.environ.get('UPSTREAM_RETRIES', 2))
+app.config['UPSTREAM_BACKOFF'] = float(os.environ.get('UPSTREAM_BACKOFF', 0.3))
+app.config['UPSTREAM_BREAKER_THRESHOLD'] = int(os.environ.get('UPSTREAM_BREAKER_THRESHOLD', 5))
+app.config['UPSTREAM_BREAKER_RESET'] = float(os.environ.get('UPSTREAM_BREAKER_RESET', 30))
+#Set UPSTREAM_LOCK_DIR so identical API requests are also coalesced across the workers of a host
+app.config['UPSTREAM_LOCK_DIR'] = os.environ.get('UPSTREAM_LOCK_DIR')
+#Requests per second (and burst) allowed to the API; set UPSTREAM_QUOTA_PATH so the workers share one bucket
+app.config['UPSTREAM_RATE'] = float(os.environ.get('UPSTREAM_RATE', 2))
+app.config['UPSTREAM_BURST'] = float(os.environ.get('UPSTREAM_BURST', 10))
+app.config['UPSTREAM_MAX_WAIT'] = float(os.environ.get('UPSTREAM_MAX_WAIT', 2))
+app.config['UPSTREAM_QUOTA_RESERVE'] = float(os.environ.get('UPSTREAM_QUOTA_RESERVE', 10))
+app.config['UPSTREAM_QUOTA_PATH'] = os.environ.get('UPSTREAM_QUOTA_PATH')
+app.config['FAVORITES_CACHE_TTL'] = int(os.environ.get('FAVORITES_CACHE_TTL', 300))
+app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 60))
+#Ingredient searches are answered from the local catalog when every result uses this share of the ingredients
+app.config['LOCAL_MATCH_MIN_COVERAGE'] = float(os.environ.get('LOCAL_MATCH_MIN_COVERAGE', 0.5))
+app.config['LOCAL_MATCH_REFRESH'] = float(os.environ.get('LOCAL_MATCH_REFRESH', 300))
+#Recipes older than RECIPE_FRESH_FOR seconds are served as they are and refreshed in the background
+app.config['RECIPE_FRESH_FOR'] = float(os.environ.get('RECIPE_FRESH_FOR', 7 * 24 * 60 * 60))
+app.config['RECIPE_REFRESH_WORKERS'] = int(os.environ.get('RECIPE_REFRESH_WORKERS', 1))
+#SQL statements slower than this many milliseconds are logged with the endpoint that ran them
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 100))
+#Workers save their metrics in METRICS_DIR so /metrics can add them up; set METRICS_TOKEN to require a bearer token
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR')
+app.config['METRICS_FLUSH_INTERVAL'] = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+#bcrypt work factor; existing hashes are upgraded to it as users log in
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+#Passwords are hashed on a pool ("process", "gevent" threads or "inline"), LOGIN_CONCURRENCY at a time per worker
+app.config['PASSWORD_HASH_POOL'] = os.environ.get('PASSWORD_HASH_POOL', 'process')
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+app.config['LOGIN_CONCURRENCY'] = int(os.environ.get('LOGIN_CONCURRENCY', 4))
+app.config['LOGIN_MAX_WAIT'] = float(os.environ.get('LOGIN_MAX_WAIT', 5))
+#Login attempts allowed per username and per client IP in any LOGIN_THROTTLE_WINDOW seconds.
+#Set LOGIN_THROTTLE_PATH so the workers share one count, and LOGIN_THROTTLE_PROXIES to 1 behind Heroku's router
+app.config['LOGIN_MAX_ATTEMPTS_PER_USER'] = int(os.environ.get('LOGIN_MAX_ATTEMPTS_PER_USER', 10))
+app.config['LOGIN_MAX_ATTEMPTS_PER_IP'] = int(os.environ.get('LOGIN_MAX_ATTEMPTS_PER_IP', 50))
+app.config['LOGIN_THROTTLE_WINDOW'] = float(os.environ.get('LOGIN_THROTTLE_WINDOW', 15 * 60))
+app.config['LOGIN_THROTTLE_PATH'] = os.environ.get('LOGIN_THROTTLE_PATH')
+app.config['LOGIN_THROTTLE_PROXIES'] = int(os.environ.get('LOGIN_THROTTLE_PROXIES', 0))
 toolbar = DebugToolbarExtension(app)
 
 connect_db(app)
+connect_upstream(app)
+connect_matcher(app)
+connect_catalog(app)
+connect_metrics(app)
+connect_passwords(app)
+connect_throttle(app)
+
+#api_ids of each user's favorites, dropped whenever that user toggles a favorite.
+#Only kept with the shared sqlite backend, so no worker serves favorites another worker has changed
+favorites_cache = TTLCache(shared_backend_from_config(app.config, table='favorites_cache'), app.config['FAVORITES_CACHE_TTL'])
+
+#logged in users' rows, likewise only cached when every worker sees an account being deleted
+user_loader = UserLoader(app.config['USER_CACHE_TTL'], shared_backend_from_config(app.config, table='user_cache'))
 
 
 ########################
@@ -36,10 +113,13 @@ connect_db(app)
 
 @app.before_request
 def add_user_to_g():
-    """If logged in, add curr user to Flask global, not sure if this works for multiple uses"""
+    """If logged in, add curr user to Flask global.
+
+    The user is only loaded from the DB once something other than g.user.id is used.
+    """
 
     if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
+        g.user = LazyUser(session[CURR_USER_KEY], user_loader, CURR_USER_KEY)
 
     else:
         g.user = None 
@@ -75,6 +155,10 @@ def signup():
                 email=form.email.data,
             )
             db.session.commit()
+
+        except HashingBusyError as e:
+            flash(str(e), 'danger')
+            return render_template('users/signup.html', form=form), 503
         
         except IntegrityError as e:
             if "users_email_key" in str(e) and "users_username_key" in str(e):
@@ -112,9 +196,22 @@ def login():
     form = LoginForm()
 
     if form.validate_on_submit():
-        user = User.authenticate(form.username.data, form.password.data)
+        #turn away password guessing before it costs a query and a bcrypt check
+        wait = login_throttle.attempt(form.username.data, login_throttle.client_ip(request))
+        if wait:
+            flash(f"Too many login attempts, please try again in {max(1, round(wait / 60))} minute(s).", 'danger')
+            return render_template('users/login.html', form=form), 429, {'Retry-After': str(wait)}
+
+        try:
+            user = User.authenticate(form.username.data, form.password.data)
+        except HashingBusyError as e:
+            flash(str(e), 'danger')
+            return render_template('users/login.html', form=form), 503
 
         if user:
+            #saves the password if authenticate rehashed it
+            db.session.commit()
+            login_throttle.reset(form.username.data)
             do_login(user)
             flash(f"Hello, {user.username}, let's get cooking!", 'success')
             return redirect('/')
@@ -143,8 +240,10 @@ def delete_user():
 
     do_logout()
 
-    db.session.delete(g.user)
+    db.session.delete(g.user._get_current_object())
     db.session.commit()
+    user_loader.invalidate(g.user.id)
+    invalidate_favorites(g.user.id)
 
     return redirect('/signup')
 
@@ -159,15 +258,20 @@ def user_favorites(user_id):
 
     user = User.query.get_or_404(user_id)
 
-    favorites = user.favorites
-    has_ratings = []
+    #load every favorite together with its recipe in one query
+    favorites = (Favorites.query
+                 .options(joinedload(Favorites.recipe))
+                 .filter(Favorites.user_id == user.id)
+                 .order_by(Favorites.id)
+                 .all())
+
+    #whether a recipe has ratings is stored on the recipe, which is already loaded
+    has_ratings = {fav.id for fav in favorites if fav.recipe.rating_count > 0}
 
-    for fav in favorites:
-        rating = Rating.query.filter(Rating.recipe_id == fav.recipe_id).all()
-        if len(rating) != 0:
-            has_ratings.append(fav.id)
+    #the user's own rating for each recipe, so the template doesn't scan all of them per favorite
+    user_ratings = {rating.recipe_id: rating for rating in Rating.query.filter(Rating.user_id == user.id)}
 
-    return render_template('users/favorites.html', user=user, favorites=favorites, has_ratings=has_ratings)
+    return render_template('users/favorites.html', user=user, favorites=favorites, has_ratings=has_ratings, user_ratings=user_ratings)
 
 @app.route('/users/<int:user_id>/ratings')
 def user_ratings(user_id):
@@ -178,14 +282,14 @@ def user_ratings(user_id):
 
     user = User.query.get_or_404(user_id)
 
-    ratings = user.ratings
-    recipes = []
+    #load every rating together with its recipe in one query
+    ratings = (Rating.query
+               .options(joinedload(Rating.recipe))
+               .filter(Rating.user_id == user.id)
+               .order_by(Rating.id)
+               .all())
 
-    for rating in ratings:
-        recipe = Recipe.query.get(rating.recipe_id)
-        recipes.append(recipe)
-
-    return render_template('users/ratings.html', user=user, ratings=ratings, recipes=recipes)
+    return render_template('users/ratings.html', user=user, ratings=ratings)
 
 ########################################################
 
@@ -205,7 +309,7 @@ def edit_rating():
         return redirect('/login')
     
     review = request.form['review']
-    rating = request.form['rating']
+    rating = float(request.form['rating'])
     user_id = request.form['user_id']
     rating_id = request.form['rating_id']
 
@@ -224,16 +328,42 @@ def edit_rating():
 ##############################################################
 #Basic favorites routes
 
+def favorite_api_ids(user_id):
+    """Return the set of api_ids a user has favorited, from the cache or one joined query"""
+    key = f"user:{user_id}"
+    api_ids = favorites_cache.get(key)
+
+    if api_ids is None:
+        rows = (db.session.query(Recipe.api_id)
+                .join(Favorites, Favorites.recipe_id == Recipe.id)
+                .filter(Favorites.user_id == user_id)
+                .all())
+        api_ids = [api_id for (api_id,) in rows]
+        favorites_cache.set(key, api_ids)
+
+    return set(api_ids)
+
+
+def invalidate_favorites(user_id):
+    """Forget the cached favorites of a user after they change"""
+    favorites_cache.delete(f"user:{user_id}")
+
+
 @app.route('/users/curruser/favorites')
 def return_list_favorites():
-    """Return a list of the current user's favorites' recipe api_id"""
-    favIds = []
-    favorites = g.user.favorites
+    """Return which of the comma separated api_ids in ?ids= the current user has favorited"""
+    if not g.user:
+        return {"favIds": []}
 
-    for favorite in favorites:
-        favIds.append(favorite.recipe.api_id)
-    
-    return {"favIds":favIds}
+    api_ids = parse_api_ids(request.args.get('ids', ''))
+
+    if api_ids is None:
+        return jsonify({"error": f"ids must be at most {MAX_BATCH_IDS} comma separated recipe ids"}), 400
+
+    favorited = favorite_api_ids(g.user.id)
+    favIds = [api_id for api_id in api_ids if api_id in favorited]
+
+    return {"favIds": favIds}
 
 @app.route('/users/toggle_favorite', methods=["POST"])
 def add_favorite():
@@ -244,23 +374,39 @@ def add_favorite():
     
     id = request.json['id']
     response = toggle_favorites(id, g.user.id)
+    invalidate_favorites(g.user.id)
     
     return response
 
+@app.route('/users/toggle_favorites', methods=["POST"])
+def toggle_many_favorites():
+    """Toggle several favorites at once, e.g. when a client syncs changes made offline"""
+    if not g.user:
+        return jsonify({"error": "Access unauthorized"}), 401
+
+    data = request.get_json(silent=True)
+    ids = data.get('ids') if isinstance(data, dict) else None
+    if not isinstance(ids, list) or len(ids) > MAX_BATCH_IDS or not all(isinstance(id, int) for id in ids):
+        return jsonify({"error": f"ids must be a list of at most {MAX_BATCH_IDS} recipe ids"}), 400
+
+    response = toggle_favorites_bulk(ids, g.user.id)
+    invalidate_favorites(g.user.id)
+
+    return response
+
 ##############################################################
 #Searching by recipe
 @app.route('/search', methods=["POST"])
 def search_by_recipe():
     """Request recipe information based on the title of the searched recipe"""
-    user = User.query.get(g.user.id)
+    user = g.user._get_current_object()
 
     search_term = request.form['searchRecipeTerm']
 
     #change the number here to change the amount of recipes returned, then search for recipes by recipe name
-    payload = {'query': search_term, 'number': 5, 'addRecipeInformation': 'true', 'apiKey': API_SECRET_KEY}
-    resp = requests.get('https://api.spoonacular.com/recipes/complexSearch', params=payload)
-
-    search_results = resp.json()['results']
+    payload = {'query': search_term, 'number': 5, 'addRecipeInformation': 'true'}
+    end_transaction()
+    search_results = spoonacular.get('recipes/complexSearch', payload)['results']
 
     #if no results are found, or if therefore the query is not valid, respond with an error
     if len(search_results) == 0:
@@ -270,27 +416,15 @@ def search_by_recipe():
     #clean up all the information not needed by the page
     recipe_list = json_to_recipe(search_results)
 
-    #idicate whether there are ratings for each result
-    has_ratings = []
-
-    for recipe in recipe_list:
-        rating = Recipe.query.filter(
-            Recipe.api_id == recipe['api_id'] and Recipe.ratings != 0).all()
-        if len(rating) != 0:
-            has_ratings.append(recipe['api_id'])
+    #idicate whether there are ratings for each result, with one query for all of them
+    api_ids = [recipe['api_id'] for recipe in recipe_list]
+    rated = (db.session.query(Recipe.api_id)
+             .filter(Recipe.api_id.in_(api_ids), Recipe.rating_count > 0)
+             .all())
+    has_ratings = {api_id for (api_id,) in rated}
 
     return render_template('search/searchresults.html', search_term=search_term, recipe_list=recipe_list, has_ratings=has_ratings, user=user)
 
-
-def json_to_recipe(recipes):
-    """Clean up a list of json recipes into a simpler recipe list of objects"""
-    recipe_list = []
-    for recipe in recipes:
-        new_recipe = {"name": recipe['title'], "recipe_url": recipe['sourceUrl'], "image_url": recipe['image'], "api_id": recipe['id'], "vegetarian": recipe['vegetarian'], "vegan": recipe['vegan']}
-        recipe_list.append(new_recipe)
-
-    return recipe_list
-
 ##############################################################
 #Converter
 
@@ -306,24 +440,18 @@ def show_converter():
 @app.route('/ratings/rate')
 def rating_form():
     """Load form for user to rate/review a recipe"""
-    api_id = request.args.get('api_id')
+    api_id = request.args.get('api_id', type=int)
 
     if not g.user:
         flash("Access unauthorized", 'danger')
         return redirect('/login')
 
-    recipe = Recipe.query.filter(Recipe.api_id==api_id).first()
-    
-    # if the recipe is not already in the DB get info about it from the API and add it to the db
-    if recipe == None:
-        payload = {'apiKey': API_SECRET_KEY}
-        resp = requests.get(f'https://api.spoonacular.com/recipes/{api_id}/information', params=payload)
-        recipe_info = resp.json()
-        new_recipe = json_to_recipe([recipe_info])[0]
-        recipe_add = Recipe.add_recipe(new_recipe['name'], new_recipe['recipe_url'], new_recipe['image_url'], new_recipe['api_id'], new_recipe['vegetarian'], new_recipe['vegan'])
-        db.session.commit()
-        
-    recipe = Recipe.query.filter(Recipe.api_id == api_id).first()
+    if api_id is None:
+        flash("No recipes with this id", 'danger')
+        return redirect('/')
+
+    # if the recipe is not already in the DB the catalog gets it from the API and adds it to the db
+    recipe = get_recipe(api_id)
 
     return render_template('/rating/rate_recipe.html', recipe=recipe)
 
@@ -342,21 +470,41 @@ def add_rating():
 
     new_rating = Rating(rating=rating, user_id=g.user.id, recipe_id=id, review=review)
     db.session.add(new_rating)
-    db.session.commit()
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        #a user gets one rating per recipe, send them to edit the one they have
+        db.session.rollback()
+        existing = Rating.query.filter(Rating.user_id == g.user.id, Rating.recipe_id == id).first()
+        flash("You have already rated this recipe", 'danger')
+        if existing:
+            return redirect(f'/ratings/edit?rating_id={existing.id}')
+        return redirect("/")
 
     flash("Review added", 'success')
     return redirect("/")
 
-@app.route('/ratings/all_recipe_ids')
-def get_all_rated_recipes():
-    """Return a list of all api_id's for recipes that have been rated"""
-    rated_recipes = Recipe.query.filter(Recipe.ratings != None).all()
+@app.route('/ratings/rated')
+def get_rated_recipes():
+    """Return which of the comma separated api_ids in ?ids= have been rated"""
+    api_ids = parse_api_ids(request.args.get('ids', ''))
+
+    if api_ids is None:
+        return jsonify({"error": f"ids must be at most {MAX_BATCH_IDS} comma separated recipe ids"}), 400
 
-    ids = []
-    for recipe in rated_recipes:
-        ids.append(recipe.api_id)
+    rated_recipes = (db.session.query(Recipe.api_id)
+                     .filter(Recipe.api_id.in_(api_ids), Recipe.rating_count > 0)
+                     .order_by(Recipe.api_id)
+                     .all())
 
-    return {"ids": ids}
+    ids = [api_id for (api_id,) in rated_recipes]
+
+    #let the browser revalidate with If-None-Match instead of downloading the list again
+    resp = jsonify({"ids": ids})
+    resp.add_etag()
+    resp.cache_control.no_cache = True
+    return resp.make_conditional(request)
 
 @app.route('/ratings')
 def show_recipe_ratings():
@@ -389,6 +537,16 @@ def page_not_found(e):
     return render_template('404.html'), 404
 
 
+@app.errorhandler(UpstreamError)
+def upstream_unavailable(e):
+    """Answer JS helpers with a JSON error, and pages with a flashed message"""
+    if request.is_json:
+        return jsonify({"error": str(e)}), 503
+
+    flash(str(e), 'danger')
+    return redirect('/')
+
+
 @app.route('/add_recipe', methods=["POST"])
 def add_recipe_to_db():
     """Add a recipe to the Recipe table, return recipe id if success of False if not"""
@@ -421,43 +579,99 @@ def add_recipe_to_db():
 # Helper requests from JS
 ###
 
+#The most recipe ids a single batch request may ask about
+MAX_BATCH_IDS = 100
+
+
+def parse_api_ids(ids):
+    """Parse a comma separated string of api_ids, or return None if it isn't valid"""
+    try:
+        api_ids = list(dict.fromkeys(int(api_id) for api_id in str(ids).split(',') if api_id.strip()))
+    except ValueError:
+        return None
+
+    if len(api_ids) > MAX_BATCH_IDS:
+        return None
+
+    return api_ids
+
+def find_by_ingredients(ingStr, numRecipes):
+    """Return findByIngredients results, from the local catalog when it covers the search"""
+
+    #equivalent searches share one canonical string, and so one cached upstream response
+    ingStr = ingredient_index.canonicalize(ingStr)
+    ingredient_index.record(ingStr.split(','))
+
+    #only ask the API when the recipes we already have don't cover the search
+    data = recipe_matcher.find(ingStr.split(','), int(numRecipes))
+    if data is None:
+        payload = {'ingredients': ingStr, 'number': numRecipes}
+        end_transaction()
+        data = spoonacular.get('recipes/findByIngredients', payload)
+
+    return data
+
 @app.route('/ingredient-search', methods=["POST"])
 def search_by_ingredient():
     """Help json by returning entire recipe search by ingredient"""
 
-    numRecipes = request.json['number']
-    ingStr = request.json['ingStr']
-    payload = {'ingredients': ingStr, 'number': numRecipes, 'apiKey': API_SECRET_KEY}
-    resp = requests.get(f'{SEARCH_BY_ING_URL}', params=payload)
-    data = resp.json()
+    data = find_by_ingredients(request.json['ingStr'], request.json['number'])
     json_response = {"data": data}
     return json_response
 
+@app.route('/ingredient-search/recipes', methods=["POST"])
+def search_recipes_by_ingredient():
+    """Search by ingredient and return just what the page shows of each recipe, in one round trip"""
+
+    matches = find_by_ingredients(request.json['ingStr'], request.json['number'])
+    recipes = get_recipes([match['id'] for match in matches])
+
+    #flag favorites and rated recipes so the page doesn't have to ask again
+    favorited = favorite_api_ids(g.user.id) if g.user else set()
+
+    data = []
+    for recipe in recipes:
+        recipe_json = recipe_to_json(recipe)
+        recipe_json['favorited'] = recipe.api_id in favorited
+        recipe_json['rated'] = recipe.rating_count > 0
+        data.append(recipe_json)
+
+    return {"recipes": data}
+
 
 # @app.route('/ingredient-search-1-recipe', methods=["POST"])
 # def search_by_ingredient_1_recipe():
 
 @app.route('/ingredient-search-recipes-helper', methods=["POST"])
 def search_by_ingredient_recipe_helper():
-    """Get recipe information from API and return it to app.js"""
-    ids = request.json['ids']
-    payload = {'ids': ids, 'apiKey': API_SECRET_KEY}
-    resp = requests.get(f'https://api.spoonacular.com/recipes/informationBulk', params=payload)
-    data = resp.json()
+    """Get recipe information from the catalog, or the API for unknown recipes, and return it to app.js"""
+    ids = [api_id for api_id in str(request.json['ids']).split(',') if api_id.strip()]
+    recipes = get_recipes(ids)
+    data = [recipe_to_json(recipe) for recipe in recipes]
     json_response = {"data": data}
     return json_response
 
+@app.route('/ingredients/suggest')
+def suggest_ingredients():
+    """Suggest ingredient names for the search box as the user types"""
+    query = request.args.get('q', '')
+    limit = min(request.args.get('limit', 10, type=int), 25)
+
+    return {"suggestions": ingredient_index.suggest(query, limit)}
+
 @app.route('/converter-helper', methods=["POST"])
 def convert_helper():
-    """Help JS converter request, send request to API"""
+    """Help JS converter request, converting locally and only asking the API about unknown ingredients"""
     sourceIngredient = request.json['sourceIngredient']
-    sourceAmount = request.json['sourceAmount']
     sourceUnit = request.json['sourceUnit']
     targetUnit = request.json['targetUnit']
 
-    payload = {"ingredientName": sourceIngredient, "sourceAmount": sourceAmount, "sourceUnit": sourceUnit, "targetUnit": targetUnit, "apiKey": API_SECRET_KEY}
-    resp = requests.get(f'https://api.spoonacular.com/recipes/convert', params=payload)
-    data = resp.json()
+    try:
+        sourceAmount = float(request.json['sourceAmount'])
+    except (TypeError, ValueError):
+        return jsonify({"error": "Not a valid amount"}), 400
+
+    data = convert(sourceIngredient, sourceAmount, sourceUnit, targetUnit)
     json_response = {"data": data}
     return json_response
 
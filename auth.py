@@ -0,0 +1,84 @@
+"""Request-scoped loading of the logged in user"""
+
+from flask import session
+from sqlalchemy.orm import make_transient_to_detached
+from werkzeug.exceptions import Unauthorized
+
+from cache import TTLCache, NullBackend
+from models import db, User
+
+#Columns kept in the user cache; the password hash is left to load on demand
+CACHED_USER_COLUMNS = ('id', 'username', 'email')
+
+
+class UserLoader:
+    """Load users by id through a TTL cache of their rows.
+
+    The backend must be shared by every worker, so deleting an account
+    invalidates it everywhere; the default caches nothing.
+    """
+
+    def __init__(self, ttl=60, backend=None):
+        self.cache = TTLCache(backend if backend is not None else NullBackend(), ttl)
+
+    def load(self, user_id):
+        """Return the User attached to the current session, or None if it doesn't exist"""
+        row = self.cache.get(f"user:{user_id}")
+
+        if row is None:
+            user = User.query.get(user_id)
+            if user is not None:
+                self.cache.set(f"user:{user_id}", {column: getattr(user, column) for column in CACHED_USER_COLUMNS})
+            return user
+
+        #rebuild the row as a persistent object without querying; relationships still lazy load
+        user = User(**row)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    def invalidate(self, user_id):
+        self.cache.delete(f"user:{user_id}")
+
+
+class LazyUser:
+    """Stand-in for the logged in User that only loads it when more than its id is needed"""
+
+    def __init__(self, user_id, loader, session_key):
+        self.__dict__['id'] = user_id
+        self.__dict__['_loader'] = loader
+        self.__dict__['_session_key'] = session_key
+        self.__dict__['_user'] = None
+
+    def _get_current_object(self):
+        """Return the real User, loading it on first use"""
+        if self._user is None:
+            user = self._loader.load(self.id)
+
+            #the account was deleted while this session was still logged in
+            if user is None:
+                session.pop(self._session_key, None)
+                raise Unauthorized("This account no longer exists")
+
+            self.__dict__['_user'] = user
+
+        return self._user
+
+    def __getattr__(self, name):
+        return getattr(self._get_current_object(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._get_current_object(), name, value)
+
+    def __bool__(self):
+        return True
+
+    def __eq__(self, other):
+        if isinstance(other, LazyUser):
+            other = other._get_current_object()
+        return self._get_current_object() == other
+
+    def __hash__(self):
+        return hash((User, self.id))
+
+    def __repr__(self):
+        return f"<LazyUser #{self.id}>"
@@ -0,0 +1 @@
+"""Load testing tools: a fake Spoonacular server, dataset seeding and scenario runner"""
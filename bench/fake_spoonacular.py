@@ -0,0 +1,139 @@
+"""Stand-in for api.spoonacular.com with made up but stable recipes, for load tests.
+
+to serve it with 150ms +/- 50ms of latency and 1% errors:
+
+    python -m bench.fake_spoonacular --port 8089 --latency 150 --jitter 50 --error-rate 0.01
+
+then point the app at it with SPOONACULAR_BASE_URL=http://127.0.0.1:8089
+"""
+
+import argparse
+import random
+import threading
+import time
+import zlib
+
+from flask import Flask, request, jsonify
+
+from ingredients import load_ingredient_names
+
+INGREDIENTS = sorted(load_ingredient_names())
+
+#Statuses returned when an error is injected
+ERROR_STATUSES = (429, 500, 503)
+
+
+def make_recipe(api_id):
+    """Return the informationBulk entry for a recipe id; the same id always gives the same recipe"""
+    rng = random.Random(api_id)
+    ingredients = rng.sample(INGREDIENTS, rng.randint(4, 12))
+    vegan = rng.random() < 0.1
+
+    return {
+        "id": api_id,
+        "title": f"{ingredients[0].title()} with {ingredients[1]} #{api_id}",
+        "image": f"https://spoonacular.test/recipeImages/{api_id}-556x370.jpg",
+        "sourceUrl": f"https://recipes.test/{api_id}",
+        "vegetarian": vegan or rng.random() < 0.3,
+        "vegan": vegan,
+        "extendedIngredients": [{"name": name} for name in ingredients],
+    }
+
+
+def create_app(latency=0.0, jitter=0.0, error_rate=0.0, catalog_size=10000, daily_quota=150000):
+    """Create the fake API; latency and jitter are in seconds"""
+    fake = Flask(__name__)
+    rng = random.Random()
+    lock = threading.Lock()
+    points_used = [0]
+
+    def ids_for(text, number):
+        """Pick number stable recipe ids for a search string"""
+        start = zlib.crc32(text.encode('utf-8')) % catalog_size
+        return [(start + i * 7919) % catalog_size + 1 for i in range(number)]
+
+    @fake.before_request
+    def slow_down_and_fail():
+        time.sleep(max(0.0, latency + rng.uniform(-jitter, jitter)))
+
+        if rng.random() < error_rate:
+            return jsonify({"status": "failure", "message": "injected error"}), rng.choice(ERROR_STATUSES)
+
+    @fake.after_request
+    def add_quota_headers(resp):
+        with lock:
+            points_used[0] += 1
+            used = points_used[0]
+
+        resp.headers['X-API-Quota-Request'] = '1'
+        resp.headers['X-API-Quota-Used'] = str(used)
+        resp.headers['X-API-Quota-Left'] = str(max(0, daily_quota - used))
+        return resp
+
+    @fake.route('/recipes/findByIngredients')
+    def find_by_ingredients():
+        wanted = {name.strip() for name in request.args.get('ingredients', '').split(',') if name.strip()}
+        results = []
+
+        for api_id in ids_for(request.args.get('ingredients', ''), request.args.get('number', 10, type=int)):
+            recipe = make_recipe(api_id)
+            names = [ingredient['name'] for ingredient in recipe['extendedIngredients']]
+            used = [name for name in names if name in wanted]
+            missed = [name for name in names if name not in wanted]
+            results.append({
+                "id": api_id,
+                "title": recipe['title'],
+                "image": recipe['image'],
+                "usedIngredientCount": len(used),
+                "missedIngredientCount": len(missed),
+                "usedIngredients": [{"name": name} for name in used],
+                "missedIngredients": [{"name": name} for name in missed],
+                "unusedIngredients": [{"name": name} for name in wanted if name not in used],
+                "likes": 0,
+            })
+
+        return jsonify(results)
+
+    @fake.route('/recipes/informationBulk')
+    def information_bulk():
+        ids = [int(api_id) for api_id in request.args.get('ids', '').split(',') if api_id.strip()]
+        return jsonify([make_recipe(api_id) for api_id in ids])
+
+    @fake.route('/recipes/<int:api_id>/information')
+    def information(api_id):
+        return jsonify(make_recipe(api_id))
+
+    @fake.route('/recipes/complexSearch')
+    def complex_search():
+        query = request.args.get('query', '')
+        results = [make_recipe(api_id) for api_id in ids_for(query, request.args.get('number', 10, type=int))]
+        return jsonify({"results": results, "offset": 0, "number": len(results), "totalResults": catalog_size})
+
+    @fake.route('/recipes/convert')
+    def convert():
+        amount = request.args.get('sourceAmount', 1.0, type=float)
+        target = round(amount * 120, 2)
+        return jsonify({
+            "sourceAmount": amount,
+            "sourceUnit": request.args.get('sourceUnit'),
+            "targetAmount": target,
+            "targetUnit": request.args.get('targetUnit'),
+            "answer": f"{amount} {request.args.get('sourceUnit')} translates to {target} {request.args.get('targetUnit')}.",
+            "type": "CONVERSION",
+        })
+
+    return fake
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve a fake Spoonacular API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=100, help="mean response time in ms")
+    parser.add_argument('--jitter', type=float, default=0, help="latency varies by up to this many ms either way")
+    parser.add_argument('--error-rate', type=float, default=0, help="share of requests answered with 429/5xx")
+    parser.add_argument('--catalog-size', type=int, default=10000, help="how many distinct recipe ids searches return")
+    args = parser.parse_args()
+
+    fake = create_app(args.latency / 1000, args.jitter / 1000, args.error_rate, args.catalog_size)
+    fake.run(host=args.host, port=args.port, threaded=True)
@@ -0,0 +1,241 @@
+"""Run load scenarios and report throughput, latency percentiles and SQL queries per request.
+
+Seed a database with bench.seed_data and start bench.fake_spoonacular first. By
+default the app runs in this process behind Flask's test client, so the SQL
+queries of every request can be counted:
+
+    DATABASE_URL=postgresql:///usemyfood_bench SPOONACULAR_BASE_URL=http://127.0.0.1:8089 \\
+        python -m bench.run --scale 100000 --concurrency 8 --duration 20
+
+--url sends real HTTP requests to a running server (e.g. gunicorn) instead.
+--save writes the results to a JSON file, and --baseline compares against one.
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+from bench.seed_data import BENCH_PASSWORD, dataset_size
+
+SEARCH_INGREDIENTS = ["tomatoes", "onion", "garlic", "cilantro", "chicken breasts", "rice", "butter", "flour",
+                      "eggplant", "potatoes", "cheddar cheese", "spinach", "lemon", "milk", "bell pepper"]
+
+
+def scenario_search(client, user_id, sizes, rng):
+    ingredients = rng.sample(SEARCH_INGREDIENTS, rng.randint(1, 3))
+    return client.post('/ingredient-search/recipes', {"number": 10, "ingStr": ",+".join(ingredients)})
+
+
+def scenario_favorite_toggle(client, user_id, sizes, rng):
+    return client.post('/users/toggle_favorite', {"id": rng.randint(1, sizes["recipes"])})
+
+
+def scenario_favorites_page(client, user_id, sizes, rng):
+    return client.get(f'/users/{user_id}/favorites')
+
+
+def scenario_ratings_page(client, user_id, sizes, rng):
+    return client.get(f'/users/{user_id}/ratings')
+
+
+SCENARIOS = {
+    "search": scenario_search,
+    "favorite_toggle": scenario_favorite_toggle,
+    "favorites_page": scenario_favorites_page,
+    "ratings_page": scenario_ratings_page,
+}
+
+
+class QueryCounter:
+    """Count the SQL statements each thread runs"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self._local = threading.local()
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    def take(self):
+        """Return the statements run by this thread since the last call"""
+        count = getattr(self._local, 'count', 0)
+        self._local.count = 0
+        return count
+
+
+class InProcessClient:
+    """Drive the app through Flask's test client, logged in as a user"""
+
+    def __init__(self, app, user_id, session_key):
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[session_key] = user_id
+
+    def get(self, path):
+        return self.client.get(path).status_code
+
+    def post(self, path, json):
+        return self.client.post(path, json=json).status_code
+
+
+class HttpClient:
+    """Drive a running server over HTTP, logged in through the login form"""
+
+    def __init__(self, base_url, user_id):
+        import requests
+
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+        page = self.session.get(f'{self.base_url}/login').text
+        token = re.search(r'name="csrf_token" type="hidden" value="([^"]+)"', page)
+        self.session.post(f'{self.base_url}/login', data={
+            "csrf_token": token.group(1) if token else "",
+            "username": f"bench_user_{user_id}",
+            "password": BENCH_PASSWORD,
+        })
+
+    def get(self, path):
+        return self.session.get(self.base_url + path).status_code
+
+    def post(self, path, json):
+        return self.session.post(self.base_url + path, json=json).status_code
+
+
+def percentile(ordered, share):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+def run_scenario(name, make_client, sizes, concurrency, duration, counter=None, seed=0):
+    """Run one scenario from concurrency threads for duration seconds and summarize it"""
+    scenario = SCENARIOS[name]
+    latencies = []
+    queries = []
+    errors = [0]
+    lock = threading.Lock()
+    start = threading.Barrier(concurrency + 1)
+
+    def worker(number):
+        rng = random.Random(seed + number)
+        user_id = number % sizes["users"] + 1
+        client = make_client(user_id)
+        mine, my_queries, my_errors = [], [], 0
+
+        start.wait()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            if counter:
+                counter.take()
+
+            began = time.perf_counter()
+            try:
+                status = scenario(client, user_id, sizes, rng)
+            except Exception:
+                status = None
+            mine.append(time.perf_counter() - began)
+
+            if status is None or status >= 400:
+                my_errors += 1
+            if counter:
+                my_queries.append(counter.take())
+
+        with lock:
+            latencies.extend(mine)
+            queries.extend(my_queries)
+            errors[0] += my_errors
+
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.monotonic()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - began
+
+    latencies.sort()
+    return {
+        "scenario": name,
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "queries_per_request": sum(queries) / len(queries) if queries else None,
+    }
+
+
+def format_results(results, baseline=None):
+    """Return a table of results, with the change from the baseline run where there is one"""
+    baseline = {result["scenario"]: result for result in baseline or []}
+    lines = [f"{'scenario':<16}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}"]
+
+    for result in results:
+        queries = result["queries_per_request"]
+        lines.append(f"{result['scenario']:<16}{result['requests']:>9}{result['errors']:>8}{result['rps']:>9.1f}"
+                     f"{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{result['p99_ms']:>9.1f}"
+                     f"{'n/a' if queries is None else format(queries, '.1f'):>9}")
+
+        before = baseline.get(result["scenario"])
+        if before:
+            changes = [f"req/s {(result['rps'] - before['rps']) / before['rps']:+.0%}" if before['rps'] else "",
+                       f"p95 {(result['p95_ms'] - before['p95_ms']) / before['p95_ms']:+.0%}" if before['p95_ms'] else ""]
+            lines.append(f"{'  vs baseline':<16}{', '.join(change for change in changes if change)}")
+
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the app against a seeded database")
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help="repeat to run several (default: all)")
+    parser.add_argument('--scale', type=int, default=10000, help="the --scale the database was seeded with")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10, help="seconds per scenario")
+    parser.add_argument('--url', help="benchmark a running server instead of the app in this process")
+    parser.add_argument('--save', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="compare with results saved by an earlier --save")
+    args = parser.parse_args()
+
+    sizes = dataset_size(args.scale)
+    counter = None
+
+    if args.url:
+        def make_client(user_id):
+            return HttpClient(args.url, user_id)
+    else:
+        if 'DATABASE_URL' not in os.environ:
+            sys.exit("Set DATABASE_URL to the database seeded by bench.seed_data")
+
+        from app import app, CURR_USER_KEY
+        from models import db
+
+        app.config['WTF_CSRF_ENABLED'] = False
+        counter = QueryCounter(db.engine)
+
+        def make_client(user_id):
+            return InProcessClient(app, user_id, CURR_USER_KEY)
+
+    results = [run_scenario(name, make_client, sizes, args.concurrency, args.duration, counter)
+               for name in args.scenario or list(SCENARIOS)]
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print(format_results(results, baseline))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,115 @@
+"""Fill a benchmark database with users, recipes, favorites and ratings.
+
+This drops everything in the database first, so it only runs with DATABASE_URL set:
+
+    DATABASE_URL=postgresql:///usemyfood_bench python -m bench.seed_data --scale 100000
+
+--scale is the number of favorites. There are half as many ratings, a tenth
+as many recipes and a hundredth as many users. Users are named bench_user_<id>
+and all have the password in BENCH_PASSWORD. Recipes have ids 1..recipes and
+match the fake API's recipes with the same ids.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+from sqlalchemy import text
+
+BENCH_PASSWORD = "benchpassword"
+
+BATCH_SIZE = 5000
+
+RATINGS = [value / 2 for value in range(2, 11)]
+
+
+def dataset_size(scale):
+    """Return how many rows of each kind a scale asks for"""
+    return {
+        "users": max(10, scale // 100),
+        "recipes": max(100, scale // 10),
+        "favorites": scale,
+        "ratings": scale // 2,
+    }
+
+
+def batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def user_recipe_pairs(rng, users, recipes, total):
+    """Yield total distinct (user_id, recipe_id) pairs, spread evenly over the users"""
+    for user_id in range(1, users + 1):
+        count = total // users + (1 if user_id <= total % users else 0)
+        for recipe_id in rng.sample(range(1, recipes + 1), min(count, recipes)):
+            yield user_id, recipe_id
+
+
+def seed(scale, seed=0):
+    from models import db, User, Recipe, RecipeIngredient, Favorites, Rating, reconcile_rating_aggregates, refreshed_now
+    from catalog import json_to_recipe, json_to_ingredients
+    from migrate import reset_database
+    from passwords import password_hasher
+    from bench.fake_spoonacular import make_recipe
+
+    sizes = dataset_size(scale)
+    rng = random.Random(seed)
+    started = time.time()
+
+    reset_database()
+
+    def insert(table, rows):
+        count = 0
+        for batch in batches(rows):
+            db.session.execute(table.insert(), batch)
+            db.session.commit()
+            count += len(batch)
+        print(f"{table.name}: {count} rows ({time.time() - started:.1f}s)")
+
+    #hashing is the slow part of signing up, and every user shares the same password
+    password = password_hasher.hash(BENCH_PASSWORD)
+    insert(User.__table__, ({"id": user_id, "username": f"bench_user_{user_id}", "email": f"bench_user_{user_id}@bench.test",
+                             "password": password} for user_id in range(1, sizes["users"] + 1)))
+
+    recipes = [make_recipe(api_id) for api_id in range(1, sizes["recipes"] + 1)]
+    insert(Recipe.__table__, (dict(recipe, id=recipe['api_id'], refreshed_at=refreshed_now()) for recipe in json_to_recipe(recipes)))
+    insert(RecipeIngredient.__table__, ({"recipe_api_id": api_id, "ingredient": name}
+                                        for api_id, names in json_to_ingredients(recipes).items() for name in names))
+
+    insert(Favorites.__table__, ({"user_id": user_id, "recipe_id": recipe_id}
+                                 for user_id, recipe_id in user_recipe_pairs(rng, sizes["users"], sizes["recipes"], sizes["favorites"])))
+    insert(Rating.__table__, ({"user_id": user_id, "recipe_id": recipe_id, "rating": rng.choice(RATINGS), "review": "benchmark review"}
+                              for user_id, recipe_id in user_recipe_pairs(rng, sizes["users"], sizes["recipes"], sizes["ratings"])))
+
+    #rows were given explicit ids, so move the sequences past them
+    for table in ('users', 'recipes'):
+        db.session.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))"))
+    db.session.commit()
+
+    #core inserts skip the Rating events, so fill in the aggregates in one go
+    reconcile_rating_aggregates()
+    print(f"seeded {sizes} in {time.time() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Seed a benchmark database")
+    parser.add_argument('--scale', type=int, default=10000, help="number of favorites (1000 to 1000000)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed, for repeatable datasets")
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        sys.exit("Set DATABASE_URL to the benchmark database; it will be emptied")
+
+    from app import app
+
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(app.config['SQLALCHEMY_ENGINE_OPTIONS'], executemany_mode='values')
+    seed(args.scale, args.seed)
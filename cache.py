@@ -0,0 +1,295 @@
+"""Shared caches for Spoonacular API responses and per-user lookups"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urlencode
+
+DEFAULT_TTL = 60 * 60
+
+#Time to live (in seconds) for each API endpoint, keyed by the last segment of its path
+ENDPOINT_TTLS = {
+    "complexSearch": 60 * 60,
+    "findByIngredients": 60 * 60,
+    "informationBulk": 24 * 60 * 60,
+    "information": 24 * 60 * 60,
+    "convert": 30 * 24 * 60 * 60,
+}
+
+#Query params that never change the response and must not end up in a key
+IGNORED_PARAMS = {"apiKey"}
+
+DEFAULT_MAX_ENTRIES = 5000
+
+
+def make_cache_key(endpoint, params):
+    """Build a normalized cache key from an endpoint and its query params"""
+    items = []
+    for key, value in params.items():
+        if key in IGNORED_PARAMS or value is None:
+            continue
+        items.append((key, str(value).strip()))
+
+    return f"{endpoint.strip('/')}?{urlencode(sorted(items))}"
+
+
+def ttl_for(endpoint, ttls=ENDPOINT_TTLS, default=DEFAULT_TTL):
+    """Return the time to live for an endpoint path such as 'recipes/123/information'"""
+    name = endpoint.strip('/').split('/')[-1]
+    return ttls.get(name, default)
+
+
+class MemoryBackend:
+    """In-process LRU store, bounded to max_entries"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (value, expires_at) for a key, or None if absent"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class NullBackend:
+    """Store that keeps nothing, for data that must not go stale in one worker while another changes it"""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, expires_at):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class SQLiteConnection:
+    """One sqlite connection per process, for state every gunicorn worker on the host shares.
+
+    One shared connection, rather than one per thread, also suits gevent
+    workers where every request runs in its own greenlet.
+    """
+
+    def __init__(self, path, schema=()):
+        self.path = path
+        self.schema = schema
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        #a connection inherited from a parent process can't be used after fork
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            for statement in self.schema:
+                self._conn.execute(statement)
+            self._pid = os.getpid()
+        return self._conn
+
+    @contextmanager
+    def read(self):
+        """Lend out the connection for reads, which only take sqlite's shared lock"""
+        with self._lock:
+            yield self._connect()
+
+    @contextmanager
+    def transaction(self):
+        """Lend out the connection in a transaction that holds the write lock from the start.
+
+        Taking it up front means two workers can't both read a value and then
+        write back what they made of it. Commits when done, or rolls back on error.
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+
+class SQLiteBackend:
+    """On-disk LRU store that every gunicorn worker on the host can share.
+
+    Reads never write: each worker remembers which keys it served and saves
+    their access times with its next set(), just before evicting.
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, table='api_cache'):
+        self.path = path
+        self.max_entries = max_entries
+        self.table = table
+        self._touched = {}
+        self.db = SQLiteConnection(path, [
+            f"""CREATE TABLE IF NOT EXISTS {table} (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL)""",
+            f"CREATE INDEX IF NOT EXISTS {table}_accessed_at_idx ON {table} (accessed_at)",
+        ])
+
+    def get(self, key):
+        with self.db.read() as conn:
+            row = conn.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+
+            #a read only takes sqlite's shared lock; the write lock waits for the next set()
+            self._touched[key] = time.time()
+
+        return (json.loads(row[0]), row[1])
+
+    def set(self, key, value, expires_at):
+        with self.db.transaction() as conn:
+            touched, self._touched = self._touched, {}
+            conn.executemany(f"UPDATE {self.table} SET accessed_at = MAX(accessed_at, ?) WHERE key = ?",
+                             [(accessed_at, touched_key) for touched_key, accessed_at in touched.items()])
+
+            conn.execute(f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                         (key, json.dumps(value), expires_at, time.time()))
+            #evict the least recently used entries past the size bound
+            conn.execute(f"""DELETE FROM {self.table} WHERE key IN (
+                                 SELECT key FROM {self.table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)""",
+                         (self.max_entries,))
+
+    def delete(self, key):
+        with self.db.transaction() as conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def clear(self):
+        with self.db.transaction() as conn:
+            conn.execute(f"DELETE FROM {self.table}")
+
+    def __len__(self):
+        with self.db.read() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+def backend_from_config(config, table='api_cache'):
+    """Create the cache backend chosen by API_CACHE_BACKEND in the Flask app config"""
+    max_entries = int(config.get('API_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES))
+
+    if config.get('API_CACHE_BACKEND', 'memory') == 'sqlite':
+        return SQLiteBackend(config.get('API_CACHE_PATH', 'api_cache.sqlite3'), max_entries, table)
+
+    return MemoryBackend(max_entries)
+
+
+def shared_backend_from_config(config, table):
+    """Like backend_from_config, but caches nothing unless every worker shares the backend.
+
+    For per-user data that one worker changes and another could keep serving:
+    there, a miss costs one indexed query but a stale entry shows the wrong state.
+    """
+    if config.get('API_CACHE_BACKEND', 'memory') == 'sqlite':
+        return backend_from_config(config, table)
+
+    return NullBackend()
+
+
+class TTLCache:
+    """Plain key/value cache where every entry lives for the same time"""
+
+    def __init__(self, backend=None, ttl=DEFAULT_TTL):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+
+    def get(self, key):
+        """Return the cached value, or None if missing or expired"""
+        entry = self.backend.get(key)
+
+        if entry is None or entry[1] < time.time():
+            return None
+
+        return entry[0]
+
+    def set(self, key, value):
+        self.backend.set(key, value, time.time() + self.ttl)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+
+class ResponseCache:
+    """Cache of decoded API responses with a TTL per endpoint"""
+
+    def __init__(self, backend=None, ttls=None, default_ttl=DEFAULT_TTL):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttls = ttls if ttls is not None else dict(ENDPOINT_TTLS)
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a cache from the Flask app config"""
+        return cls(backend_from_config(config))
+
+    def get(self, endpoint, params):
+        """Return the cached response for this request, or None if missing or expired"""
+        entry = self.backend.get(make_cache_key(endpoint, params))
+
+        if entry is None or entry[1] < time.time():
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return entry[0]
+
+    def get_stale(self, endpoint, params):
+        """Return the cached response even if it has expired, or None if there is none"""
+        entry = self.backend.get(make_cache_key(endpoint, params))
+        if entry is None:
+            return None
+
+        self.stale_hits += 1
+        return entry[0]
+
+    def set(self, endpoint, params, value):
+        expires_at = time.time() + ttl_for(endpoint, self.ttls, self.default_ttl)
+        self.backend.set(make_cache_key(endpoint, params), value, expires_at)
+
+    def delete(self, endpoint, params):
+        self.backend.delete(make_cache_key(endpoint, params))
+
+    def clear(self):
+        self.backend.clear()
@@ -0,0 +1,236 @@
+"""Read-through recipe catalog backed by the recipes table"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, Recipe, RecipeIngredient, DEFAULT_IMG_URL, REFRESHED_FIELDS, refreshed_now, end_transaction
+from upstream import spoonacular
+from quota import BACKGROUND
+from ingredients import ingredient_index
+from matcher import recipe_matcher
+from metrics import register_collector
+
+#How long (in seconds) a recipe field is served before it is refreshed in the background
+DEFAULT_FRESH_FOR = 7 * 24 * 60 * 60
+
+#informationBulk takes at most this many ids
+MAX_BULK_IDS = 100
+
+
+def json_to_recipe(recipes):
+    """Clean up a list of json recipes into a simpler recipe list of objects"""
+    recipe_list = []
+    for recipe in recipes:
+        new_recipe = {"name": recipe['title'], "recipe_url": recipe.get('sourceUrl') or recipe.get('spoonacularSourceUrl'), "image_url": recipe.get('image') or DEFAULT_IMG_URL, "api_id": recipe['id'], "vegetarian": recipe.get('vegetarian'), "vegan": recipe.get('vegan')}
+        recipe_list.append(new_recipe)
+
+    return recipe_list
+
+
+def recipe_to_json(recipe):
+    """Turn a Recipe into the fields of an informationBulk response that app.js reads"""
+    return {
+        "id": recipe.api_id,
+        "title": recipe.name,
+        "sourceUrl": recipe.recipe_url,
+        "image": recipe.image_url,
+        "vegetarian": recipe.vegetarian,
+        "vegan": recipe.vegan,
+    }
+
+
+def upsert_recipes(recipe_list):
+    """Insert or update a list of cleaned up recipes in one statement, keyed on api_id"""
+    if not recipe_list:
+        return
+
+    rows = {}
+    for recipe in recipe_list:
+        rows[recipe['api_id']] = dict(recipe, refreshed_at=refreshed_now([field for field in REFRESHED_FIELDS if field in recipe]))
+
+    table = Recipe.__table__
+    stmt = insert(table).values(list(rows.values()))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['api_id'],
+        set_={
+            "name": stmt.excluded.name,
+            "recipe_url": stmt.excluded.recipe_url,
+            "image_url": stmt.excluded.image_url,
+            "vegetarian": stmt.excluded.vegetarian,
+            "vegan": stmt.excluded.vegan,
+            #merge, so fields this upsert didn't touch keep their own times
+            "refreshed_at": table.c.refreshed_at.op('||')(stmt.excluded.refreshed_at),
+        },
+    )
+
+    db.session.execute(stmt)
+    db.session.commit()
+
+
+def json_to_ingredients(recipes):
+    """Map the api_id of each json recipe to the vocabulary names of its extendedIngredients"""
+    ingredients = {}
+    for recipe in recipes:
+        names = {ingredient_index.canonical_name(ingredient['name'])
+                 for ingredient in recipe.get('extendedIngredients') or [] if ingredient.get('name')}
+        if names:
+            ingredients[recipe['id']] = sorted(names)
+
+    return ingredients
+
+
+def store_ingredients(ingredients):
+    """Replace the stored ingredients of recipes already upserted, given {api_id: names}"""
+    if not ingredients:
+        return
+
+    table = RecipeIngredient.__table__
+    db.session.execute(table.delete().where(table.c.recipe_api_id.in_(list(ingredients))))
+    db.session.execute(table.insert(), [{"recipe_api_id": api_id, "ingredient": name}
+                                        for api_id, names in ingredients.items() for name in names])
+    db.session.commit()
+
+
+def save_ingredients(recipes):
+    """Store the ingredients of json recipes already upserted, and index them for local matching"""
+    ingredients = json_to_ingredients(recipes)
+    store_ingredients(ingredients)
+
+    for recipe in json_to_recipe(recipes):
+        if recipe['api_id'] in ingredients:
+            recipe_matcher.add(recipe['api_id'], recipe['name'], recipe['image_url'], ingredients[recipe['api_id']])
+
+
+def stale_fields(recipe, fresh_for=DEFAULT_FRESH_FOR, now=None):
+    """Return the fields of a Recipe last refreshed more than fresh_for seconds ago"""
+    oldest = (now if now is not None else time.time()) - fresh_for
+    refreshed_at = recipe.refreshed_at or {}
+    return [field for field in REFRESHED_FIELDS if refreshed_at.get(field, 0) < oldest]
+
+
+class RecipeRefresher:
+    """Refresh stale recipes from the API on a background thread, so no request waits on it"""
+
+    def __init__(self, fresh_for=DEFAULT_FRESH_FOR, workers=1):
+        self.fresh_for = fresh_for
+        self.workers = workers
+        self.app = None
+        self.refreshed = 0
+        self.failed = 0
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Configure the refresher from the Flask app config"""
+        self.app = app
+        self.fresh_for = float(app.config.get('RECIPE_FRESH_FOR', DEFAULT_FRESH_FOR))
+        self.workers = int(app.config.get('RECIPE_REFRESH_WORKERS', 1))
+
+    def is_stale(self, recipe):
+        return bool(stale_fields(recipe, self.fresh_for))
+
+    def refresh_later(self, api_ids):
+        """Queue recipes for a refresh, skipping those already queued"""
+        if not self.workers or self.app is None:
+            return
+
+        with self._lock:
+            api_ids = [api_id for api_id in api_ids if api_id not in self._pending]
+            if not api_ids:
+                return
+            self._pending.update(api_ids)
+
+            #created on first use, so every gunicorn worker gets its own threads after fork
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='recipe-refresh')
+
+        self._executor.submit(self.refresh, api_ids)
+
+    def refresh(self, api_ids):
+        """Fetch recipes from the API with background priority and save them"""
+        try:
+            with self.app.app_context():
+                for i in range(0, len(api_ids), MAX_BULK_IDS):
+                    ids = ",".join(str(api_id) for api_id in sorted(api_ids[i:i + MAX_BULK_IDS]))
+                    data = spoonacular.get('recipes/informationBulk', {'ids': ids}, priority=BACKGROUND)
+                    upsert_recipes(json_to_recipe(data))
+                    save_ingredients(data)
+
+            self.refreshed += len(api_ids)
+        except Exception:
+            #the stale copy is still good, so try again the next time it is served
+            self.failed += 1
+            self.app.logger.exception("Could not refresh recipes %s", api_ids)
+        finally:
+            with self._lock:
+                self._pending.difference_update(api_ids)
+
+
+recipe_refresher = RecipeRefresher()
+
+
+@register_collector
+def catalog_samples():
+    return [
+        ('recipe_refreshes_total', 'counter', "Stale recipes refreshed in the background", recipe_refresher.refreshed),
+        ('recipe_refresh_failures_total', 'counter', "Background recipe refreshes that failed", recipe_refresher.failed),
+        ('recipe_matcher_recipes', 'gauge', "Recipes in the local ingredient matcher", len(recipe_matcher)),
+    ]
+
+
+def connect_catalog(app):
+    """Let the catalog refresh recipes in the background for the Flask app"""
+
+    recipe_refresher.init_app(app)
+
+
+def get_recipes(api_ids):
+    """Return Recipes for a list of api_ids in the same order.
+
+    Recipes already in the DB cost no API call; the rest are fetched with one
+    informationBulk request and saved in one batch. Ids the API doesn't know are left out.
+    """
+    api_ids = list(dict.fromkeys(int(api_id) for api_id in api_ids))
+    if not api_ids:
+        return []
+
+    found = {recipe.api_id: recipe for recipe in Recipe.query.filter(Recipe.api_id.in_(api_ids)).all()}
+    missing = [api_id for api_id in api_ids if api_id not in found]
+
+    #serve what we have straight away, and bring old copies up to date afterwards
+    recipe_refresher.refresh_later([api_id for api_id, recipe in found.items() if recipe_refresher.is_stale(recipe)])
+
+    for i in range(0, len(missing), MAX_BULK_IDS):
+        end_transaction()
+        batch = missing[i:i + MAX_BULK_IDS]
+        ids = ",".join(str(api_id) for api_id in sorted(batch))
+        data = spoonacular.get('recipes/informationBulk', {'ids': ids})
+        upsert_recipes(json_to_recipe(data))
+        save_ingredients(data)
+
+    if missing:
+        #saving commits and expires what was loaded, so reload every row at once rather than one at a time
+        found = {recipe.api_id: recipe for recipe in Recipe.query.filter(Recipe.api_id.in_(api_ids)).all()}
+
+    return [found[api_id] for api_id in api_ids if api_id in found]
+
+
+def get_recipe(api_id):
+    """Return the Recipe for an api_id, fetching and saving it from the API if needed"""
+    recipe = Recipe.query.filter(Recipe.api_id == api_id).first()
+
+    if recipe is not None and recipe_refresher.is_stale(recipe):
+        recipe_refresher.refresh_later([recipe.api_id])
+
+    if recipe is None:
+        end_transaction()
+        recipe_info = spoonacular.get(f'recipes/{api_id}/information')
+        upsert_recipes(json_to_recipe([recipe_info]))
+        save_ingredients([recipe_info])
+        recipe = Recipe.query.filter(Recipe.api_id == api_id).first()
+
+    return recipe
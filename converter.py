@@ -0,0 +1,238 @@
+"""Local measurement converter, falling back to the Spoonacular API for unknown ingredients"""
+
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, IngredientDensity, end_transaction
+from upstream import spoonacular
+from ingredients import normalize_ingredient, load_ingredient_names
+
+#Every unit maps to its dimension and its size in that dimension's base unit (ml or g)
+UNITS = {
+    "ml": ("volume", 1.0),
+    "l": ("volume", 1000.0),
+    "tsp": ("volume", 4.92892159375),
+    "tbsp": ("volume", 14.78676478125),
+    "fl oz": ("volume", 29.5735295625),
+    "cup": ("volume", 236.5882365),
+    "pint": ("volume", 473.176473),
+    "quart": ("volume", 946.352946),
+    "gallon": ("volume", 3785.411784),
+    "mg": ("mass", 0.001),
+    "g": ("mass", 1.0),
+    "kg": ("mass", 1000.0),
+    "oz": ("mass", 28.349523125),
+    "lb": ("mass", 453.59237),
+}
+
+#Spellings used by the converter page and the API, mapped to the names above
+UNIT_ALIASES = {
+    "milliliter": "ml", "milliliters": "ml", "millilitre": "ml", "millilitres": "ml",
+    "liter": "l", "liters": "l", "litre": "l", "litres": "l",
+    "teaspoon": "tsp", "teaspoons": "tsp",
+    "tablespoon": "tbsp", "tablespoons": "tbsp", "tbs": "tbsp", "tbl": "tbsp",
+    "fluid ounce": "fl oz", "fluid ounces": "fl oz", "floz": "fl oz",
+    "cups": "cup",
+    "pints": "pint", "pt": "pint",
+    "quarts": "quart", "qt": "quart",
+    "gallons": "gallon", "gal": "gallon",
+    "milligram": "mg", "milligrams": "mg",
+    "gram": "g", "grams": "g",
+    "kilogram": "kg", "kilograms": "kg",
+    "ounce": "oz", "ounces": "oz",
+    "pound": "lb", "pounds": "lb", "lbs": "lb",
+}
+
+#Single letters whose case is their meaning ("T" is a tablespoon, "t" a teaspoon), looked up before lowercasing
+CASED_UNIT_ALIASES = {"t": "tsp", "T": "tbsp", "c": "cup", "C": "cup"}
+
+#Grams per milliliter for common ingredients; names match static/ingredients.txt
+SEED_DENSITIES = {
+    "water": 1.0,
+    "milk": 1.03,
+    "buttermilk": 1.03,
+    "flour": 0.53,
+    "bread flour": 0.54,
+    "whole wheat flour": 0.51,
+    "almond flour": 0.41,
+    "coconut flour": 0.47,
+    "sugar": 0.85,
+    "brown sugar": 0.93,
+    "powdered sugar": 0.51,
+    "butter": 0.96,
+    "salted butter": 0.96,
+    "unsalted butter": 0.96,
+    "olive oil": 0.91,
+    "vegetable oil": 0.92,
+    "coconut oil": 0.92,
+    "maple syrup": 1.32,
+    "molasses": 1.4,
+    "salt": 1.22,
+    "cocoa powder": 0.42,
+    "cornstarch": 0.54,
+    "cornmeal": 0.58,
+    "baking soda": 1.22,
+    "baking powder": 0.81,
+    "rice": 0.85,
+    "brown rice": 0.8,
+    "oats": 0.38,
+    "quinoa": 0.72,
+    "peanut butter": 1.09,
+    "sour cream": 1.02,
+    "yogurt": 1.03,
+    "cream cheese": 0.98,
+    "mayonnaise": 0.93,
+    "ketchup": 1.15,
+    "soy sauce": 1.15,
+    "vinegar": 1.01,
+    "raisins": 0.63,
+    "walnuts": 0.49,
+    "almonds": 0.6,
+    "shredded cheese": 0.47,
+}
+
+
+class UnknownConversion(Exception):
+    """The converter can't answer this conversion locally"""
+
+
+def normalize_unit(unit):
+    """Return the converter's name for a unit, or None if it is unknown"""
+    unit = " ".join(str(unit).replace('.', '').split())
+    if unit in CASED_UNIT_ALIASES:
+        return CASED_UNIT_ALIASES[unit]
+
+    unit = unit.lower()
+    unit = UNIT_ALIASES.get(unit, unit)
+    return unit if unit in UNITS else None
+
+
+def seed_densities(names=None):
+    """Return the seed densities for ingredients that are in the vocabulary"""
+    names = names if names is not None else load_ingredient_names()
+    return {name: density for name, density in SEED_DENSITIES.items() if name in names}
+
+
+class UnitConverter:
+    """Convert amounts through the unit table, using ingredient densities between volume and mass"""
+
+    def __init__(self, densities=None):
+        self.densities = dict(densities or {})
+
+    def density_for(self, ingredient):
+        """Return grams per ml for an ingredient, trying its singular form too"""
+        name = normalize_ingredient(ingredient)
+
+        if name in self.densities:
+            return self.densities[name]
+        if name.endswith('s') and name[:-1] in self.densities:
+            return self.densities[name[:-1]]
+
+        return None
+
+    def convert(self, amount, source_unit, target_unit, ingredient=None):
+        """Convert amount from source_unit to target_unit, raising UnknownConversion if it can't"""
+        source = normalize_unit(source_unit)
+        target = normalize_unit(target_unit)
+
+        if source is None or target is None:
+            raise UnknownConversion(f"Unknown unit: {source_unit if source is None else target_unit}")
+
+        source_dimension, source_size = UNITS[source]
+        target_dimension, target_size = UNITS[target]
+        base_amount = amount * source_size
+
+        if source_dimension != target_dimension:
+            density = self.density_for(ingredient) if ingredient else None
+            if density is None:
+                raise UnknownConversion(f"No density known for {ingredient}")
+
+            base_amount = base_amount * density if source_dimension == "volume" else base_amount / density
+
+        return base_amount / target_size
+
+    def learn(self, ingredient, amount, source_unit, target_amount, target_unit):
+        """Work out an ingredient's density from a volume/mass answer. Returns it, or None"""
+        source = normalize_unit(source_unit)
+        target = normalize_unit(target_unit)
+
+        if source is None or target is None or not amount or not target_amount:
+            return None
+
+        source_dimension, source_size = UNITS[source]
+        target_dimension, target_size = UNITS[target]
+
+        if source_dimension == target_dimension:
+            return None
+
+        if source_dimension == "volume":
+            density = (target_amount * target_size) / (amount * source_size)
+        else:
+            density = (amount * source_size) / (target_amount * target_size)
+
+        self.densities[normalize_ingredient(ingredient)] = density
+        return density
+
+
+local_converter = UnitConverter(seed_densities())
+
+
+def conversion_response(ingredient, amount, source_unit, target_amount, target_unit):
+    """Format an answer like the API's /recipes/convert response"""
+    target_amount = round(target_amount, 2)
+    return {
+        "sourceAmount": amount,
+        "sourceUnit": source_unit,
+        "targetAmount": target_amount,
+        "targetUnit": target_unit,
+        "answer": f"{amount:g} {source_unit} {ingredient} translates to {target_amount:g} {target_unit}.",
+        "type": "CONVERSION",
+    }
+
+
+def learned_density(name):
+    """Return the IngredientDensity stored for an ingredient or its singular form, or None"""
+    names = [name, name[:-1]] if name.endswith('s') else [name]
+    rows = {row.name: row for row in IngredientDensity.query.filter(IngredientDensity.name.in_(names)).all()}
+
+    return next((rows[candidate] for candidate in names if candidate in rows), None)
+
+
+def save_density(name, grams_per_ml):
+    """Store a learned density so every worker can use it"""
+    stmt = insert(IngredientDensity.__table__).values(name=name, grams_per_ml=grams_per_ml)
+    stmt = stmt.on_conflict_do_update(index_elements=['name'], set_={"grams_per_ml": stmt.excluded.grams_per_ml})
+    db.session.execute(stmt)
+    db.session.commit()
+
+
+def convert(ingredient, amount, source_unit, target_unit, converter=local_converter):
+    """Convert locally when possible, otherwise ask the API and keep its answer as a new density"""
+    name = normalize_ingredient(ingredient)
+
+    try:
+        target_amount = converter.convert(amount, source_unit, target_unit, name)
+        return conversion_response(ingredient, amount, source_unit, target_amount, target_unit)
+    except UnknownConversion:
+        pass
+
+    #another worker may have learned this ingredient already; a density is no help with a unit we don't know
+    units_known = normalize_unit(source_unit) is not None and normalize_unit(target_unit) is not None
+    learned = learned_density(name) if name and units_known else None
+    if learned is not None:
+        converter.densities[learned.name] = learned.grams_per_ml
+        try:
+            target_amount = converter.convert(amount, source_unit, target_unit, name)
+            return conversion_response(ingredient, amount, source_unit, target_amount, target_unit)
+        except UnknownConversion:
+            pass
+
+    payload = {"ingredientName": ingredient, "sourceAmount": amount, "sourceUnit": source_unit, "targetUnit": target_unit}
+    end_transaction()
+    data = spoonacular.get('recipes/convert', payload)
+
+    if name and 'targetAmount' in data:
+        density = converter.learn(name, amount, source_unit, data['targetAmount'], target_unit)
+        if density is not None:
+            save_density(name, density)
+
+    return data
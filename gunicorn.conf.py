@@ -0,0 +1,46 @@
+"""gunicorn settings, see the Procfile.
+
+The app runs on gevent workers by default: requests, urllib3 and (through
+psycogreen) psycopg2 all yield while waiting on the network, so one worker
+process serves many requests that are waiting on Spoonacular at once. Set
+GUNICORN_WORKER_CLASS=sync to go back to one request per worker.
+"""
+
+import os
+import shutil
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+
+#greenlets per gevent worker, i.e. the requests one worker will have in flight
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 500))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+
+#the database allows DB_MAX_CONNECTIONS in all, shared out between the workers. Requests only hold
+#one while they query, never while they wait on the API, so a few serve all of a worker's greenlets
+db_connections = max(2, int(os.environ.get('DB_MAX_CONNECTIONS', 20)) // workers)
+os.environ.setdefault('DB_POOL_SIZE', str(db_connections // 2))
+os.environ.setdefault('DB_MAX_OVERFLOW', str(db_connections - db_connections // 2))
+
+if worker_class == 'gevent':
+    #let as many upstream calls as greenlets reuse a pooled keep-alive connection
+    os.environ.setdefault('UPSTREAM_POOL_SIZE', str(min(worker_connections, 100)))
+    #hash passwords on native threads; a process pool doesn't mix with gevent's hub
+    os.environ.setdefault('PASSWORD_HASH_POOL', 'gevent')
+
+
+#every worker saves its metrics here, and /metrics adds them up
+os.environ.setdefault('METRICS_DIR', '/tmp/usemyfood-metrics')
+
+
+def on_starting(server):
+    """Start the metrics from zero on every deploy"""
+    shutil.rmtree(os.environ['METRICS_DIR'], ignore_errors=True)
+
+
+def post_fork(server, worker):
+    """Make psycopg2 wait for the database cooperatively instead of blocking the whole worker"""
+    if worker_class == 'gevent':
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
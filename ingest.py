@@ -0,0 +1,179 @@
+"""Bulk load recipe dumps into the recipes table without going through the web app.
+
+Each line of a dump is one recipe, or a list of recipes, as returned by the
+informationBulk endpoint. To load one:
+
+    python ingest.py recipes.jsonl
+
+The position reached is saved to recipes.jsonl.checkpoint after every batch, so
+running the same command again after an interruption picks up where it stopped.
+Use --restart to load the whole file again.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+from catalog import json_to_recipe, json_to_ingredients, upsert_recipes, store_ingredients
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def validate_recipe(record):
+    """Return why a json recipe can't be loaded, or None if it is fine"""
+    if not isinstance(record, dict):
+        return "not an object"
+    if not isinstance(record.get('id'), int) or isinstance(record.get('id'), bool) or record['id'] <= 0:
+        return "bad id"
+    if not isinstance(record.get('title'), str) or not record['title'].strip():
+        return "missing title"
+    if not (record.get('sourceUrl') or record.get('spoonacularSourceUrl')):
+        return "missing sourceUrl"
+    for field in ('sourceUrl', 'spoonacularSourceUrl', 'image'):
+        if not isinstance(record.get(field), (str, type(None))):
+            return f"bad {field}"
+    #one bad value in a batch fails the whole insert, so check every field that gets stored
+    for field in ('vegetarian', 'vegan'):
+        if not isinstance(record.get(field), (bool, type(None))):
+            return f"bad {field}"
+
+    ingredients = record.get('extendedIngredients') or []
+    if not isinstance(ingredients, list):
+        return "bad extendedIngredients"
+    if not all(isinstance(ingredient, dict) and isinstance(ingredient.get('name'), str) for ingredient in ingredients):
+        return "bad extendedIngredients"
+
+    return None
+
+
+def open_dump(path):
+    """Open a dump for reading bytes, so positions in it can be saved and sought back to"""
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+
+def read_records(f):
+    """Yield (position after the line, recipe or None, why it was rejected) for each recipe in a dump"""
+    while True:
+        line = f.readline()
+        if not line:
+            return
+
+        position = f.tell()
+        if not line.strip():
+            continue
+
+        try:
+            data = json.loads(line)
+        except ValueError:
+            yield position, None, "invalid json"
+            continue
+
+        for record in data if isinstance(data, list) else [data]:
+            error = validate_recipe(record)
+            yield position, (None if error else record), error
+
+
+def load_checkpoint(path):
+    """Return the saved progress of an earlier run, or a fresh start"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"position": 0, "ingested": 0, "rejected": 0}
+
+
+def save_checkpoint(path, checkpoint):
+    """Write the checkpoint next to the old one first, so a crash never leaves half a file"""
+    with open(path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(path + '.tmp', path)
+
+
+def store_batch(recipes):
+    """Upsert a batch of json recipes and their ingredients"""
+    upsert_recipes(json_to_recipe(recipes))
+    store_ingredients(json_to_ingredients(recipes))
+
+
+class IngestReport:
+    """Keep count of the recipes loaded and rejected, and how fast"""
+
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        self.started = time.time()
+        self.ingested = 0
+        self.rejected = Counter()
+
+    @property
+    def rate(self):
+        elapsed = time.time() - self.started
+        return self.ingested / elapsed if elapsed > 0 else 0.0
+
+    def batch(self, checkpoint):
+        print(f"{checkpoint['ingested']} recipes loaded, {checkpoint['rejected']} rejected, "
+              f"{self.rate:.0f} recipes/s", file=self.out)
+
+    def summary(self):
+        elapsed = time.time() - self.started
+        print(f"loaded {self.ingested} recipes in {elapsed:.1f}s ({self.rate:.0f} recipes/s)", file=self.out)
+        for reason, count in self.rejected.most_common():
+            print(f"  rejected {count}: {reason}", file=self.out)
+
+
+def ingest(path, batch_size=DEFAULT_BATCH_SIZE, checkpoint_path=None, restart=False, store=store_batch, report=None):
+    """Load a dump in batches, checkpointing after each. Returns the final checkpoint"""
+    checkpoint_path = checkpoint_path or path + '.checkpoint'
+    checkpoint = {"position": 0, "ingested": 0, "rejected": 0} if restart else load_checkpoint(checkpoint_path)
+    report = report or IngestReport()
+
+    def flush(batch, position):
+        if batch:
+            store(batch)
+            checkpoint["ingested"] += len(batch)
+            report.ingested += len(batch)
+        checkpoint["position"] = position
+        save_checkpoint(checkpoint_path, checkpoint)
+        report.batch(checkpoint)
+
+    with open_dump(path) as f:
+        f.seek(checkpoint["position"])
+        batch = []
+        position = checkpoint["position"]
+
+        for line_end, record, error in read_records(f):
+            #only checkpoint on line boundaries, so a list of recipes is never split
+            if len(batch) >= batch_size and line_end != position:
+                flush(batch, position)
+                batch = []
+
+            position = line_end
+            if error:
+                checkpoint["rejected"] += 1
+                report.rejected[error] += 1
+            else:
+                batch.append(record)
+
+        flush(batch, position)
+
+    report.summary()
+    return checkpoint
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bulk load informationBulk style recipe dumps")
+    parser.add_argument('path', help="JSONL dump, optionally gzipped")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="recipes per transaction")
+    parser.add_argument('--checkpoint', help="checkpoint file (default: PATH.checkpoint)")
+    parser.add_argument('--restart', action='store_true', help="ignore the checkpoint and load the whole file")
+    args = parser.parse_args()
+
+    from app import app
+
+    #send the ingredient rows as one multi-row INSERT per page instead of one per row
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(app.config['SQLALCHEMY_ENGINE_OPTIONS'], executemany_mode='values')
+
+    ingest(args.path, args.batch_size, args.checkpoint, args.restart)
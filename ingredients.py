@@ -0,0 +1,258 @@
+"""Ingredient vocabulary from static/ingredients.txt, used for autocomplete"""
+
+import os
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+from metrics import register_collector
+
+INGREDIENTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'ingredients.txt')
+
+#Other names for vocabulary ingredients; entries whose target isn't in the vocabulary are ignored
+SYNONYMS = {
+    "scallions": "green onions",
+    "spring onions": "green onions",
+    "aubergine": "eggplant",
+    "confectioners sugar": "powdered sugar",
+    "icing sugar": "powdered sugar",
+    "bicarbonate of soda": "baking soda",
+    "heavy cream": "whipping cream",
+    "heavy whipping cream": "whipping cream",
+    "all purpose flour": "flour",
+    "plain flour": "flour",
+    "rocket": "arugula",
+    "corn starch": "cornstarch",
+    "cornflour": "cornstarch",
+    "string beans": "green beans",
+    "beetroot": "beets",
+    "capsicum": "bell pepper",
+    "minced beef": "ground beef",
+    "garlic cloves": "garlic",
+}
+
+#The most canonical search keys whose raw spellings are tracked
+MAX_TRACKED_KEYS = 10000
+
+
+def normalize_ingredient(name):
+    """Lowercase and tidy an ingredient name so it can be looked up"""
+    return " ".join(str(name).lower().split())
+
+
+def load_ingredient_names(path=INGREDIENTS_FILE):
+    """Read the ingredient vocabulary in static/ingredients.txt"""
+    with open(path) as f:
+        return {normalize_ingredient(line) for line in f if line.strip()}
+
+
+def word_forms(name):
+    """Return name and its likely singular and plural spellings, name first"""
+    forms = [name]
+
+    if name.endswith('ies'):
+        forms.append(name[:-3] + 'y')
+    elif name.endswith('es'):
+        forms += [name[:-2], name[:-1]]
+    elif name.endswith('s'):
+        forms.append(name[:-1])
+    elif name.endswith('y'):
+        forms += [name[:-1] + 'ies', name + 's']
+    else:
+        forms += [name + 's', name + 'es']
+
+    return forms
+
+
+class CanonicalizationStats:
+    """Count how many different raw searches collapse into each canonical search"""
+
+    def __init__(self, max_keys=MAX_TRACKED_KEYS):
+        self.max_keys = max_keys
+        self.searches = 0
+        self.raw_keys = {}
+        self._lock = threading.Lock()
+
+    def record(self, raw, canonical):
+        with self._lock:
+            self.searches += 1
+            spellings = self.raw_keys.get(canonical)
+
+            if spellings is None:
+                if len(self.raw_keys) >= self.max_keys:
+                    return
+                spellings = self.raw_keys[canonical] = set()
+
+            spellings.add(raw)
+
+    @property
+    def distinct_raw(self):
+        return sum(len(spellings) for spellings in self.raw_keys.values())
+
+    @property
+    def distinct_canonical(self):
+        return len(self.raw_keys)
+
+    def summary(self):
+        """Return the counts, and how many raw keys each canonical key stands for on average"""
+        with self._lock:
+            distinct_raw = self.distinct_raw
+            distinct_canonical = self.distinct_canonical
+
+        return {
+            "searches": self.searches,
+            "distinct_raw_keys": distinct_raw,
+            "distinct_canonical_keys": distinct_canonical,
+            "collapse_ratio": distinct_raw / distinct_canonical if distinct_canonical else 1.0,
+        }
+
+
+def bounded_prefix_distance(query, name, bound):
+    """Fewest edits turning query into the start of name, or bound + 1 once it is known to exceed bound"""
+    name = name[:len(query) + bound]
+
+    previous = list(range(len(name) + 1))
+    for i, char_q in enumerate(query, 1):
+        current = [i]
+        for j, char_n in enumerate(name, 1):
+            current.append(min(previous[j] + 1,
+                               current[j - 1] + 1,
+                               previous[j - 1] + (char_q != char_n)))
+        if min(current) > bound:
+            return bound + 1
+        previous = current
+
+    #the rest of the name is free, it just hasn't been typed yet
+    return min(min(previous), bound + 1)
+
+
+class IngredientIndex:
+    """Prefix and typo tolerant lookup over the ingredient vocabulary, ranked by popularity"""
+
+    def __init__(self, names):
+        self.names = sorted({normalize_ingredient(name) for name in names if name.strip()})
+        self.vocabulary = set(self.names)
+
+        #(word, name) for every word of every name, so "pepper" finds "bell pepper" too
+        self.words = sorted((word, name) for name in self.names for word in name.split())
+
+        self.synonyms = {normalize_ingredient(name): target for name, target in SYNONYMS.items() if target in self.vocabulary}
+
+        self.popularity = Counter()
+        self.stats = CanonicalizationStats()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path=INGREDIENTS_FILE):
+        return cls(load_ingredient_names(path))
+
+    def record(self, names):
+        """Count searches for vocabulary ingredients so popular ones are suggested first"""
+        with self._lock:
+            for name in names:
+                name = normalize_ingredient(name)
+                if name in self.vocabulary:
+                    self.popularity[name] += 1
+
+    def canonical_name(self, name):
+        """Map one ingredient to its vocabulary spelling, or its tidied form if it isn't known"""
+        name = normalize_ingredient(name)
+
+        if name in self.synonyms:
+            return self.synonyms[name]
+
+        #try other forms of the last word, so "tomato" finds "tomatoes" and "bell peppers" finds "bell pepper"
+        head, _, last = name.rpartition(' ')
+        for form in word_forms(last):
+            candidate = f"{head} {form}" if head else form
+            if candidate in self.vocabulary:
+                return candidate
+            if candidate in self.synonyms:
+                return self.synonyms[candidate]
+
+        return name
+
+    def canonicalize(self, ing_str):
+        """Turn a comma separated ingredient string into a canonical, deduplicated, sorted one.
+
+        "Tomato, onion" and "onions,+tomatoes " both become "onion,tomatoes".
+        """
+        names = set()
+        for name in str(ing_str).replace('+', ',').split(','):
+            if name.strip():
+                names.add(self.canonical_name(name))
+
+        canonical = ",".join(sorted(names))
+        self.stats.record(ing_str, canonical)
+        return canonical
+
+    def _rank(self, name):
+        return (-self.popularity[name], len(name), name)
+
+    def prefix_matches(self, prefix):
+        """Return every name with a word starting with prefix"""
+        matches = set()
+
+        for i in range(bisect_left(self.words, (prefix,)), len(self.words)):
+            word, name = self.words[i]
+            if not word.startswith(prefix):
+                break
+            matches.add(name)
+
+        #multi word prefixes such as "bell pe" only match from the start of a name
+        for i in range(bisect_left(self.names, prefix), len(self.names)):
+            if not self.names[i].startswith(prefix):
+                break
+            matches.add(self.names[i])
+
+        return matches
+
+    def fuzzy_matches(self, query, max_distance):
+        """Return {name: distance} for names whose start is within max_distance edits of query.
+
+        Typos in the first letter are rare, so only names sharing it are compared.
+        """
+        matches = {}
+        first = query[0]
+
+        for i in range(bisect_left(self.names, first), len(self.names)):
+            name = self.names[i]
+            if not name.startswith(first):
+                break
+
+            distance = bounded_prefix_distance(query, name, max_distance)
+            if distance <= max_distance:
+                matches[name] = distance
+
+        return matches
+
+    def suggest(self, query, limit=10):
+        """Suggest up to limit ingredient names for what has been typed so far"""
+        query = normalize_ingredient(query)
+        if not query:
+            return []
+
+        suggestions = sorted(self.prefix_matches(query), key=self._rank)[:limit]
+
+        #fill up with near misses, allowing one typo per four characters typed
+        if len(suggestions) < limit and len(query) >= 3:
+            fuzzy = self.fuzzy_matches(query, max(1, len(query) // 4))
+            ranked = sorted((name for name in fuzzy if name not in suggestions),
+                            key=lambda name: (fuzzy[name],) + self._rank(name))
+            suggestions += ranked[:limit - len(suggestions)]
+
+        return suggestions
+
+
+ingredient_index = IngredientIndex.from_file()
+
+
+@register_collector
+def canonicalization_samples():
+    """How many different ingredient searches collapse into each cache key"""
+    summary = ingredient_index.stats.summary()
+    return [
+        ('ingredient_searches_total', 'counter', "Ingredient searches canonicalized", summary['searches']),
+        ('ingredient_search_raw_keys', 'gauge', "Distinct ingredient strings searched for", summary['distinct_raw_keys']),
+        ('ingredient_search_canonical_keys', 'gauge', "Distinct canonical ingredient searches", summary['distinct_canonical_keys']),
+    ]
@@ -0,0 +1,199 @@
+"""Local recipe-by-ingredients matching over the recipes already in the catalog"""
+
+import heapq
+import math
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter
+
+from models import db, Recipe, RecipeIngredient
+
+#How often (in seconds) a worker reloads the index to pick up recipes other workers saved
+DEFAULT_REFRESH_INTERVAL = 5 * 60
+
+#Rows loaded between pauses that let other greenlets run
+LOAD_YIELD_EVERY = 10000
+
+#Share of the searched ingredients each local result must use before the API is skipped
+DEFAULT_MIN_COVERAGE = 0.5
+
+
+class RecipeMatcher:
+    """Inverted index from ingredient to recipes, answering findByIngredients style searches.
+
+    Every ingredient has a sorted list of the api_ids of the recipes using it.
+    A search counts hits per recipe over the lists of the searched ingredients
+    only, so it costs as much as those lists are long, whatever the catalog size.
+    """
+
+    def __init__(self, refresh_interval=DEFAULT_REFRESH_INTERVAL, min_coverage=DEFAULT_MIN_COVERAGE):
+        self.refresh_interval = refresh_interval
+        self.min_coverage = min_coverage
+        self.app = None
+        self.loaded_at = None
+        self._recipes = {}
+        self._postings = {}
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Configure the matcher from the Flask app config"""
+        config = app.config
+
+        self.app = app
+        self.refresh_interval = float(config.get('LOCAL_MATCH_REFRESH', DEFAULT_REFRESH_INTERVAL))
+        self.min_coverage = float(config.get('LOCAL_MATCH_MIN_COVERAGE', DEFAULT_MIN_COVERAGE))
+
+    def __len__(self):
+        return len(self._recipes)
+
+    def add(self, api_id, title, image, ingredients):
+        """Index a recipe, replacing whatever was indexed for it before"""
+        ingredients = tuple(sorted(set(ingredients)))
+
+        with self._lock:
+            old = self._recipes.get(api_id)
+            if old is not None:
+                for name in old[3]:
+                    postings = self._postings[name]
+                    del postings[bisect_left(postings, api_id)]
+
+            self._recipes[api_id] = (api_id, title, image, ingredients)
+            for name in ingredients:
+                insort(self._postings.setdefault(name, []), api_id)
+
+    def load(self, rows):
+        """Rebuild the index from (api_id, title, image, ingredient) rows"""
+        ingredients = {}
+        for count, (api_id, title, image, ingredient) in enumerate(rows, 1):
+            ingredients.setdefault((api_id, title, image), set()).add(ingredient)
+
+            #let other greenlets run while a big catalog loads
+            if count % LOAD_YIELD_EVERY == 0:
+                time.sleep(0)
+
+        recipes = {}
+        postings = {}
+        for count, ((api_id, title, image), names) in enumerate(ingredients.items(), 1):
+            names = tuple(sorted(names))
+            recipes[api_id] = (api_id, title, image, names)
+            for name in names:
+                postings.setdefault(name, []).append(api_id)
+
+            if count % LOAD_YIELD_EVERY == 0:
+                time.sleep(0)
+
+        for api_ids in postings.values():
+            api_ids.sort()
+
+        with self._lock:
+            self._recipes, self._postings = recipes, postings
+            self.loaded_at = time.time()
+
+    def refresh(self):
+        """Reload the index from the recipe_ingredients table"""
+        rows = (db.session.query(Recipe.api_id, Recipe.name, Recipe.image_url, RecipeIngredient.ingredient)
+                .join(RecipeIngredient, RecipeIngredient.recipe_api_id == Recipe.api_id)
+                .yield_per(LOAD_YIELD_EVERY))
+        self.load(rows)
+
+    def _refresh_in_background(self):
+        try:
+            with self.app.app_context():
+                self.refresh()
+        except Exception:
+            self.app.logger.exception("Could not reload the recipe matcher")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def ensure_fresh(self):
+        """Start a reload on a background thread when the index is due one; searches keep using the old index"""
+        if self.app is None:
+            return
+        if self.loaded_at is not None and time.time() - self.loaded_at <= self.refresh_interval:
+            return
+
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        threading.Thread(target=self._refresh_in_background, name='recipe-matcher-load', daemon=True).start()
+
+    def match(self, ingredients, number=10, ranking=1):
+        """Return the best number recipes for the ingredients, shaped like a findByIngredients response.
+
+        ranking 1 puts the most used ingredients first, ranking 2 the fewest missing ones, as upstream does.
+        """
+        ingredients = list(dict.fromkeys(ingredients))
+
+        with self._lock:
+            postings = [self._postings.get(name, ()) for name in ingredients]
+            recipes = self._recipes
+
+        #Counter.update walks each posting list in C
+        hits = Counter()
+        for api_ids in postings:
+            hits.update(api_ids)
+
+        if ranking == 1:
+            #group by ingredients used, so only the groups that can make the cut get sorted
+            by_used = {}
+            for api_id, used in hits.items():
+                by_used.setdefault(used, []).append(api_id)
+
+            best = []
+            for used in sorted(by_used, reverse=True):
+                wanted = number - len(best)
+                if wanted <= 0:
+                    break
+                best.extend(heapq.nsmallest(wanted, by_used[used], key=lambda api_id: (len(recipes[api_id][3]), api_id)))
+        else:
+            best = heapq.nsmallest(number, hits, key=lambda api_id: (len(recipes[api_id][3]) - hits[api_id], -hits[api_id], api_id))
+
+        return [self._to_json(recipes[api_id], ingredients) for api_id in best]
+
+    @staticmethod
+    def _to_json(recipe, ingredients):
+        api_id, title, image, recipe_ingredients = recipe
+        used = [name for name in ingredients if name in recipe_ingredients]
+        missed = [name for name in recipe_ingredients if name not in used]
+
+        return {
+            "id": api_id,
+            "title": title,
+            "image": image,
+            "usedIngredientCount": len(used),
+            "missedIngredientCount": len(missed),
+            "usedIngredients": [{"name": name} for name in used],
+            "missedIngredients": [{"name": name} for name in missed],
+            "unusedIngredients": [{"name": name} for name in ingredients if name not in used],
+            "likes": 0,
+        }
+
+    def find(self, ingredients, number=10, ranking=1):
+        """Answer a search locally, or return None when the catalog doesn't cover it well enough"""
+        self.ensure_fresh()
+
+        ingredients = list(dict.fromkeys(ingredients))
+        if not ingredients:
+            return None
+
+        matches = self.match(ingredients, number, ranking)
+        needed = math.ceil(self.min_coverage * len(ingredients))
+
+        if len(matches) < number or any(match["usedIngredientCount"] < needed for match in matches):
+            return None
+
+        return matches
+
+
+recipe_matcher = RecipeMatcher()
+
+
+def connect_matcher(app):
+    """Configure the shared recipe matcher from the Flask app"""
+
+    recipe_matcher.init_app(app)
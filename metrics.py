@@ -0,0 +1,322 @@
+"""Lightweight production instrumentation, served in Prometheus text format from /metrics.
+
+Each gunicorn worker keeps its own metrics. With METRICS_DIR set, workers save
+a snapshot there every METRICS_FLUSH_INTERVAL seconds, and /metrics adds up
+the snapshots of every worker.
+"""
+
+import glob
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request, abort, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+#Statements slower than this many milliseconds are logged with their endpoint
+DEFAULT_SLOW_QUERY_MS = 100
+
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, float('inf'))
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+
+
+class Counter:
+    """A count that only goes up, kept per combination of label values"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+
+class Histogram:
+    """Bucketed observations per combination of label values, as [count per bucket..., sum]"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets, labels=()):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labels = labels
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            counts = self.values.get(label_values)
+            if counts is None:
+                counts = self.values[label_values] = [0] * len(self.buckets) + [0.0]
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-1] += value
+
+
+REGISTRY = []
+
+#functions returning (name, kind, help, value) samples read from other objects when metrics are collected
+COLLECTORS = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+def register_collector(collector):
+    COLLECTORS.append(collector)
+    return collector
+
+
+sql_queries = register(Histogram('db_queries_per_request', "SQL statements run per request",
+                                 QUERY_COUNT_BUCKETS, ('endpoint',)))
+sql_seconds = register(Histogram('db_seconds_per_request', "Time spent in SQL statements per request",
+                                 SECONDS_BUCKETS, ('endpoint',)))
+slow_queries = register(Counter('db_slow_queries_total', "SQL statements slower than SLOW_QUERY_MS",
+                                ('endpoint',)))
+http_seconds = register(Histogram('http_request_duration_seconds', "Time taken to answer a request",
+                                  SECONDS_BUCKETS, ('endpoint', 'method', 'status')))
+upstream_seconds = register(Histogram('upstream_request_duration_seconds', "Time spent waiting on the Spoonacular API",
+                                      SECONDS_BUCKETS, ('endpoint', 'status')))
+template_seconds = register(Histogram('template_render_seconds', "Time spent rendering Jinja templates",
+                                      SECONDS_BUCKETS, ('template',)))
+
+
+#query counters opened by count_queries(), e.g. by tests
+_counters = []
+_slow_query_seconds = DEFAULT_SLOW_QUERY_MS / 1000
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _end_query(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+
+    for counter in list(_counters):
+        counter.append(statement)
+
+    if not has_request_context():
+        return
+
+    g.sql_queries = g.get('sql_queries', 0) + 1
+    g.sql_seconds = g.get('sql_seconds', 0.0) + elapsed
+
+    if elapsed >= _slow_query_seconds:
+        slow_queries.inc(request.endpoint or 'unknown')
+        logger.warning("Slow query (%.0f ms) in %s: %s", elapsed * 1000, request.endpoint, statement)
+
+
+@contextmanager
+def count_queries():
+    """Collect the SQL statements run inside the block into the list it yields"""
+    statements = []
+    _counters.append(statements)
+    try:
+        yield statements
+    finally:
+        _counters.remove(statements)
+
+
+@contextmanager
+def assert_max_queries(max_queries):
+    """Fail if the block runs more than max_queries SQL statements, to catch N+1 regressions"""
+    with count_queries() as statements:
+        yield statements
+
+    if len(statements) > max_queries:
+        raise AssertionError(f"{len(statements)} queries run, expected at most {max_queries}:\n" + "\n".join(statements))
+
+
+def snapshot():
+    """Return this process's metrics as a JSON-friendly dict"""
+    metrics = {}
+
+    for metric in REGISTRY:
+        with metric._lock:
+            values = [[list(label_values), value] for label_values, value in metric.values.items()]
+        metrics[metric.name] = {"kind": metric.kind, "help": metric.help, "labels": list(metric.labels),
+                                "buckets": list(getattr(metric, 'buckets', ())), "values": values}
+
+    for collector in COLLECTORS:
+        for name, kind, help, value in collector():
+            metrics[name] = {"kind": kind, "help": help, "labels": [], "buckets": [], "values": [[[], value]]}
+
+    return {"pid": os.getpid(), "metrics": metrics}
+
+
+def write_snapshot(metrics_dir):
+    """Save this process's metrics for the other workers' /metrics to add up"""
+    path = os.path.join(metrics_dir, f"{os.getpid()}.json")
+    with open(path + '.tmp', 'w') as f:
+        json.dump(snapshot(), f)
+    os.replace(path + '.tmp', path)
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def merge_snapshots(snapshots):
+    """Add up counters and histograms from every snapshot; gauges come from live processes only"""
+    merged = {}
+
+    for snap in snapshots:
+        alive = pid_alive(snap["pid"])
+
+        for name, metric in snap["metrics"].items():
+            if metric["kind"] == 'gauge' and not alive:
+                continue
+
+            into = merged.setdefault(name, dict(metric, values={}))
+            for label_values, value in metric["values"]:
+                key = tuple(label_values)
+                current = into["values"].get(key)
+
+                if current is None:
+                    into["values"][key] = value
+                elif metric["kind"] == 'histogram':
+                    into["values"][key] = [a + b for a, b in zip(current, value)]
+                elif metric["kind"] == 'gauge':
+                    into["values"][key] = max(current, value)
+                else:
+                    into["values"][key] = current + value
+
+    return merged
+
+
+def collect(metrics_dir=None):
+    """Return the merged metrics of every worker, or just this process without a metrics_dir"""
+    if not metrics_dir:
+        return merge_snapshots([snapshot()])
+
+    write_snapshot(metrics_dir)
+    snapshots = []
+    for path in glob.glob(os.path.join(metrics_dir, '*.json')):
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+
+    return merge_snapshots(snapshots)
+
+
+def format_number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for name, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def render_prometheus(metrics):
+    """Format merged metrics in the Prometheus text exposition format"""
+    lines = []
+
+    for name in sorted(metrics):
+        metric = metrics[name]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+
+        for label_values, value in sorted(metric["values"].items()):
+            if metric["kind"] != 'histogram':
+                lines.append(f"{name}{format_labels(metric['labels'], label_values)} {format_number(value)}")
+                continue
+
+            cumulative = 0
+            for bound, count in zip(metric["buckets"], value):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(metric['labels'], label_values, [('le', format_number(bound))])} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(metric['labels'], label_values)} {format_number(value[-1])}")
+            lines.append(f"{name}_count{format_labels(metric['labels'], label_values)} {cumulative}")
+
+    return "\n".join(lines) + "\n"
+
+
+def connect_metrics(app):
+    """Record request, SQL and template timings, and serve every metric from /metrics"""
+    global _slow_query_seconds
+    _slow_query_seconds = float(app.config.get('SLOW_QUERY_MS', DEFAULT_SLOW_QUERY_MS)) / 1000
+
+    metrics_dir = app.config.get('METRICS_DIR')
+    flush_interval = float(app.config.get('METRICS_FLUSH_INTERVAL', 5))
+    last_flush = [0.0]
+
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_stats(resp):
+        endpoint = request.endpoint or 'unknown'
+        sql_queries.observe(g.get('sql_queries', 0), endpoint)
+        sql_seconds.observe(g.get('sql_seconds', 0.0), endpoint)
+
+        if 'request_started' in g:
+            http_seconds.observe(time.perf_counter() - g.request_started, endpoint, request.method, str(resp.status_code))
+
+        #save this worker's numbers now and then, for whichever worker answers /metrics
+        if metrics_dir and time.monotonic() - last_flush[0] > flush_interval:
+            last_flush[0] = time.monotonic()
+            write_snapshot(metrics_dir)
+
+        return resp
+
+    def start_template(sender, template, context, **extra):
+        if has_request_context():
+            g.setdefault('template_started', []).append(time.perf_counter())
+
+    def end_template(sender, template, context, **extra):
+        if has_request_context() and g.get('template_started'):
+            template_seconds.observe(time.perf_counter() - g.template_started.pop(), template.name or 'string')
+
+    before_render_template.connect(start_template, app, weak=False)
+    template_rendered.connect(end_template, app, weak=False)
+
+    @app.route('/metrics')
+    def show_metrics():
+        """Metrics in Prometheus text format, added up over every worker"""
+        token = app.config.get('METRICS_TOKEN')
+        if token and request.headers.get('Authorization') != f"Bearer {token}":
+            abort(401)
+
+        body = render_prometheus(collect(metrics_dir))
+        return body, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
@@ -0,0 +1,91 @@
+"""Apply the SQL migrations in migrations/ to the database.
+
+to bring the database up to date:
+
+    python migrate.py
+
+to drop everything and rebuild from scratch (development only):
+
+    python migrate.py --reset
+"""
+
+import argparse
+import os
+
+from sqlalchemy import text
+
+from models import db
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+
+def available_migrations():
+    """Return (version, path) for every migration file, oldest first"""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        if filename.endswith('.sql'):
+            migrations.append((filename[:-4], os.path.join(MIGRATIONS_DIR, filename)))
+
+    return migrations
+
+
+def applied_migrations(conn):
+    """Return the set of versions already applied"""
+    conn.execute(text("""CREATE TABLE IF NOT EXISTS schema_migrations (
+                             version TEXT PRIMARY KEY,
+                             applied_at TIMESTAMP NOT NULL DEFAULT now())"""))
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def run_migrations(engine=None):
+    """Apply every pending migration, each in its own transaction. Returns the versions applied"""
+    engine = engine or db.engine
+    applied = []
+
+    for version, path in available_migrations():
+        with engine.begin() as conn:
+            #lock so two release processes can't apply the same migration at once
+            conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('schema_migrations'))"))
+
+            if version in applied_migrations(conn):
+                continue
+
+            with open(path) as f:
+                conn.execute(text(f.read()))
+            conn.execute(text("INSERT INTO schema_migrations (version) VALUES (:version)"), version=version)
+
+        applied.append(version)
+
+    return applied
+
+
+def reset_database(engine=None):
+    """Drop every table, then rebuild the schema from the migrations"""
+    engine = engine or db.engine
+
+    db.drop_all()
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS schema_migrations"))
+
+    return run_migrations(engine)
+
+
+if __name__ == '__main__':
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Apply database migrations")
+    parser.add_argument('--reset', action='store_true', help="drop all tables first (development only)")
+    parser.add_argument('--status', action='store_true', help="list migrations and whether they are applied")
+    args = parser.parse_args()
+
+    if args.status:
+        with db.engine.begin() as conn:
+            done = applied_migrations(conn)
+        for version, path in available_migrations():
+            print(f"{'applied' if version in done else 'pending'}  {version}")
+    else:
+        applied = reset_database() if args.reset else run_migrations()
+        for version in applied:
+            print(f"applied {version}")
+        if not applied:
+            print("database is up to date")
@@ -0,0 +1,34 @@
+-- Tables as created by db.create_all() before migrations were introduced.
+-- IF NOT EXISTS here and in every later migration lets a database created by
+-- db.create_all(), from these or the current models, be brought under the runner as-is.
+
+CREATE TABLE IF NOT EXISTS recipes (
+    id SERIAL PRIMARY KEY,
+    name TEXT NOT NULL,
+    recipe_url VARCHAR NOT NULL,
+    image_url VARCHAR NOT NULL,
+    vegetarian BOOLEAN,
+    vegan BOOLEAN,
+    api_id INTEGER NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE,
+    email TEXT NOT NULL UNIQUE,
+    password TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS favorites (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER REFERENCES users (id) ON DELETE CASCADE,
+    recipe_id INTEGER REFERENCES recipes (id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS ratings (
+    id SERIAL PRIMARY KEY,
+    rating FLOAT NOT NULL,
+    user_id INTEGER REFERENCES users (id) ON DELETE CASCADE,
+    recipe_id INTEGER NOT NULL REFERENCES recipes (id) ON DELETE CASCADE,
+    review TEXT
+);
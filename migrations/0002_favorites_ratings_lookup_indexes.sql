@@ -0,0 +1,31 @@
+-- One favorite and one rating per user and recipe, plus indexes for the
+-- user_id / recipe_id lookups done by the favorites and ratings pages.
+
+-- Remove duplicates left by double clicks: keep the first favorite and the latest rating.
+DELETE FROM favorites f
+    USING favorites older
+    WHERE f.user_id = older.user_id
+      AND f.recipe_id = older.recipe_id
+      AND f.id > older.id;
+
+DELETE FROM ratings r
+    USING ratings newer
+    WHERE r.user_id = newer.user_id
+      AND r.recipe_id = newer.recipe_id
+      AND r.id < newer.id;
+
+-- The unique constraints are backed by (user_id, recipe_id) indexes, which also serve user_id lookups.
+-- Databases built by db.create_all() already have them, so each is only added when missing.
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'favorites_user_id_recipe_id_key') THEN
+        ALTER TABLE favorites ADD CONSTRAINT favorites_user_id_recipe_id_key UNIQUE (user_id, recipe_id);
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'ratings_user_id_recipe_id_key') THEN
+        ALTER TABLE ratings ADD CONSTRAINT ratings_user_id_recipe_id_key UNIQUE (user_id, recipe_id);
+    END IF;
+END
+$$;
+
+CREATE INDEX IF NOT EXISTS favorites_recipe_id_idx ON favorites (recipe_id);
+CREATE INDEX IF NOT EXISTS ratings_recipe_id_idx ON ratings (recipe_id);
@@ -0,0 +1,17 @@
+-- Rating count, sum and mean stored on each recipe, maintained on every rating change.
+
+ALTER TABLE recipes ADD COLUMN IF NOT EXISTS rating_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE recipes ADD COLUMN IF NOT EXISTS rating_sum FLOAT NOT NULL DEFAULT 0;
+ALTER TABLE recipes ADD COLUMN IF NOT EXISTS rating_mean FLOAT;
+
+-- Backfill from the existing ratings.
+UPDATE recipes
+    SET rating_count = agg.rating_count,
+        rating_sum = agg.rating_sum,
+        rating_mean = agg.rating_mean
+    FROM (SELECT recipe_id, COUNT(*) AS rating_count, SUM(rating) AS rating_sum, AVG(rating) AS rating_mean
+          FROM ratings
+          GROUP BY recipe_id) agg
+    WHERE recipes.id = agg.recipe_id;
+
+CREATE INDEX IF NOT EXISTS recipes_rated_api_id_idx ON recipes (api_id) WHERE rating_count > 0;
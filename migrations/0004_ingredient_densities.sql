@@ -0,0 +1,6 @@
+-- Ingredient densities learned from API conversions, used by the local converter.
+
+CREATE TABLE IF NOT EXISTS ingredient_densities (
+    name TEXT PRIMARY KEY,
+    grams_per_ml FLOAT NOT NULL
+);
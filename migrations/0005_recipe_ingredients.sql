@@ -0,0 +1,7 @@
+-- Ingredients of every recipe in the catalog, read by the local recipe matcher.
+
+CREATE TABLE IF NOT EXISTS recipe_ingredients (
+    recipe_api_id INTEGER NOT NULL REFERENCES recipes (api_id) ON DELETE CASCADE,
+    ingredient TEXT NOT NULL,
+    PRIMARY KEY (recipe_api_id, ingredient)
+);
@@ -0,0 +1,4 @@
+-- When each API field of a recipe was last refreshed, for stale-while-revalidate.
+-- Existing rows start empty, so they are refreshed the next time they are served.
+
+ALTER TABLE recipes ADD COLUMN IF NOT EXISTS refreshed_at JSONB NOT NULL DEFAULT '{}';
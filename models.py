@@ -1,9 +1,14 @@
 """SQLAlchemy models for Use My Food"""
 
-from flask_bcrypt import Bcrypt 
+import time
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, case, func, literal, or_, select
+from sqlalchemy.dialects.postgresql import insert, JSONB
+from sqlalchemy.orm.attributes import get_history
+
+from passwords import password_hasher
 
-bcrypt = Bcrypt()
 db = SQLAlchemy()
 
 def connect_db(app):
@@ -12,12 +17,38 @@ def connect_db(app):
     db.app = app
     db.init_app(app)
 
+def end_transaction():
+    """Commit so the session's connection goes back to the pool before a slow call, such as one to the API.
+
+    Objects already loaded aren't expired, so using them afterwards runs no queries.
+    """
+
+    session = db.session()
+    expire_on_commit = session.expire_on_commit
+    session.expire_on_commit = False
+    try:
+        session.commit()
+    finally:
+        session.expire_on_commit = expire_on_commit
+
 DEFAULT_IMG_URL = "https://www.tastefullysimple.com/_/media/images/recipe-default-image.png"
 
+#Recipe columns copied from the API, each with its own last refreshed time
+REFRESHED_FIELDS = ('name', 'recipe_url', 'image_url', 'vegetarian', 'vegan')
+
+def refreshed_now(fields=REFRESHED_FIELDS):
+    """Return refreshed_at timestamps saying these fields were just refreshed"""
+    now = time.time()
+    return {field: now for field in fields}
+
 class Rating(db.Model):
     """Recipe rating class"""
 
     __tablename__ = "ratings"
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'recipe_id', name='ratings_user_id_recipe_id_key'),
+        db.Index('ratings_recipe_id_idx', 'recipe_id'),
+    )
 
     id = db.Column(
         db.Integer,
@@ -52,6 +83,10 @@ class Favorites(db.Model):
     """Favorites class"""
 
     __tablename__ = "favorites"
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'recipe_id', name='favorites_user_id_recipe_id_key'),
+        db.Index('favorites_recipe_id_idx', 'recipe_id'),
+    )
 
     id = db.Column(
         db.Integer,
@@ -117,7 +152,7 @@ class User(db.Model):
         Hashes password and adds user to system
         """
 
-        hashed_pwd = bcrypt.generate_password_hash(password).decode('UTF-8')
+        hashed_pwd = password_hasher.hash(password)
 
         user = User(
             username=username,
@@ -133,14 +168,17 @@ class User(db.Model):
         """Find user with 'username' and 'password'.
 
         Returns user object if the user exist, otherwise, or if password is wrong
-        returns False.
+        returns False. A hash made with an old BCRYPT_LOG_ROUNDS is replaced,
+        to be saved with the next commit.
         """
 
         user = cls.query.filter_by(username=username).first()
 
         if user:
-            is_auth = bcrypt.check_password_hash(user.password, password)
+            is_auth = password_hasher.check(user.password, password)
             if is_auth:
+                if password_hasher.needs_rehash(user.password):
+                    user.password = password_hasher.hash(password)
                 return user 
         
         return False
@@ -187,6 +225,34 @@ class Recipe(db.Model):
         unique=True,
     )
 
+    #rating aggregates, kept in step with the ratings table by the Rating events below
+    rating_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0'
+    )
+
+    rating_sum = db.Column(
+        db.Float,
+        nullable=False,
+        default=0,
+        server_default='0'
+    )
+
+    rating_mean = db.Column(
+        db.Float,
+        nullable=True
+    )
+
+    #unix time each field in REFRESHED_FIELDS was last copied from the API
+    refreshed_at = db.Column(
+        JSONB,
+        nullable=False,
+        default=refreshed_now,
+        server_default='{}'
+    )
+
     favorite = db.relationship(
         "Favorites"
     )
@@ -212,28 +278,182 @@ class Recipe(db.Model):
         return recipe
 
 
+#rated recipes looked up by api_id, kept small by only covering recipes with ratings
+db.Index('recipes_rated_api_id_idx', Recipe.api_id, postgresql_where=Recipe.rating_count > 0)
+
+
+class IngredientDensity(db.Model):
+    """Grams per milliliter of an ingredient, learned from API conversions"""
+
+    __tablename__ = "ingredient_densities"
+
+    name = db.Column(
+        db.Text,
+        primary_key=True
+    )
+
+    grams_per_ml = db.Column(
+        db.Float,
+        nullable=False
+    )
+
+
+class RecipeIngredient(db.Model):
+    """An ingredient of a recipe, named as in the ingredient vocabulary, for local matching"""
+
+    __tablename__ = "recipe_ingredients"
+
+    recipe_api_id = db.Column(
+        db.Integer,
+        db.ForeignKey('recipes.api_id', ondelete='cascade'),
+        primary_key=True
+    )
+
+    ingredient = db.Column(
+        db.Text,
+        primary_key=True
+    )
+
+
 ###########
-#Helper methods
+#Rating aggregates
+
+def apply_rating_delta(connection, recipe_id, count_delta, sum_delta):
+    """Adjust a recipe's rating aggregates in the current transaction"""
+    recipes = Recipe.__table__
+    new_count = recipes.c.rating_count + count_delta
+    new_sum = recipes.c.rating_sum + sum_delta
+
+    connection.execute(
+        recipes.update()
+        .where(recipes.c.id == recipe_id)
+        .values(
+            rating_count=new_count,
+            rating_sum=new_sum,
+            rating_mean=case([(new_count > 0, new_sum / new_count)], else_=None),
+        )
+    )
 
-def toggle_favorites(recipe_id, user_id):
-    """Toggle a favorite for a user on or off by adding or deleting it to the favorite table"""
-    all_favorites = user_favorites_list(user_id)
-    all_favorites_id = []
-    
-    for fav in all_favorites:
-        if fav.recipe_id == recipe_id:
-            db.session.delete(fav)
-            db.session.commit()
-            return "unfavorited"
-    
-    newFav = Favorites(user_id=user_id, recipe_id=recipe_id)
-    db.session.add(newFav)
+
+@event.listens_for(Rating, 'after_insert')
+def rating_added(mapper, connection, target):
+    apply_rating_delta(connection, target.recipe_id, 1, float(target.rating))
+
+
+@event.listens_for(Rating, 'after_delete')
+def rating_removed(mapper, connection, target):
+    apply_rating_delta(connection, target.recipe_id, -1, -float(target.rating))
+
+
+@event.listens_for(Rating, 'after_update')
+def rating_changed(mapper, connection, target):
+    rating_history = get_history(target, 'rating')
+    recipe_history = get_history(target, 'recipe_id')
+
+    if not rating_history.has_changes() and not recipe_history.has_changes():
+        return
+
+    old_rating = rating_history.deleted[0] if rating_history.deleted else target.rating
+    old_recipe_id = recipe_history.deleted[0] if recipe_history.deleted else target.recipe_id
+
+    if old_recipe_id == target.recipe_id:
+        apply_rating_delta(connection, target.recipe_id, 0, float(target.rating) - float(old_rating))
+    else:
+        apply_rating_delta(connection, old_recipe_id, -1, -float(old_rating))
+        apply_rating_delta(connection, target.recipe_id, 1, float(target.rating))
+
+
+def reconcile_rating_aggregates():
+    """Recompute every recipe's rating aggregates from the ratings table.
+
+    Returns the number of recipes whose aggregates had drifted.
+    """
+    recipes = Recipe.__table__
+    ratings = Rating.__table__
+
+    count = select([func.count(ratings.c.id)]).where(ratings.c.recipe_id == recipes.c.id).as_scalar()
+    total = select([func.coalesce(func.sum(ratings.c.rating), 0)]).where(ratings.c.recipe_id == recipes.c.id).as_scalar()
+    #the same sum / count the rating events store, so a correct mean compares equal
+    mean = case([(count > 0, total / count)], else_=None)
+
+    result = db.session.execute(
+        recipes.update()
+        .where(or_(recipes.c.rating_count != count, recipes.c.rating_sum != total,
+                   recipes.c.rating_mean.is_distinct_from(mean)))
+        .values(rating_count=count, rating_sum=total, rating_mean=mean)
+    )
     db.session.commit()
-    return "favorited"
+    return result.rowcount
 
 
-def user_favorites_list(user_id):
-    """Create a list of all the user's favorites"""
+###########
+#Helper methods
 
-    user = User.query.get(user_id)
-    return user.favorites
+def toggle_favorites(recipe_id, user_id):
+    """Toggle a favorite for a user on or off by adding or deleting it to the favorite table.
+
+    Deletes the favorite if it exists, otherwise inserts it, ignoring a row a concurrent
+    request inserted first, so double clicks can't create duplicates.
+    """
+    favorites = Favorites.__table__
+
+    deleted = db.session.execute(
+        favorites.delete()
+        .where(favorites.c.user_id == user_id)
+        .where(favorites.c.recipe_id == recipe_id)
+        .returning(favorites.c.id)
+    ).fetchall()
+
+    if not deleted:
+        db.session.execute(
+            insert(favorites)
+            .values(user_id=user_id, recipe_id=recipe_id)
+            .on_conflict_do_nothing(index_elements=['user_id', 'recipe_id'])
+        )
+
+    db.session.commit()
+    return "unfavorited" if deleted else "favorited"
+
+
+def toggle_favorites_bulk(recipe_ids, user_id):
+    """Toggle many favorites for a user at once, in at most three statements.
+
+    Returns {"favorited": [...], "unfavorited": [...], "skipped": [...]} with the recipe ids
+    in each state; skipped ids are recipes that don't exist, which leave the rest applied.
+    """
+    favorites = Favorites.__table__
+    recipes = Recipe.__table__
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+
+    if not recipe_ids:
+        return {"favorited": [], "unfavorited": [], "skipped": []}
+
+    deleted = db.session.execute(
+        favorites.delete()
+        .where(favorites.c.user_id == user_id)
+        .where(favorites.c.recipe_id.in_(recipe_ids))
+        .returning(favorites.c.recipe_id)
+    ).fetchall()
+    unfavorited = {recipe_id for (recipe_id,) in deleted}
+
+    to_favorite = [recipe_id for recipe_id in recipe_ids if recipe_id not in unfavorited]
+    favorited = []
+    if to_favorite:
+        #insert from the recipes table, so ids of recipes that don't exist drop out instead of failing the batch
+        inserted = db.session.execute(
+            insert(favorites)
+            .from_select(['user_id', 'recipe_id'],
+                         select([literal(user_id), recipes.c.id]).where(recipes.c.id.in_(to_favorite)))
+            .on_conflict_do_nothing(index_elements=['user_id', 'recipe_id'])
+            .returning(favorites.c.recipe_id)
+        ).fetchall()
+        #a row a concurrent request inserted first is favorited too, but isn't returned
+        existing = {recipe_id for (recipe_id,) in inserted}
+        if len(existing) < len(to_favorite):
+            existing.update(recipe_id for (recipe_id,) in db.session.execute(
+                select([recipes.c.id]).where(recipes.c.id.in_(to_favorite))))
+        favorited = [recipe_id for recipe_id in to_favorite if recipe_id in existing]
+
+    db.session.commit()
+    return {"favorited": favorited, "unfavorited": sorted(unfavorited),
+            "skipped": [recipe_id for recipe_id in to_favorite if recipe_id not in favorited]}
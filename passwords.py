@@ -0,0 +1,132 @@
+"""Password hashing off the request thread, with its own concurrency limit.
+
+bcrypt is slow on purpose, so every signup and login costs a few hundred
+milliseconds of CPU. Hashes run on a small pool (separate processes by
+default, native threads under gevent) and only max_concurrent of them may be
+waiting at once, so a burst of logins can't take every worker away from search.
+"""
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+import bcrypt
+
+from metrics import register_collector
+
+DEFAULT_LOG_ROUNDS = 12
+
+
+class HashingBusyError(Exception):
+    """Raised when too many signups or logins are already being hashed"""
+
+
+def hash_password(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def check_password(hashed, password):
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def hash_rounds(hashed):
+    """Return the cost a hash like '$2b$12$...' was made with"""
+    try:
+        return int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def make_pool(kind, workers):
+    """Return an executor for the hashing pool, or None to hash on the request thread"""
+    if kind == 'inline' or workers <= 0:
+        return None
+    if kind == 'gevent':
+        #native threads, which bcrypt can use in parallel since it releases the GIL
+        from gevent.threadpool import ThreadPoolExecutor
+        return ThreadPoolExecutor(workers)
+    return ProcessPoolExecutor(workers)
+
+
+class PasswordHasher:
+    """Hash and check passwords on a bounded pool, allowing max_concurrent at a time"""
+
+    def __init__(self, rounds=DEFAULT_LOG_ROUNDS, pool='process', workers=2, max_concurrent=4, max_wait=5):
+        self.rounds = rounds
+        self.pool_kind = pool
+        self.workers = workers
+        self.max_wait = max_wait
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Configure the hasher from the Flask app config"""
+        config = app.config
+
+        self.rounds = int(config.get('BCRYPT_LOG_ROUNDS', DEFAULT_LOG_ROUNDS))
+        self.pool_kind = config.get('PASSWORD_HASH_POOL', 'process')
+        self.workers = int(config.get('PASSWORD_HASH_WORKERS', 2))
+        self.max_wait = float(config.get('LOGIN_MAX_WAIT', 5))
+        self._slots = threading.BoundedSemaphore(int(config.get('LOGIN_CONCURRENCY', 4)))
+        self._pid = None
+
+    def _executor(self):
+        with self._lock:
+            #gunicorn forks workers after the app is loaded, and a pool doesn't survive a fork
+            if self._pid != os.getpid():
+                self._pool = make_pool(self.pool_kind, self.workers)
+                self._pid = os.getpid()
+            return self._pool
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.max_wait):
+            self.rejected += 1
+            raise HashingBusyError("Too many people are signing in right now, please try again in a moment.")
+
+        release = True
+        try:
+            pool = self._executor()
+            if pool is None:
+                return fn(*args)
+
+            future = pool.submit(fn, *args)
+            try:
+                return future.result(timeout=self.max_wait)
+            except TimeoutError:
+                self.rejected += 1
+                #a hash given up on still uses the pool, so it keeps its slot until it is done
+                if not future.cancel():
+                    release = False
+                    future.add_done_callback(lambda future: self._slots.release())
+                raise HashingBusyError("Too many people are signing in right now, please try again in a moment.")
+        finally:
+            if release:
+                self._slots.release()
+
+    def hash(self, password):
+        if not password:
+            raise ValueError('Password must be non-empty.')
+        return self._run(hash_password, password, self.rounds)
+
+    def check(self, hashed, password):
+        return self._run(check_password, hashed, password)
+
+    def needs_rehash(self, hashed):
+        """True if a hash was made with a different cost than the current one"""
+        return hash_rounds(hashed) != self.rounds
+
+
+password_hasher = PasswordHasher()
+
+
+@register_collector
+def password_samples():
+    return [('password_hashing_rejected_total', 'counter', "Signups and logins turned away while hashing was busy",
+             password_hasher.rejected)]
+
+
+def connect_passwords(app):
+    password_hasher.init_app(app)
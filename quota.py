@@ -0,0 +1,170 @@
+"""Rate limiting and daily quota tracking for calls to the Spoonacular API"""
+
+import json
+import threading
+import time
+
+from cache import SQLiteConnection
+
+#Request priorities: searches a user is waiting on go before background refreshes
+INTERACTIVE = 0
+BACKGROUND = 1
+
+#Spoonacular reports the points spent today in these response headers
+QUOTA_LEFT_HEADER = 'X-API-Quota-Left'
+QUOTA_USED_HEADER = 'X-API-Quota-Used'
+
+#Spoonacular answers 402 once the daily points are used up
+QUOTA_EXHAUSTED_STATUS = 402
+
+
+def quota_day(now):
+    """Spoonacular quotas reset at midnight UTC"""
+    return time.strftime('%Y-%m-%d', time.gmtime(now))
+
+
+class MemoryQuotaStore:
+    """Limiter state for a single process"""
+
+    def __init__(self):
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def transact(self, update):
+        """Call update(state) with the state locked, saving its changes. Returns what update returns"""
+        with self._lock:
+            return update(self._state)
+
+    def read(self):
+        """Return a copy of the state, for looking at without changing it"""
+        with self._lock:
+            return dict(self._state)
+
+
+class SQLiteQuotaStore:
+    """Limiter state in a sqlite file, so every gunicorn worker on the host draws from the same bucket"""
+
+    def __init__(self, path, name='spoonacular'):
+        self.path = path
+        self.name = name
+        self.db = SQLiteConnection(path, ["""CREATE TABLE IF NOT EXISTS upstream_quota (
+                                                 name TEXT PRIMARY KEY,
+                                                 state TEXT NOT NULL)"""])
+
+        self.transact(lambda state: None)
+
+    def transact(self, update):
+        #the write lock is held throughout, so two workers can't both spend the last token
+        with self.db.transaction() as conn:
+            row = conn.execute("SELECT state FROM upstream_quota WHERE name = ?", (self.name,)).fetchone()
+            state = json.loads(row[0]) if row else {}
+            result = update(state)
+            conn.execute("INSERT OR REPLACE INTO upstream_quota (name, state) VALUES (?, ?)",
+                         (self.name, json.dumps(state)))
+
+        return result
+
+    def read(self):
+        #a plain SELECT, so looking at the state never waits for or takes the write lock
+        with self.db.read() as conn:
+            row = conn.execute("SELECT state FROM upstream_quota WHERE name = ?", (self.name,)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+
+class QuotaLimiter:
+    """Token bucket in front of the API that also tracks the daily quota reported by its headers.
+
+    Background requests may only use the top part of the bucket, and stop
+    altogether once the daily points left drop to quota_reserve, so what is
+    left goes to users first.
+    """
+
+    def __init__(self, rate=2.0, burst=10, store=None, max_wait=2.0, background_share=0.5, quota_reserve=10):
+        self.rate = rate
+        self.burst = burst
+        self.store = store if store is not None else MemoryQuotaStore()
+        self.max_wait = max_wait
+        self.background_share = background_share
+        self.quota_reserve = quota_reserve
+        self.throttled = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a limiter from the Flask app config"""
+        path = config.get('UPSTREAM_QUOTA_PATH')
+        return cls(rate=float(config.get('UPSTREAM_RATE', 2.0)),
+                   burst=float(config.get('UPSTREAM_BURST', 10)),
+                   store=SQLiteQuotaStore(path) if path else None,
+                   max_wait=float(config.get('UPSTREAM_MAX_WAIT', 2.0)),
+                   quota_reserve=float(config.get('UPSTREAM_QUOTA_RESERVE', 10)))
+
+    def _refill(self, state, now):
+        """Bring the stored state up to now"""
+        if 'tokens' not in state:
+            state.update(tokens=self.burst, updated_at=now)
+
+        state['tokens'] = min(self.burst, state['tokens'] + (now - state['updated_at']) * self.rate)
+        state['updated_at'] = now
+
+        if state.get('day') != quota_day(now):
+            state.update(day=quota_day(now), quota_left=None, quota_used=None)
+
+    def _take(self, priority):
+        """Take a token if one is free for this priority. Returns 0, seconds to wait, or None for never"""
+        def update(state):
+            now = time.time()
+            self._refill(state, now)
+
+            quota_floor = 0 if priority == INTERACTIVE else self.quota_reserve
+            if state['quota_left'] is not None and state['quota_left'] <= quota_floor:
+                return None
+
+            token_floor = 0 if priority == INTERACTIVE else self.burst * self.background_share
+            if state['tokens'] - 1 >= token_floor:
+                state['tokens'] -= 1
+                return 0
+
+            return (token_floor + 1 - state['tokens']) / self.rate
+
+        return self.store.transact(update)
+
+    def acquire(self, priority=INTERACTIVE):
+        """Wait up to max_wait for a token. Returns False if the request should not be sent"""
+        deadline = time.monotonic() + self.max_wait
+
+        while True:
+            wait = self._take(priority)
+            if wait == 0:
+                return True
+
+            if wait is None or time.monotonic() + wait > deadline:
+                self.throttled += 1
+                return False
+
+            time.sleep(wait)
+
+    def record(self, headers, status):
+        """Note the quota the API says is left after a response"""
+        def update(state):
+            self._refill(state, time.time())
+
+            if status == QUOTA_EXHAUSTED_STATUS:
+                state['quota_left'] = 0
+            if headers.get(QUOTA_LEFT_HEADER) is not None:
+                state['quota_left'] = float(headers[QUOTA_LEFT_HEADER])
+            if headers.get(QUOTA_USED_HEADER) is not None:
+                state['quota_used'] = float(headers[QUOTA_USED_HEADER])
+
+        self.store.transact(update)
+
+    def status(self):
+        """Return the tokens in the bucket and the daily points used and left, as far as they are known"""
+        #brought up to now on a copy, which isn't saved
+        state = self.store.read()
+        self._refill(state, time.time())
+        return {"tokens": state['tokens'], "quota_left": state['quota_left'], "quota_used": state['quota_used']}
+
+    def near_limit(self):
+        """True once the daily points left are down to the reserve"""
+        quota_left = self.status()['quota_left']
+        return quota_left is not None and quota_left <= self.quota_reserve
@@ -0,0 +1,12 @@
+"""Fix any drift between the ratings table and the rating aggregates stored on recipes.
+
+to run:
+
+    python reconcile_ratings.py
+"""
+
+from app import app
+from models import reconcile_rating_aggregates
+
+fixed = reconcile_rating_aggregates()
+print(f"reconciled rating aggregates for {fixed} recipe(s)")
@@ -1,10 +1,7 @@
 """Seed file to make sample data for db"""
  
-from models import db
 from app import app
+from migrate import run_migrations
 
-#Create all tables
-db.drop_all()
-db.create_all()
-
-
+#Create or upgrade all tables, see migrate.py --reset to start from an empty db
+run_migrations()
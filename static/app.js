@@ -1,4 +1,6 @@
 const SEARCH_BY_ING_URL = "https://api.spoonacular.com/recipes/findByIngredients?ingredients="
+//The most recipe ids the server accepts in one batch request
+const MAX_BATCH_IDS = 100
 
 //Click handler for searching by ingredient
 $('#search-for-recipes').click(async function (evt) {
@@ -23,66 +25,70 @@ $('#search-for-recipes').click(async function (evt) {
     let ingArray = separateIngredients(ingredients);
     let ingStr = ingArray.join(",+")
 
-    let res = await axios.post(`/ingredient-search`, json={"number": numRecipes, "ingStr": ingStr})
-    let recipeInfo = await getRecipeInfo(res.data['data'])
-    listRecipes(recipeInfo)
+    //one request searches, looks up each recipe and flags favorites and ratings
+    let res = await axios.post(`/ingredient-search/recipes`, json={"number": numRecipes, "ingStr": ingStr})
+    listRecipes(res.data['recipes'])
+})
+
+//Suggest ingredient names for the one currently being typed
+let suggestTimer;
+$('#searchIngredients').on('input', function () {
+    clearTimeout(suggestTimer)
+    suggestTimer = setTimeout(showIngredientSuggestions, 150)
+})
+
+async function showIngredientSuggestions(){
+    let $suggestions = $('#ingredientSuggestions')
+    let typed = $('#searchIngredients').val().split(",").pop().trim()
+
+    if (typed.length < 2){
+        $suggestions.empty()
+        return
+    }
+
+    let res = await axios.get(`/ingredients/suggest`, {params: {"q": typed, "limit": 5}})
+    $suggestions.empty()
+    for (let suggestion of res.data['suggestions']){
+        $suggestions.append(`<li class="list-group-item ingredientSuggestion">${suggestion}</li>`)
+    }
+}
+
+//Replace the ingredient being typed with the clicked suggestion
+$('#ingredientSuggestions').on('click', '.ingredientSuggestion', function () {
+    let ingredients = $('#searchIngredients').val().split(",")
+    ingredients.pop()
+    ingredients = ingredients.map(ingredient => ingredient.trim()).filter(ingredient => ingredient !== "")
+    ingredients.push($(this).text())
+
+    $('#searchIngredients').val(ingredients.join(", ") + ", ").focus()
+    $('#ingredientSuggestions').empty()
 })
 
 //Separate comma-separated ingredients and return an array of each
 function separateIngredients(ingredients){
 
     let loweredIng = ingredients.toLowerCase()
-    let array = loweredIng.split(", ")
+    let array = loweredIng.split(",").map(ingredient => ingredient.trim()).filter(ingredient => ingredient !== "")
     return array
 }
 
-//Get extended recipe information from the API, based on the number of recipes desired
-async function getRecipeInfo(recipes){
-    let allIds = []
-    let x = recipes.length
-
-    for(let i=0; i < x; i++){
-        let id = recipes[i].id
-        allIds.push(id)
-    }
-    
-    let info;
-    //Will not need unless searching for 1 recipe is enabled
-    // if (allIds.length == 1){
-    //     // info = await axios.get(`https://api.spoonacular.com/recipes/${allIds[0]}/information?apiKey=${config["apiKey"]}`)
-
-    let ids = allIds.join(",")
-    info = await axios.post(`/ingredient-search-recipes-helper`, json={'ids': ids})
-        
-    return info.data['data']
-}
-
-//Distill only the data required from the response from the API, and clean up each recipe
+//List the recipes found, with their favorite and rating state already filled in
 function listRecipes(recipes) {
     $('#recipeList').empty()
-    let x = recipes.length;
-
-    if(x > 1 && x != undefined){
-        for(let i=0; i < x; i++){
-            let id = recipes[i].id
-            let title = recipes[i].title
-            let image = recipes[i].image
-            let sourceUrl = recipes[i].sourceUrl
-            let vegetarian = recipes[i].vegetarian
-            let vegan = recipes[i].vegan
-            appendRecipe(id, title, image, sourceUrl, vegetarian, vegan)
+    let loggedIn = $('#login').length == 0
+
+    for (let recipe of recipes){
+        appendRecipe(recipe.id, recipe.title, recipe.image, recipe.sourceUrl, recipe.vegetarian, recipe.vegan)
+
+        if (loggedIn){
+            let star = recipe.favorited ? "fas" : "far"
+            $(`#${recipe.id} > .favoriteButton`).append(`<i class="${star} fa-star"></i>`)
+        }
+
+        if (recipe.rated){
+            $(`#${recipe.id} .viewRatingForm`).append(`<button name='api_id' value=${recipe.id}>View ratings</button>`)
         }
-    } else {
-        let id = recipes.id
-        let title = recipes.title
-        let image = recipes.image
-        let sourceUrl = recipes.sourceUrl
-        let vegetarian = recipes.vegetarian
-        let vegan = recipes.vegan
-        appendRecipe(id, title, image, sourceUrl, vegetarian, vegan)
     }
-    toggle_favorite_icons()
-    toggle_view_rating()
 }
 
 //Appends a recipe to the page
@@ -149,18 +155,23 @@ async function toggle_favorite_icons(){
     if (check_loggedin.length != 0){
         return
     } else {
-    //Get a list of all the api_ids of the current user's favorites
-    let data = await axios.get(`/users/curruser/favorites`)
-    let all_fav_recipe_ids = Object.entries(data.data['favIds'])
-
-    let fav_arr = create_fav_arr(all_fav_recipe_ids)
     let all_fav_buttons = Array.from(document.getElementsByClassName('favoriteButton'))
+    let shown_ids = all_fav_buttons.map(fav_button => fav_button.parentNode.id)
+
+    //Ask which of the recipes on the page are favorited, a batch at a time
+    let fav_arr = []
+    for (let i = 0; i < shown_ids.length; i += MAX_BATCH_IDS) {
+        let batch = shown_ids.slice(i, i + MAX_BATCH_IDS)
+        let data = await axios.get(`/users/curruser/favorites`, {params: {"ids": batch.join(",")}})
+        fav_arr = fav_arr.concat(data.data['favIds'])
+    }
+
     //Iterate through all the favorite buttons, changing the icon displayed according to if the recipe is present in the fav_arr
     for(let y=0; y<all_fav_buttons.length;y++){
         let fav_button = all_fav_buttons[y]
         let id = fav_button.parentNode.id
         //fill in favorite icons if they exist for the user
-        if(fav_arr.includes(id)){
+        if(fav_arr.includes(parseInt(id))){
             $(`#${id} > .favoriteButton`).append('<i class="fas fa-star"></i>')
         } else {
             $(`#${id} > .favoriteButton`).append('<i class="far fa-star"></i>')
@@ -169,41 +180,6 @@ async function toggle_favorite_icons(){
   }
 }   
 
-//Clean up the string data of all favorites to just api_ids
-function create_fav_arr(all_fav_recipe_ids) {
-    let raw_arr = []
-    for (let i = 0; i < all_fav_recipe_ids.length; i++) {
-        raw_arr.push(all_fav_recipe_ids[i][1])
-    }
-
-    let str = JSON.stringify(raw_arr)
-    let str2 = str.slice(0, -1)
-    str2 = str2.substring(1)
-    let str_arr = str2.split(",")
-    let fav_arr = []
-    for (let x = 0; x < str_arr.length; x++) {
-        fav_arr.push(str_arr[x])
-    }
-    return fav_arr
-}
-
-//If a recipe has any ratings in the DB, display the button that allows a user to view its ratings
-async function toggle_view_rating() {
-    let data = await axios.get(`/ratings/all_recipe_ids`)
-    let all_rated_ids = (data.data['ids'])
-
-    let all_view_ratings_buttons = Array.from(document.getElementsByClassName('viewRatingForm'))
-
-    //Iterate through all recipes and add "view ratings" button
-    for(let i=0; i<all_view_ratings_buttons.length;i++){
-        let button = all_view_ratings_buttons[i]
-        let id = button.parentNode.parentNode.id
-        if(all_rated_ids.includes(parseInt(id))){
-            $(`#${id} > .viewRatingForm`).append(`<button name='api_id' value=${id}>View ratings</button>`)
-        }
-    }
-}
-
 //Event listener for the submission of the converter
 $('#convertButton').click(async function(evt){
     evt.preventDefault()
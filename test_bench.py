@@ -0,0 +1,57 @@
+"""Benchmark harness tests."""
+
+#to run these tests:
+#
+#    python -m unittest test_bench.py
+
+import random
+from unittest import TestCase
+
+from bench.fake_spoonacular import create_app, make_recipe
+from bench.seed_data import dataset_size, user_recipe_pairs
+from bench.run import percentile
+
+
+class FakeSpoonacularTestCase(TestCase):
+    """Test the fake API."""
+
+    def setUp(self):
+        self.client = create_app(catalog_size=50).test_client()
+
+    def test_recipes_are_stable(self):
+        self.assertEqual(make_recipe(7), make_recipe(7))
+        self.assertNotEqual(make_recipe(7)["title"], make_recipe(8)["title"])
+
+    def test_find_by_ingredients(self):
+        resp = self.client.get('/recipes/findByIngredients?ingredients=tomatoes,onion&number=5')
+        again = self.client.get('/recipes/findByIngredients?ingredients=tomatoes,onion&number=5')
+
+        self.assertEqual(len(resp.json), 5)
+        self.assertEqual(resp.json, again.json)
+        self.assertTrue(all(1 <= recipe["id"] <= 50 for recipe in resp.json))
+        self.assertIn("X-API-Quota-Left", resp.headers)
+
+    def test_information_bulk(self):
+        resp = self.client.get('/recipes/informationBulk?ids=3,4')
+        self.assertEqual([recipe["id"] for recipe in resp.json], [3, 4])
+
+    def test_error_injection(self):
+        client = create_app(error_rate=1.0).test_client()
+        self.assertIn(client.get('/recipes/informationBulk?ids=1').status_code, (429, 500, 503))
+
+
+class DatasetTestCase(TestCase):
+    """Test the seeded dataset shape."""
+
+    def test_pairs_are_distinct(self):
+        sizes = dataset_size(1000)
+        pairs = list(user_recipe_pairs(random.Random(0), sizes["users"], sizes["recipes"], sizes["favorites"]))
+
+        self.assertEqual(len(pairs), 1000)
+        self.assertEqual(len(set(pairs)), 1000)
+
+    def test_percentile(self):
+        ordered = list(range(1, 101))
+        self.assertEqual(percentile(ordered, 0.5), 51)
+        self.assertEqual(percentile(ordered, 0.99), 100)
+        self.assertEqual(percentile([], 0.5), 0.0)
@@ -0,0 +1,137 @@
+"""Response cache tests."""
+
+#to run these tests:
+#
+#    python -m unittest test_cache.py
+
+import os
+import sqlite3
+import tempfile
+import time
+from unittest import TestCase
+
+from cache import ResponseCache, TTLCache, MemoryBackend, SQLiteBackend, SQLiteConnection, NullBackend, make_cache_key, ttl_for, shared_backend_from_config
+
+
+class CacheKeyTestCase(TestCase):
+    """Test cache key normalization."""
+
+    def test_api_key_removed(self):
+        key = make_cache_key('recipes/convert', {'sourceAmount': 2, 'apiKey': 'secret'})
+        self.assertNotIn('secret', key)
+        self.assertNotIn('apiKey', key)
+
+    def test_param_order_ignored(self):
+        k1 = make_cache_key('recipes/findByIngredients', {'ingredients': 'egg', 'number': 5})
+        k2 = make_cache_key('/recipes/findByIngredients', {'number': '5', 'ingredients': 'egg '})
+        self.assertEqual(k1, k2)
+
+    def test_endpoint_ttls(self):
+        self.assertEqual(ttl_for('recipes/123/information'), 24 * 60 * 60)
+        self.assertEqual(ttl_for('recipes/convert'), 30 * 24 * 60 * 60)
+
+
+class ResponseCacheTestCase(TestCase):
+    """Test the in-process cache."""
+
+    def test_hit_and_miss(self):
+        cache = ResponseCache()
+        params = {'ids': '1,2', 'apiKey': 'a'}
+
+        self.assertIsNone(cache.get('recipes/informationBulk', params))
+        cache.set('recipes/informationBulk', params, [{"id": 1}])
+
+        #a different api key is still the same request
+        self.assertEqual(cache.get('recipes/informationBulk', {'ids': '1,2', 'apiKey': 'b'}), [{"id": 1}])
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+    def test_expired_entry(self):
+        cache = ResponseCache(ttls={}, default_ttl=-1)
+        cache.set('recipes/convert', {'sourceAmount': 1}, {"targetAmount": 2})
+
+        self.assertIsNone(cache.get('recipes/convert', {'sourceAmount': 1}))
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(MemoryBackend(max_entries=2))
+        cache.set('recipes/convert', {'a': 1}, 1)
+        cache.set('recipes/convert', {'a': 2}, 2)
+
+        #touch the first entry so the second is the least recently used
+        cache.get('recipes/convert', {'a': 1})
+        cache.set('recipes/convert', {'a': 3}, 3)
+
+        self.assertEqual(len(cache.backend), 2)
+        self.assertEqual(cache.get('recipes/convert', {'a': 1}), 1)
+        self.assertIsNone(cache.get('recipes/convert', {'a': 2}))
+
+
+class SQLiteBackendTestCase(TestCase):
+    """Test the on-disk cache shared between workers."""
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+
+    def tearDown(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_shared_between_instances(self):
+        worker1 = ResponseCache(SQLiteBackend(self.path))
+        worker2 = ResponseCache(SQLiteBackend(self.path))
+
+        worker1.set('recipes/complexSearch', {'query': 'kale'}, {"results": []})
+        self.assertEqual(worker2.get('recipes/complexSearch', {'query': 'kale'}), {"results": []})
+
+    def test_lru_eviction(self):
+        backend = SQLiteBackend(self.path, max_entries=2)
+        backend.set('a', 1, time.time() + 60)
+        time.sleep(0.01)
+        backend.set('b', 2, time.time() + 60)
+        time.sleep(0.01)
+        backend.get('a')
+        time.sleep(0.01)
+        backend.set('c', 3, time.time() + 60)
+
+        self.assertEqual(len(backend), 2)
+        self.assertIsNone(backend.get('b'))
+
+    def test_reads_dont_take_write_lock(self):
+        """A hit is served while another worker holds the write lock"""
+        backend = SQLiteBackend(self.path)
+        backend.set('a', 1, time.time() + 60)
+
+        writer = sqlite3.connect(self.path, isolation_level=None)
+        writer.execute("BEGIN IMMEDIATE")
+        try:
+            self.assertEqual(backend.get('a')[0], 1)
+        finally:
+            writer.execute("ROLLBACK")
+            writer.close()
+
+    def test_transaction_rolls_back(self):
+        db = SQLiteConnection(self.path, ["CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)"])
+
+        with db.transaction() as conn:
+            conn.execute("INSERT INTO counters VALUES ('a', 1)")
+        with self.assertRaises(ValueError):
+            with db.transaction() as conn:
+                conn.execute("UPDATE counters SET value = 2")
+                raise ValueError("failed halfway")
+
+        with db.read() as conn:
+            self.assertEqual(conn.execute("SELECT value FROM counters").fetchone()[0], 1)
+
+    def test_shared_backend_only(self):
+        """Per-user caches are skipped unless every worker shares them"""
+        self.assertIsInstance(shared_backend_from_config({'API_CACHE_BACKEND': 'memory'}, 'favorites_cache'), NullBackend)
+
+        config = {'API_CACHE_BACKEND': 'sqlite', 'API_CACHE_PATH': self.path}
+        worker1 = TTLCache(shared_backend_from_config(config, 'favorites_cache'))
+        worker2 = TTLCache(shared_backend_from_config(config, 'favorites_cache'))
+
+        worker1.set('user:1', [1234])
+        worker2.delete('user:1')
+        self.assertIsNone(worker1.get('user:1'))
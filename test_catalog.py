@@ -0,0 +1,63 @@
+"""Recipe catalog freshness tests."""
+
+#to run these tests:
+#
+#    python -m unittest test_catalog.py
+
+import threading
+from unittest import TestCase
+
+from flask import Flask
+
+from models import Recipe
+from catalog import stale_fields, RecipeRefresher
+
+
+class StaleFieldsTestCase(TestCase):
+    """Test which recipe fields need refreshing."""
+
+    def test_fresh(self):
+        recipe = Recipe(refreshed_at={"name": 100, "recipe_url": 100, "image_url": 100, "vegetarian": 100, "vegan": 100})
+        self.assertEqual(stale_fields(recipe, fresh_for=50, now=120), [])
+
+    def test_old_and_missing_fields(self):
+        recipe = Recipe(refreshed_at={"name": 100, "recipe_url": 10, "image_url": 100, "vegetarian": 100})
+        self.assertEqual(stale_fields(recipe, fresh_for=50, now=120), ["recipe_url", "vegan"])
+
+
+class RecordingRefresher(RecipeRefresher):
+    """Refresher that records the batches it is given instead of calling the API"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = []
+        self.release = threading.Event()
+
+    def refresh(self, api_ids):
+        self.release.wait(5)
+        self.batches.append(api_ids)
+        with self._lock:
+            self._pending.difference_update(api_ids)
+
+
+class RecipeRefresherTestCase(TestCase):
+    """Test queueing background refreshes."""
+
+    def test_queued_ids_are_not_queued_twice(self):
+        refresher = RecordingRefresher()
+        refresher.init_app(Flask(__name__))
+
+        refresher.refresh_later([1, 2])
+        refresher.refresh_later([2, 3])
+        refresher.release.set()
+        refresher._executor.shutdown(wait=True)
+
+        self.assertEqual(refresher.batches, [[1, 2], [3]])
+        self.assertEqual(refresher._pending, set())
+
+    def test_disabled(self):
+        refresher = RecordingRefresher(workers=0)
+        refresher.app = Flask(__name__)
+        refresher.refresh_later([1])
+
+        self.assertIsNone(refresher._executor)
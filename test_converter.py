@@ -0,0 +1,100 @@
+"""Measurement converter tests."""
+
+#to run these tests:
+#
+#    python -m unittest test_converter.py
+
+from unittest import TestCase
+from unittest.mock import patch, Mock
+
+import converter
+from converter import UnitConverter, UnknownConversion, normalize_unit, seed_densities, SEED_DENSITIES
+
+
+class UnitConverterTestCase(TestCase):
+    """Test the local unit converter."""
+
+    def setUp(self):
+        self.converter = UnitConverter({"flour": 0.53, "egg": 1.03})
+
+    def test_unit_aliases(self):
+        #the units offered on the converter page
+        self.assertEqual(normalize_unit("tBsp"), "tbsp")
+        self.assertEqual(normalize_unit("cups"), "cup")
+        self.assertEqual(normalize_unit("ounces"), "oz")
+        self.assertEqual(normalize_unit("grams"), "g")
+        self.assertIsNone(normalize_unit("handful"))
+
+    def test_single_letter_units(self):
+        """"T" is a tablespoon and "t" a teaspoon, so their case isn't lowered away"""
+        self.assertEqual(normalize_unit("T"), "tbsp")
+        self.assertEqual(normalize_unit("t."), "tsp")
+        self.assertEqual(normalize_unit("C"), "cup")
+        self.assertAlmostEqual(UnitConverter().convert(1, "T", "ml"), 14.7868, places=3)
+
+    def test_volume_to_volume(self):
+        self.assertAlmostEqual(self.converter.convert(2, "tBsp", "tsp"), 6)
+        self.assertAlmostEqual(self.converter.convert(1, "cups", "tBsp"), 16)
+
+    def test_mass_to_mass(self):
+        self.assertAlmostEqual(self.converter.convert(1, "pounds", "ounces"), 16)
+        self.assertAlmostEqual(self.converter.convert(1, "ounces", "grams"), 28.35, places=2)
+
+    def test_volume_to_mass(self):
+        grams = self.converter.convert(1, "cups", "grams", "Flour ")
+        self.assertAlmostEqual(grams, 125.39, places=2)
+
+        cups = self.converter.convert(grams, "grams", "cups", "flour")
+        self.assertAlmostEqual(cups, 1)
+
+    def test_plural_ingredient(self):
+        self.assertIsNotNone(self.converter.convert(1, "cups", "grams", "eggs"))
+
+    def test_unknown_density(self):
+        with self.assertRaises(UnknownConversion):
+            self.converter.convert(1, "cups", "grams", "saffron")
+
+    def test_unknown_unit(self):
+        with self.assertRaises(UnknownConversion):
+            self.converter.convert(1, "pinch", "grams", "flour")
+
+    def test_learn_density(self):
+        density = self.converter.learn("saffron", 1, "cups", 100, "grams")
+
+        self.assertAlmostEqual(density, 100 / 236.5882365)
+        self.assertAlmostEqual(self.converter.convert(2, "cups", "grams", "saffron"), 200)
+
+    def test_learn_ignores_same_dimension(self):
+        self.assertIsNone(self.converter.learn("saffron", 1, "cups", 16, "tBsp"))
+
+    def test_seeds_match_vocabulary(self):
+        self.assertEqual(seed_densities(), SEED_DENSITIES)
+
+
+class ConvertTestCase(TestCase):
+    """Test falling back from the local converter to the API."""
+
+    def setUp(self):
+        self.api = Mock(**{"get.return_value": {"targetAmount": 1.5, "answer": "from the API"}})
+        for name, value in (('spoonacular', self.api), ('end_transaction', Mock()), ('save_density', Mock())):
+            patcher = patch.object(converter, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_unknown_unit_asks_api(self):
+        """A learned density can't help with an unknown unit, so the API answers instead of a 500"""
+        with patch.object(converter, 'learned_density') as lookup:
+            data = converter.convert("flour", 1, "pinch", "grams", UnitConverter())
+
+        self.assertEqual(data["answer"], "from the API")
+        lookup.assert_not_called()
+
+    def test_learned_singular(self):
+        learned = Mock(grams_per_ml=0.6)
+        learned.name = "almond"
+
+        with patch.object(converter, 'learned_density', return_value=learned):
+            data = converter.convert("almonds", 1, "ml", "grams", UnitConverter())
+
+        self.assertAlmostEqual(data["targetAmount"], 0.6)
+        self.api.get.assert_not_called()
@@ -0,0 +1,94 @@
+"""Recipe dump ingestion tests."""
+
+#to run these tests:
+#
+#    python -m unittest test_ingest.py
+
+import io
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from ingest import validate_recipe, ingest, IngestReport
+
+
+def make_recipe(api_id):
+    return {"id": api_id, "title": f"recipe {api_id}", "sourceUrl": f"http://example.com/{api_id}",
+            "extendedIngredients": [{"name": "tomato"}]}
+
+
+class IngestTestCase(TestCase):
+    """Test streaming a dump into batches."""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "recipes.jsonl")
+        self.batches = []
+
+        with open(self.path, "w") as f:
+            for api_id in range(1, 6):
+                f.write(json.dumps(make_recipe(api_id)) + "\n")
+            f.write("not json\n")
+            f.write(json.dumps([make_recipe(6), {"id": 7, "title": ""}]) + "\n")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def run_ingest(self, **kwargs):
+        return ingest(self.path, batch_size=2, store=self.batches.append, report=IngestReport(io.StringIO()), **kwargs)
+
+    def test_validate(self):
+        self.assertIsNone(validate_recipe(make_recipe(1)))
+        self.assertEqual(validate_recipe({"id": "1", "title": "x", "sourceUrl": "y"}), "bad id")
+        self.assertEqual(validate_recipe({"id": 1, "title": " ", "sourceUrl": "y"}), "missing title")
+        self.assertEqual(validate_recipe({"id": 1, "title": "x"}), "missing sourceUrl")
+
+    def test_validate_stored_fields(self):
+        """Records that would fail while being stored are rejected on their own"""
+        def recipe(**fields):
+            return dict(make_recipe(1), **fields)
+
+        self.assertEqual(validate_recipe(recipe(extendedIngredients=["salt"])), "bad extendedIngredients")
+        self.assertEqual(validate_recipe(recipe(extendedIngredients=[{"name": 5}])), "bad extendedIngredients")
+        self.assertEqual(validate_recipe(recipe(extendedIngredients=[{"amount": 1}])), "bad extendedIngredients")
+        self.assertEqual(validate_recipe(recipe(vegan="yes")), "bad vegan")
+        self.assertEqual(validate_recipe(recipe(vegetarian=1)), "bad vegetarian")
+        self.assertEqual(validate_recipe(recipe(sourceUrl=["http://example.com"])), "bad sourceUrl")
+        self.assertEqual(validate_recipe(recipe(image=5)), "bad image")
+        self.assertIsNone(validate_recipe(recipe(vegan=None, image=None, extendedIngredients=None)))
+
+    def test_bad_record_is_skipped(self):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(dict(make_recipe(8), extendedIngredients=["salt"])) + "\n")
+            f.write(json.dumps(make_recipe(9)) + "\n")
+
+        checkpoint = self.run_ingest()
+
+        self.assertEqual([recipe["id"] for batch in self.batches for recipe in batch], [1, 2, 3, 4, 5, 6, 9])
+        self.assertEqual(checkpoint["rejected"], 3)
+
+    def test_batches(self):
+        checkpoint = self.run_ingest()
+
+        self.assertEqual([[recipe["id"] for recipe in batch] for batch in self.batches], [[1, 2], [3, 4], [5, 6]])
+        self.assertEqual(checkpoint["ingested"], 6)
+        self.assertEqual(checkpoint["rejected"], 2)
+        self.assertEqual(checkpoint["position"], os.path.getsize(self.path))
+
+    def test_resume(self):
+        self.run_ingest()
+        with open(self.path, "a") as f:
+            f.write(json.dumps(make_recipe(8)) + "\n")
+
+        self.batches = []
+        checkpoint = self.run_ingest()
+
+        self.assertEqual(self.batches, [[make_recipe(8)]])
+        self.assertEqual(checkpoint["ingested"], 7)
+
+    def test_restart(self):
+        self.run_ingest()
+        self.batches = []
+
+        self.assertEqual(self.run_ingest(restart=True)["ingested"], 6)
@@ -0,0 +1,96 @@
+"""Ingredient autocomplete tests."""
+
+#to run these tests:
+#
+#    python -m unittest test_ingredients.py
+
+from unittest import TestCase
+
+from ingredients import IngredientIndex, bounded_prefix_distance, word_forms
+
+NAMES = ["tomatoes", "tomato paste", "tomato sauce", "bell pepper", "black pepper", "peppers", "broccoli", "onion",
+         "green onions", "berries"]
+
+
+class PrefixDistanceTestCase(TestCase):
+    """Test the bounded prefix edit distance."""
+
+    def test_prefix_is_free(self):
+        self.assertEqual(bounded_prefix_distance("broc", "broccoli", 1), 0)
+
+    def test_typo(self):
+        self.assertEqual(bounded_prefix_distance("brocoli", "broccoli", 1), 1)
+
+    def test_bound(self):
+        self.assertEqual(bounded_prefix_distance("bxyz", "broccoli", 1), 2)
+
+
+class IngredientIndexTestCase(TestCase):
+    """Test ingredient suggestions."""
+
+    def setUp(self):
+        self.index = IngredientIndex(NAMES)
+
+    def test_prefix(self):
+        self.assertEqual(self.index.suggest("Tom"), ["tomatoes", "tomato paste", "tomato sauce"])
+
+    def test_word_prefix(self):
+        self.assertEqual(self.index.suggest("pepp"), ["peppers", "bell pepper", "black pepper"])
+
+    def test_fuzzy(self):
+        self.assertEqual(self.index.suggest("brocoli"), ["broccoli"])
+
+    def test_popularity(self):
+        self.index.record(["tomato paste", "tomato paste", "not an ingredient"])
+
+        self.assertEqual(self.index.suggest("tom", limit=1), ["tomato paste"])
+        self.assertNotIn("not an ingredient", self.index.popularity)
+
+    def test_no_match(self):
+        self.assertEqual(self.index.suggest("xyzzy"), [])
+        self.assertEqual(self.index.suggest(" "), [])
+
+    def test_vocabulary_file(self):
+        index = IngredientIndex.from_file()
+        self.assertIn("bell pepper", index.vocabulary)
+
+
+class CanonicalizeTestCase(TestCase):
+    """Test ingredient search canonicalization."""
+
+    def setUp(self):
+        self.index = IngredientIndex(NAMES)
+
+    def test_word_forms(self):
+        self.assertEqual(word_forms("berry"), ["berry", "berries", "berrys"])
+        self.assertEqual(word_forms("tomatoes"), ["tomatoes", "tomato", "tomatoe"])
+
+    def test_plurals(self):
+        self.assertEqual(self.index.canonical_name("Tomato"), "tomatoes")
+        self.assertEqual(self.index.canonical_name("onions"), "onion")
+        self.assertEqual(self.index.canonical_name("bell peppers"), "bell pepper")
+        self.assertEqual(self.index.canonical_name("berry"), "berries")
+
+    def test_synonyms(self):
+        self.assertEqual(self.index.canonical_name("Scallions"), "green onions")
+        #targets missing from the vocabulary are dropped
+        self.assertNotIn("aubergine", self.index.synonyms)
+
+    def test_unknown(self):
+        self.assertEqual(self.index.canonical_name("  Dragon  Fruit "), "dragon fruit")
+
+    def test_canonicalize(self):
+        self.assertEqual(self.index.canonicalize("Tomato, onion"), "onion,tomatoes")
+        self.assertEqual(self.index.canonicalize("onions,+tomatoes ,tomato,"), "onion,tomatoes")
+
+    def test_stats(self):
+        self.index.canonicalize("Tomato, onion")
+        self.index.canonicalize("onions,+tomatoes")
+        self.index.canonicalize("broccoli")
+
+        self.assertEqual(self.index.stats.summary(), {
+            "searches": 3,
+            "distinct_raw_keys": 3,
+            "distinct_canonical_keys": 2,
+            "collapse_ratio": 1.5,
+        })
@@ -0,0 +1,97 @@
+"""Local recipe matcher tests."""
+
+#to run these tests:
+#
+#    python -m unittest test_matcher.py
+
+import random
+import time
+from unittest import TestCase
+
+from matcher import RecipeMatcher
+
+ROWS = [
+    (1, "Tomato Soup", "soup.jpg", "tomatoes"),
+    (1, "Tomato Soup", "soup.jpg", "onion"),
+    (1, "Tomato Soup", "soup.jpg", "garlic"),
+    (2, "Salsa", "salsa.jpg", "tomatoes"),
+    (2, "Salsa", "salsa.jpg", "onion"),
+    (2, "Salsa", "salsa.jpg", "cilantro"),
+    (2, "Salsa", "salsa.jpg", "jalapeno"),
+    (3, "Garlic Bread", "bread.jpg", "garlic"),
+    (3, "Garlic Bread", "bread.jpg", "bread"),
+]
+
+
+class RecipeMatcherTestCase(TestCase):
+    """Test matching recipes by ingredient."""
+
+    def setUp(self):
+        self.matcher = RecipeMatcher(min_coverage=0.5)
+        self.matcher.load(ROWS)
+
+    def test_match(self):
+        matches = self.matcher.match(["tomatoes", "onion"], number=5)
+
+        self.assertEqual([match["id"] for match in matches], [1, 2])
+        self.assertEqual(matches[0]["usedIngredientCount"], 2)
+        self.assertEqual(matches[0]["missedIngredientCount"], 1)
+        self.assertEqual(matches[0]["missedIngredients"], [{"name": "garlic"}])
+        self.assertEqual(matches[1]["title"], "Salsa")
+
+    def test_ranking(self):
+        most_used = self.matcher.match(["garlic", "onion", "tomatoes"], number=3)
+        fewest_missing = self.matcher.match(["garlic", "onion", "tomatoes"], number=3, ranking=2)
+
+        self.assertEqual([match["id"] for match in most_used], [1, 2, 3])
+        self.assertEqual([match["id"] for match in fewest_missing], [1, 3, 2])
+
+    def test_unused(self):
+        match = self.matcher.match(["bread", "saffron"], number=1)[0]
+
+        self.assertEqual(match["id"], 3)
+        self.assertEqual(match["unusedIngredients"], [{"name": "saffron"}])
+
+    def test_add_replaces(self):
+        self.matcher.add(3, "Garlic Bread", "bread.jpg", ["bread", "butter"])
+
+        self.assertEqual(self.matcher.match(["garlic"], number=5)[0]["id"], 1)
+        self.assertEqual(len(self.matcher), 3)
+
+    def test_find(self):
+        self.assertEqual(len(self.matcher.find(["tomatoes", "onion"], number=2)), 2)
+
+        #too few recipes, or results using too few of the ingredients, go upstream
+        self.assertIsNone(self.matcher.find(["tomatoes", "onion"], number=3))
+        self.assertIsNone(self.matcher.find(["bread", "saffron", "paprika"], number=1))
+        self.assertIsNone(self.matcher.find([], number=1))
+
+
+class MatchCostTestCase(TestCase):
+    """Test that a search costs as much as its posting lists, not the whole catalog."""
+
+    def test_large_catalog(self):
+        rng = random.Random(0)
+        names = [f"ingredient {number}" for number in range(2000)]
+        rows = []
+        for api_id in range(1, 200001):
+            recipe = rng.sample(names, 4) + (["salt"] if rng.random() < 0.4 else [])
+            rows.extend((api_id, f"Recipe {api_id}", "", name) for name in recipe)
+
+        matcher = RecipeMatcher()
+        matcher.load(rows)
+
+        started = time.perf_counter()
+        common = matcher.match(["salt"], number=10)
+        rare = matcher.match(["ingredient 7", "ingredient 8"], number=10)
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(len(common), 10)
+        self.assertEqual(len(rare), 10)
+        self.assertLess(elapsed, 0.5)
+
+        #adding one recipe only touches the posting lists of its ingredients
+        started = time.perf_counter()
+        matcher.add(200001, "Salted Bread", "", ["salt", "bread"])
+        self.assertLess(time.perf_counter() - started, 0.05)
+        self.assertEqual(matcher.match(["bread", "salt"], number=1)[0]["id"], 200001)
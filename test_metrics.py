@@ -0,0 +1,138 @@
+"""Instrumentation tests."""
+
+#to run these tests:
+#
+#    python -m unittest test_metrics.py
+
+import os
+import tempfile
+from unittest import TestCase
+
+from flask import Flask
+from sqlalchemy import create_engine
+
+import metrics
+from metrics import (Histogram, Counter, count_queries, assert_max_queries, connect_metrics,
+                     merge_snapshots, render_prometheus, collect, write_snapshot)
+
+
+class HistogramTestCase(TestCase):
+    """Test metric types."""
+
+    def test_buckets(self):
+        histogram = Histogram('test_seconds', "test", (0.1, 1, float('inf')), ('endpoint',))
+        histogram.observe(0.05, 'home')
+        histogram.observe(0.5, 'home')
+        histogram.observe(5, 'home')
+
+        self.assertEqual(histogram.values[('home',)], [1, 1, 1, 5.55])
+
+    def test_counter(self):
+        counter = Counter('test_total', "test", ('endpoint',))
+        counter.inc('home')
+        counter.inc('home', amount=2)
+
+        self.assertEqual(counter.values, {('home',): 3})
+
+
+class QueryCountingTestCase(TestCase):
+    """Test counting SQL statements."""
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+
+    def test_count_queries(self):
+        with count_queries() as statements:
+            self.engine.execute("SELECT 1")
+            self.engine.execute("SELECT 2")
+
+        self.assertEqual(statements, ["SELECT 1", "SELECT 2"])
+
+    def test_assert_max_queries(self):
+        with assert_max_queries(1):
+            self.engine.execute("SELECT 1")
+
+        with self.assertRaises(AssertionError):
+            with assert_max_queries(1):
+                self.engine.execute("SELECT 1")
+                self.engine.execute("SELECT 2")
+
+    def test_per_request_stats(self):
+        app = Flask(__name__)
+        app.config['SLOW_QUERY_MS'] = 0
+        self.addCleanup(setattr, metrics, '_slow_query_seconds', metrics._slow_query_seconds)
+        connect_metrics(app)
+
+        @app.route('/two-queries')
+        def two_queries():
+            self.engine.execute("SELECT 1")
+            self.engine.execute("SELECT 2")
+            return "ok"
+
+        app.test_client().get('/two-queries')
+
+        counts = metrics.sql_queries.values[('two_queries',)]
+        self.assertEqual(counts[-1], 2)
+        self.assertEqual(metrics.slow_queries.values[('two_queries',)], 2)
+
+
+class ExpositionTestCase(TestCase):
+    """Test merging worker snapshots and the /metrics endpoint."""
+
+    def make_snapshot(self, pid, requests, queue):
+        return {"pid": pid, "metrics": {
+            "requests_total": {"kind": 'counter', "help": "Requests", "labels": ['endpoint'], "buckets": [],
+                               "values": [[['home'], requests]]},
+            "latency_seconds": {"kind": 'histogram', "help": "Latency", "labels": [], "buckets": [0.1, float('inf')],
+                                "values": [[[], [1, 1, 0.6]]]},
+            "queue_size": {"kind": 'gauge', "help": "Queue", "labels": [], "buckets": [], "values": [[[], queue]]},
+        }}
+
+    def test_merge_snapshots(self):
+        #a pid that can't be running, so its gauges are dropped
+        merged = merge_snapshots([self.make_snapshot(os.getpid(), 2, 5), self.make_snapshot(2 ** 22 + 1, 3, 50)])
+
+        self.assertEqual(merged["requests_total"]["values"], {('home',): 5})
+        self.assertEqual(merged["latency_seconds"]["values"], {(): [2, 2, 1.2]})
+        self.assertEqual(merged["queue_size"]["values"], {(): 5})
+
+    def test_render_prometheus(self):
+        body = render_prometheus(merge_snapshots([self.make_snapshot(os.getpid(), 2, 5)]))
+
+        self.assertIn('# TYPE requests_total counter\nrequests_total{endpoint="home"} 2.0\n', body)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1\n', body)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 2\n', body)
+        self.assertIn('latency_seconds_sum 0.6\n', body)
+        self.assertIn('latency_seconds_count 2\n', body)
+        self.assertIn('queue_size 5.0\n', body)
+
+    def test_collect_from_dir(self):
+        with tempfile.TemporaryDirectory() as metrics_dir:
+            with open(os.path.join(metrics_dir, 'other.json'), 'w') as f:
+                f.write('{"pid": 1, "metrics": {"ticks_total": {"kind": "counter", "help": "Ticks", '
+                        '"labels": [], "buckets": [], "values": [[[], 4]]}}}')
+            write_snapshot(metrics_dir)
+
+            merged = collect(metrics_dir)
+
+        self.assertEqual(merged["ticks_total"]["values"], {(): 4})
+        self.assertIn("http_request_duration_seconds", merged)
+
+    def test_metrics_route(self):
+        app = Flask(__name__)
+        app.config['METRICS_TOKEN'] = 'secret'
+        connect_metrics(app)
+
+        @app.route('/hello')
+        def hello():
+            return "hello"
+
+        client = app.test_client()
+        client.get('/hello')
+
+        self.assertEqual(client.get('/metrics').status_code, 401)
+
+        resp = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.content_type.startswith('text/plain; version=0.0.4'))
+        self.assertIn('http_request_duration_seconds_count{endpoint="hello",method="GET",status="200"}', resp.get_data(as_text=True))
@@ -0,0 +1,63 @@
+"""Migration runner tests."""
+
+#to run these tests:
+#
+#    python -m unittest test_migrate.py
+
+import os
+from unittest import TestCase
+
+from sqlalchemy import inspect, text
+
+from models import db
+
+os.environ['DATABASE_URL'] = "postgresql:///usemyfood_test"
+
+from app import app
+from migrate import run_migrations, available_migrations
+
+
+class MigrateTestCase(TestCase):
+    """Test that the migrations build the schema the models describe."""
+
+    def setUp(self):
+        self.drop_everything()
+
+    def tearDown(self):
+        #leave the database as the other test modules expect it
+        self.drop_everything()
+        db.create_all()
+
+    def drop_everything(self):
+        db.session.remove()
+        db.drop_all()
+        with db.engine.begin() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS schema_migrations"))
+
+    def assertMatchesModels(self):
+        inspector = inspect(db.engine)
+
+        for table in db.metadata.sorted_tables:
+            columns = {column['name']: column['nullable'] for column in inspector.get_columns(table.name)}
+            self.assertEqual(columns, {column.name: column.nullable for column in table.columns}, table.name)
+
+            indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            self.assertLessEqual({index.name for index in table.indexes}, indexes, table.name)
+
+            constraints = {constraint['name'] for constraint in inspector.get_unique_constraints(table.name)}
+            expected = {constraint.name for constraint in table.constraints if isinstance(constraint, db.UniqueConstraint) and constraint.name}
+            self.assertLessEqual(expected, constraints, table.name)
+
+    def test_empty_database(self):
+        applied = run_migrations()
+
+        self.assertEqual(applied, [version for version, path in available_migrations()])
+        self.assertMatchesModels()
+        self.assertEqual(run_migrations(), [])
+
+    def test_adopt_create_all(self):
+        """A database built by db.create_all() from the current models can be brought under the runner"""
+        db.create_all()
+
+        self.assertEqual(len(run_migrations()), len(available_migrations()))
+        self.assertMatchesModels()
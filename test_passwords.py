@@ -0,0 +1,64 @@
+"""Password hashing tests."""
+
+#to run these tests:
+#
+#    python -m unittest test_passwords.py
+
+import time
+from unittest import TestCase
+
+from passwords import PasswordHasher, HashingBusyError, hash_rounds
+
+
+def slow_hash(password, rounds):
+    time.sleep(0.5)
+    return "hashed"
+
+
+class PasswordHasherTestCase(TestCase):
+    """Test hashing on a pool with a concurrency limit."""
+
+    def test_hash_and_check(self):
+        for pool in ('inline', 'process'):
+            hasher = PasswordHasher(rounds=4, pool=pool, workers=1)
+            hashed = hasher.hash("password")
+
+            self.assertEqual(hash_rounds(hashed), 4)
+            self.assertTrue(hasher.check(hashed, "password"))
+            self.assertFalse(hasher.check(hashed, "wrongpassword"))
+
+    def test_empty_password(self):
+        hasher = PasswordHasher(rounds=4, pool='inline')
+
+        with self.assertRaises(ValueError):
+            hasher.hash(None)
+
+    def test_needs_rehash(self):
+        hasher = PasswordHasher(rounds=4, pool='inline')
+        hashed = hasher.hash("password")
+        self.assertFalse(hasher.needs_rehash(hashed))
+
+        hasher.rounds = 5
+        self.assertTrue(hasher.needs_rehash(hashed))
+
+    def test_busy(self):
+        hasher = PasswordHasher(rounds=4, pool='inline', max_concurrent=1, max_wait=0.01)
+        hasher._slots.acquire()
+
+        with self.assertRaises(HashingBusyError):
+            hasher.hash("password")
+        self.assertEqual(hasher.rejected, 1)
+
+        hasher._slots.release()
+        self.assertTrue(hasher.hash("password"))
+
+    def test_timed_out_hash_keeps_its_slot(self):
+        """A hash that took too long holds its slot until it finishes, so abandoned jobs can't pile up"""
+        hasher = PasswordHasher(pool='process', workers=1, max_concurrent=1, max_wait=0.1)
+
+        with self.assertRaises(HashingBusyError):
+            hasher._run(slow_hash, "password", 4)
+        self.assertFalse(hasher._slots.acquire(timeout=0.05))
+
+        #the slot comes back once the abandoned hash is done
+        self.assertTrue(hasher._slots.acquire(timeout=5))
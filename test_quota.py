@@ -0,0 +1,86 @@
+"""Upstream rate limit and quota tests."""
+
+#to run these tests:
+#
+#    python -m unittest test_quota.py
+
+import os
+import sqlite3
+import tempfile
+import time
+from unittest import TestCase
+
+from quota import QuotaLimiter, SQLiteQuotaStore, INTERACTIVE, BACKGROUND
+
+
+class QuotaLimiterTestCase(TestCase):
+    """Test the token bucket and daily quota tracking."""
+
+    def test_burst(self):
+        limiter = QuotaLimiter(rate=0.001, burst=3, max_wait=0)
+
+        self.assertEqual([limiter.acquire() for i in range(4)], [True, True, True, False])
+        self.assertEqual(limiter.throttled, 1)
+
+    def test_background_leaves_room_for_users(self):
+        limiter = QuotaLimiter(rate=0.001, burst=4, max_wait=0, background_share=0.5)
+
+        self.assertEqual([limiter.acquire(BACKGROUND) for i in range(3)], [True, True, False])
+        self.assertTrue(limiter.acquire(INTERACTIVE))
+
+    def test_waits_for_refill(self):
+        limiter = QuotaLimiter(rate=100, burst=1, max_wait=1)
+
+        self.assertTrue(limiter.acquire())
+        self.assertTrue(limiter.acquire())
+
+    def test_quota_headers(self):
+        limiter = QuotaLimiter(quota_reserve=10, max_wait=0)
+
+        limiter.record({"X-API-Quota-Left": "50", "X-API-Quota-Used": "100.5"}, 200)
+        self.assertEqual(limiter.status()["quota_used"], 100.5)
+        self.assertFalse(limiter.near_limit())
+
+        limiter.record({"X-API-Quota-Left": "5"}, 200)
+        self.assertTrue(limiter.near_limit())
+        self.assertFalse(limiter.acquire(BACKGROUND))
+        self.assertTrue(limiter.acquire(INTERACTIVE))
+
+    def test_quota_exhausted(self):
+        limiter = QuotaLimiter(max_wait=0)
+        limiter.record({}, 402)
+
+        self.assertFalse(limiter.acquire(INTERACTIVE))
+
+    def test_new_day_resets_quota(self):
+        limiter = QuotaLimiter(max_wait=0)
+        limiter.record({}, 402)
+        limiter.store.transact(lambda state: state.update(day="2000-01-01"))
+
+        self.assertTrue(limiter.acquire())
+
+    def test_shared_store(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "quota.sqlite3")
+            worker1 = QuotaLimiter(rate=0.001, burst=2, store=SQLiteQuotaStore(path), max_wait=0)
+            worker2 = QuotaLimiter(rate=0.001, burst=2, store=SQLiteQuotaStore(path), max_wait=0)
+
+            self.assertTrue(worker1.acquire())
+            self.assertTrue(worker2.acquire())
+            self.assertFalse(worker1.acquire())
+
+    def test_status_doesnt_take_write_lock(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "quota.sqlite3")
+            limiter = QuotaLimiter(burst=2, store=SQLiteQuotaStore(path))
+            limiter.record({"X-API-Quota-Left": "5"}, 200)
+
+            #another worker is in the middle of taking a token
+            other = sqlite3.connect(path, isolation_level=None)
+            other.execute("BEGIN IMMEDIATE")
+            started = time.monotonic()
+
+            self.assertTrue(limiter.near_limit())
+            self.assertLess(time.monotonic() - started, 1)
+            other.execute("ROLLBACK")
+            other.close()
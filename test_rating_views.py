@@ -9,6 +9,7 @@ import os
 from unittest import TestCase
 
 from models import db, connect_db, User, Recipe, Favorites, Rating
+from metrics import assert_max_queries
 from bs4 import BeautifulSoup
 
 os.environ['DATABASE_URL'] = "postgresql:///usemyfood_test"
@@ -88,7 +89,9 @@ class RatingViewTestCase(TestCase):
             with c.session_transaction() as sess:
                 sess[CURR_USER_KEY] = self.testuser_id
 
-            resp = c.get(f"/users/{self.testuser_id}/ratings")
+            #the user and their ratings with recipes, however many ratings there are
+            with assert_max_queries(2):
+                resp = c.get(f"/users/{self.testuser_id}/ratings")
 
             self.assertEqual(resp.status_code, 200)
 
@@ -190,6 +193,21 @@ class RatingViewTestCase(TestCase):
             ratings = Rating.query.all()
             self.assertEqual(len(ratings), 4)
     
+    def test_add_duplicate_rating(self):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            resp = c.post('/ratings/add_rating', content_type='multipart/form-data', data={"rating": 1.5, "review": "testreview", "recipe_id": self.r1_id}, follow_redirects=True)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("You have already rated this recipe", str(resp.data))
+
+            #the existing rating is kept and no new one is added
+            ratings = Rating.query.all()
+            self.assertEqual(len(ratings), 3)
+            self.assertEqual(Rating.query.get(self.rate3_id).review, "I hated it")
+
     def test_unauthorized_add_rating(self):
         with self.client as c:
             ratings = Rating.query.all()
@@ -263,12 +281,24 @@ class RatingViewTestCase(TestCase):
             self.assertNotIn("testuser's Ratings:", str(resp.data))
             self.assertIn("Access unauthorized", str(resp.data))
     
-    def test_get_all_rated_recipes(self):
-        """Should return a list of all api_ids for recipes that have been rated"""
+    def test_get_rated_recipes(self):
+        """Should return which of the requested api_ids have been rated"""
         with self.client as c:
-            resp = c.get('/ratings/all_recipe_ids')
+            resp = c.get('/ratings/rated?ids=1234,1357,5678,42')
 
             self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.json, {"ids": [1234, 5678]})
+
+            #revalidating with the same ETag sends nothing back
+            etag = resp.headers['ETag']
+            resp = c.get('/ratings/rated?ids=1234,1357,5678,42', headers={"If-None-Match": etag})
+            self.assertEqual(resp.status_code, 304)
+
+    def test_get_rated_recipes_invalid_ids(self):
+        with self.client as c:
+            resp = c.get('/ratings/rated?ids=1234,abc')
+
+            self.assertEqual(resp.status_code, 400)
 
     def test_show_recipe_ratings(self):
 
@@ -7,9 +7,14 @@
 
 import os
 from unittest import TestCase
+from unittest.mock import patch
 from sqlalchemy import exc
 
-from models import db, User, Favorites, Rating, Recipe, toggle_favorites
+from models import db, User, Favorites, Rating, Recipe, RecipeIngredient, toggle_favorites, toggle_favorites_bulk, reconcile_rating_aggregates, end_transaction
+from metrics import count_queries, assert_max_queries
+import catalog
+from catalog import get_recipes, upsert_recipes, save_ingredients
+from matcher import recipe_matcher
 
 
 #We will connect to a different database for testing before importing the app
@@ -165,15 +170,28 @@ class RecipeModelTestCase(TestCase):
 
     def test_favorite_model(self):
         """Does the favorites model work?"""
+        r2 = Recipe.add_recipe("testtest2", "www.test2.com", "test2.jpg", 98765, False, False)
+        db.session.commit()
+
         f = Favorites(
             user_id = self.uid1,
-            recipe_id = self.rid1
+            recipe_id = r2.id
         )
         db.session.add(f)
         db.session.commit()
 
         self.assertEqual(f.user_id, self.u1.id)
-        self.assertEqual(f.recipe_id, self.r1.id)
+        self.assertEqual(f.recipe_id, r2.id)
+
+    def test_duplicate_favorite(self):
+        """A user can only favorite a recipe once"""
+        f = Favorites(
+            user_id = self.uid1,
+            recipe_id = self.rid1
+        )
+        with self.assertRaises(exc.IntegrityError) as context:
+            db.session.add(f)
+            db.session.commit()
 
     def test_user_favorites(self):
         """Are the user and favorites models connected"""
@@ -191,23 +209,66 @@ class RecipeModelTestCase(TestCase):
         self.assertEqual(self.r1.favorite[0], self.t_fav)
     
     
+    def test_toggle_favorites(self):
+        """Toggling removes an existing favorite and adds it back"""
+        self.assertEqual(toggle_favorites(self.rid1, self.uid1), "unfavorited")
+        self.assertEqual(Favorites.query.filter_by(user_id=self.uid1).count(), 0)
+
+        self.assertEqual(toggle_favorites(self.rid1, self.uid1), "favorited")
+        self.assertEqual(Favorites.query.filter_by(user_id=self.uid1).count(), 1)
+
+    def test_toggle_favorites_bulk(self):
+        r2 = Recipe.add_recipe("testtest2", "www.test2.com", "test2.jpg", 98765, False, False)
+        db.session.commit()
+
+        result = toggle_favorites_bulk([self.rid1, r2.id, r2.id], self.uid1)
+
+        self.assertEqual(result, {"favorited": [r2.id], "unfavorited": [self.rid1], "skipped": []})
+        favorites = Favorites.query.filter_by(user_id=self.uid1).all()
+        self.assertEqual([f.recipe_id for f in favorites], [r2.id])
+
+    def test_toggle_favorites_bulk_unknown_recipe(self):
+        """Ids of recipes that don't exist are skipped and the rest of the batch still applies"""
+        r2 = Recipe.add_recipe("testtest2", "www.test2.com", "test2.jpg", 98765, False, False)
+        db.session.commit()
+
+        result = toggle_favorites_bulk([r2.id, 424242], self.uid1)
+
+        self.assertEqual(result, {"favorited": [r2.id], "unfavorited": [], "skipped": [424242]})
+        self.assertEqual(Favorites.query.filter_by(user_id=self.uid1, recipe_id=r2.id).count(), 1)
+
     ###############################
     # Ratings tests
     ###
 
     def test_ratings_model(self):
         """Does the ratings model work?"""
+        r2 = Recipe.add_recipe("testtest2", "www.test2.com", "test2.jpg", 98765, False, False)
+        db.session.commit()
+
         r = Rating(
             rating=5,
             user_id=self.uid1,
-            recipe_id=self.rid1,
+            recipe_id=r2.id,
             review="This was great!"
         )
         db.session.add(r)
         db.session.commit()
 
         self.assertEqual(r.user_id, self.u1.id)
-        self.assertEqual(r.recipe_id, self.r1.id)
+        self.assertEqual(r.recipe_id, r2.id)
+
+    def test_duplicate_rating(self):
+        """A user can only rate a recipe once"""
+        r = Rating(
+            rating=5,
+            user_id=self.uid1,
+            recipe_id=self.rid1,
+            review="This was great!"
+        )
+        with self.assertRaises(exc.IntegrityError) as context:
+            db.session.add(r)
+            db.session.commit()
     
     def test_invalid_rating_r(self):
         r = Rating(rating=None,
@@ -230,9 +291,12 @@ class RecipeModelTestCase(TestCase):
             db.session.commit()
     
     def test_no_review(self):
+        r2 = Recipe.add_recipe("testtest2", "www.test2.com", "test2.jpg", 98765, False, False)
+        db.session.commit()
+
         r = Rating(rating=3,
                    user_id=self.uid1,
-                   recipe_id=self.rid1,
+                   recipe_id=r2.id,
                    review=None
                    )
         db.session.add(r)
@@ -260,7 +324,101 @@ class RecipeModelTestCase(TestCase):
         self.assertEqual(
             self.r1.ratings[0].review, "It tasted alright, needs more salt")
 
+    #############################
+    # Rating aggregate tests
+    ###
+
+    def test_rating_aggregates(self):
+        """Adding and editing ratings keeps the recipe's aggregates current"""
+        u2 = User.signup("test_user2", "fake2@email.com", "password")
+        db.session.commit()
+
+        db.session.add(Rating(rating=5, user_id=u2.id, recipe_id=self.rid1))
+        db.session.commit()
+
+        r = Recipe.query.get(self.rid1)
+        self.assertEqual(r.rating_count, 2)
+        self.assertEqual(r.rating_sum, 8.5)
+        self.assertEqual(r.rating_mean, 4.25)
 
+        t_rating = Rating.query.get(self.trid)
+        t_rating.rating = 1.5
+        db.session.commit()
+
+        r = Recipe.query.get(self.rid1)
+        self.assertEqual(r.rating_count, 2)
+        self.assertEqual(r.rating_mean, 3.25)
+
+    def test_reconcile_rating_aggregates(self):
+        db.session.execute("UPDATE recipes SET rating_count = 10, rating_sum = 1")
+        db.session.commit()
 
+        self.assertEqual(reconcile_rating_aggregates(), 1)
 
+        r = Recipe.query.get(self.rid1)
+        self.assertEqual(r.rating_count, 1)
+        self.assertEqual(r.rating_mean, 3.5)
+
+    def test_reconcile_rating_mean(self):
+        """A drifted mean is fixed even when the count and sum are right"""
+        db.session.execute("UPDATE recipes SET rating_mean = 1")
+        db.session.commit()
+
+        self.assertEqual(reconcile_rating_aggregates(), 1)
+        self.assertEqual(Recipe.query.get(self.rid1).rating_mean, 3.5)
+        self.assertEqual(reconcile_rating_aggregates(), 0)
+
+    #############################
+    # Catalog tests
+    ###
 
+    def test_get_known_recipes(self):
+        """Recipes already in the DB are returned without calling the API"""
+        recipes = get_recipes([56789, "56789"])
+
+        self.assertEqual(len(recipes), 1)
+        self.assertEqual(recipes[0].id, self.rid1)
+
+    def test_get_known_and_missing_recipes(self):
+        """Saving the missing recipes doesn't leave the known ones to be reloaded one query at a time"""
+        upsert_recipes([{"name": f"known {api_id}", "recipe_url": "www.test.com", "image_url": "test.jpg",
+                         "api_id": api_id, "vegetarian": False, "vegan": False} for api_id in range(1, 6)])
+        fetched = [{"id": api_id, "title": f"fetched {api_id}", "extendedIngredients": [{"name": "salt"}]}
+                   for api_id in (6, 7)]
+
+        with patch.object(catalog.spoonacular, 'get', return_value=fetched):
+            with assert_max_queries(5):
+                recipes = get_recipes([1, 6, 2, 3, 7, 4, 5])
+                names = [recipe.name for recipe in recipes]
+
+        self.assertEqual(names, ["known 1", "fetched 6", "known 2", "known 3", "fetched 7", "known 4", "known 5"])
+
+    def test_upsert_recipes(self):
+        upsert_recipes([
+            {"name": "renamed", "recipe_url": "www.test.com", "image_url": "test.jpg", "api_id": 56789, "vegetarian": True, "vegan": False},
+            {"name": "new", "recipe_url": "www.new.com", "image_url": "new.jpg", "api_id": 11111, "vegetarian": False, "vegan": False},
+        ])
+
+        self.assertEqual(Recipe.query.count(), 2)
+        self.assertEqual(Recipe.query.filter(Recipe.api_id == 56789).one().name, "renamed")
+
+    def test_save_ingredients(self):
+        """Ingredients are stored under their vocabulary names and indexed for local matching"""
+        recipe = {"id": 56789, "title": "testtest", "image": "test.jpg",
+                  "extendedIngredients": [{"name": "Tomato"}, {"name": "tomatoes"}, {"name": "onions"}]}
+        save_ingredients([recipe])
+        save_ingredients([recipe])
+
+        names = [ri.ingredient for ri in RecipeIngredient.query.order_by(RecipeIngredient.ingredient).all()]
+        self.assertEqual(names, ["onion", "tomatoes"])
+        self.assertEqual(recipe_matcher.match(["tomatoes"], 1)[0]["id"], 56789)
+
+    def test_end_transaction(self):
+        """The connection goes back to the pool and loaded recipes stay usable without queries"""
+        recipe = Recipe.query.filter(Recipe.api_id == 56789).one()
+        end_transaction()
+
+        with count_queries() as statements:
+            self.assertEqual(recipe.name, "testtest")
+        self.assertEqual(statements, [])
+        self.assertEqual(db.engine.pool.checkedout(), 0)
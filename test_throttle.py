@@ -0,0 +1,169 @@
+"""Login throttle tests."""
+
+#to run these tests:
+#
+#    python -m unittest test_throttle.py
+
+import os
+import tempfile
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+import throttle
+from throttle import LoginThrottle, MemoryThrottleStore, SQLiteThrottleStore, roll, estimate
+
+
+class SlidingWindowTestCase(TestCase):
+    """Test the sliding window arithmetic."""
+
+    def test_previous_window_fades(self):
+        state = {}
+        roll(state, 100, 100)
+        state['current'] = 10
+
+        roll(state, 250, 100)
+        self.assertEqual(state, {"start": 200, "current": 0, "previous": 10})
+        self.assertEqual(estimate(state, 250, 100), 5)
+
+        #a gap of a whole window forgets the old attempts
+        roll(state, 450, 100)
+        self.assertEqual(state["previous"], 0)
+
+
+class InterleavingStore(SQLiteThrottleStore):
+    """Store that lets another worker in once an attempt has used two transactions, e.g. checked both keys"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.paused = threading.Event()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def transact(self, keys, update):
+        self.calls += 1
+        if self.calls > 2:
+            self.paused.set()
+            self.release.wait(5)
+        return super().transact(keys, update)
+
+
+class LoginThrottleTestCase(TestCase):
+    """Test throttling login attempts by username and IP."""
+
+    def setUp(self):
+        self.now = 1000.0
+        clock = patch.object(throttle.time, 'time', lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def make_throttle(self, store=None):
+        return LoginThrottle(max_per_user=3, max_per_ip=5, window=60, store=store or MemoryThrottleStore())
+
+    def test_per_user_limit(self):
+        login_throttle = self.make_throttle()
+        before = throttle.throttled_logins.values.get(('user',), 0)
+
+        for _ in range(3):
+            self.assertEqual(login_throttle.attempt("Alice", "1.1.1.1"), 0)
+
+        wait = login_throttle.attempt("alice ", "2.2.2.2")
+        self.assertTrue(0 < wait <= 120)
+        self.assertEqual(throttle.throttled_logins.values[('user',)], before + 1)
+        self.assertEqual(login_throttle.attempt("bob", "2.2.2.2"), 0)
+
+        #once the window has slid past, attempts are allowed again
+        self.now += wait
+        self.assertEqual(login_throttle.attempt("alice", "3.3.3.3"), 0)
+
+    def test_per_ip_limit(self):
+        login_throttle = self.make_throttle()
+
+        for number in range(5):
+            self.assertEqual(login_throttle.attempt(f"user{number}", "1.1.1.1"), 0)
+
+        self.assertTrue(login_throttle.attempt("someone", "1.1.1.1"))
+        self.assertEqual(login_throttle.attempt("someone", "2.2.2.2"), 0)
+
+    def test_rejected_attempts_not_counted(self):
+        login_throttle = self.make_throttle()
+
+        for _ in range(3):
+            login_throttle.attempt("alice", "1.1.1.1")
+        for _ in range(5):
+            self.assertTrue(login_throttle.attempt("alice", "2.2.2.2"))
+
+        #the rejected attempts didn't use up 2.2.2.2's allowance
+        for number in range(5):
+            self.assertEqual(login_throttle.attempt(f"user{number}", "2.2.2.2"), 0)
+
+    def test_limit_of_one(self):
+        login_throttle = LoginThrottle(max_per_user=1, max_per_ip=1, window=60)
+        self.assertEqual(login_throttle.attempt("alice", "1.1.1.1"), 0)
+
+        #into the next window, only the previous window's attempt is left
+        self.now += 70
+        wait = login_throttle.attempt("alice", "1.1.1.1")
+        self.assertTrue(0 < wait <= 60)
+
+        self.now += wait
+        self.assertEqual(login_throttle.attempt("alice", "1.1.1.1"), 0)
+
+    def test_reset_after_login(self):
+        login_throttle = self.make_throttle()
+
+        for _ in range(3):
+            login_throttle.attempt("alice", "1.1.1.1")
+        login_throttle.reset("alice")
+
+        self.assertEqual(login_throttle.attempt("alice", "1.1.1.1"), 0)
+
+    def test_shared_store(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'throttle.sqlite3')
+            first = self.make_throttle(SQLiteThrottleStore(path))
+            second = self.make_throttle(SQLiteThrottleStore(path))
+
+            for _ in range(3):
+                first.attempt("alice", "1.1.1.1")
+
+            self.assertTrue(second.attempt("alice", "2.2.2.2"))
+
+    def test_shared_store_interleaved(self):
+        """Two workers trying the last allowed attempt at once can't both get through"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'throttle.sqlite3')
+            first_store = InterleavingStore(path)
+            first = self.make_throttle(first_store)
+            second = self.make_throttle(SQLiteThrottleStore(path))
+
+            for _ in range(2):
+                second.attempt("alice", "1.1.1.1")
+
+            waits = {}
+
+            def first_attempt():
+                waits["first"] = first.attempt("alice", "2.2.2.2")
+                first_store.paused.set()
+
+            worker = threading.Thread(target=first_attempt)
+            worker.start()
+            first_store.paused.wait(5)
+            waits["second"] = second.attempt("alice", "3.3.3.3")
+            first_store.release.set()
+            worker.join()
+
+        self.assertEqual(sorted(wait == 0 for wait in waits.values()), [False, True])
+
+    def test_client_ip(self):
+        login_throttle = self.make_throttle()
+        request = Request(EnvironBuilder(headers={'X-Forwarded-For': '6.6.6.6, 9.9.9.9'},
+                                         environ_base={'REMOTE_ADDR': '10.0.0.1'}).get_environ())
+
+        self.assertEqual(login_throttle.client_ip(request), '10.0.0.1')
+
+        login_throttle.proxies = 1
+        self.assertEqual(login_throttle.client_ip(request), '9.9.9.9')
@@ -0,0 +1,200 @@
+"""Upstream client tests."""
+
+#to run these tests:
+#
+#    python -m unittest test_upstream.py
+
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+import requests
+from requests.adapters import BaseAdapter
+
+from upstream import SpoonacularClient, CircuitBreaker, SingleFlight, UpstreamError, CircuitOpenError, QuotaExceededError
+from quota import QuotaLimiter
+
+
+class StubAdapter(BaseAdapter):
+    """Answer every request with the next canned (status, body) pair"""
+
+    def __init__(self, responses):
+        super().__init__()
+        self.responses = list(responses)
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        status, body = self.responses.pop(0)
+
+        if isinstance(body, Exception):
+            raise body
+
+        resp = requests.Response()
+        resp.status_code = status
+        resp._content = json.dumps(body).encode('utf-8')
+        resp.request = request
+        resp.url = request.url
+        return resp
+
+    def close(self):
+        pass
+
+
+def make_client(responses, **kwargs):
+    client = SpoonacularClient(base_url="http://upstream.test", api_key="secret", **kwargs)
+    adapter = StubAdapter(responses)
+    client.session.mount('http://', adapter)
+    return client, adapter
+
+
+class CircuitBreakerTestCase(TestCase):
+    """Test the circuit breaker."""
+
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+    def test_half_open_trial(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+
+
+class SpoonacularClientTestCase(TestCase):
+    """Test the pooled API client."""
+
+    def test_get_adds_api_key_and_caches(self):
+        client, adapter = make_client([(200, {"targetAmount": 48})])
+
+        data = client.get('recipes/convert', {'sourceAmount': 1})
+        again = client.get('recipes/convert', {'sourceAmount': 1})
+
+        self.assertEqual(data, {"targetAmount": 48})
+        self.assertEqual(again, data)
+        self.assertEqual(len(adapter.requests), 1)
+        self.assertIn("apiKey=secret", adapter.requests[0].url)
+
+    def test_server_error_raises(self):
+        client, adapter = make_client([(503, {})])
+
+        with self.assertRaises(UpstreamError) as context:
+            client.get('recipes/convert', {'sourceAmount': 1})
+
+        self.assertEqual(context.exception.status, 503)
+
+    def test_circuit_opens(self):
+        client, adapter = make_client([(500, {}), (500, {})], failure_threshold=2, reset_timeout=60)
+
+        for i in range(2):
+            with self.assertRaises(UpstreamError):
+                client.get('recipes/complexSearch', {'query': i})
+
+        #the breaker is open, so no request reaches the API
+        with self.assertRaises(CircuitOpenError):
+            client.get('recipes/complexSearch', {'query': 'kale'})
+        self.assertEqual(len(adapter.requests), 2)
+
+    def test_throttled_request_serves_stale(self):
+        client, adapter = make_client([(200, {"results": ["old"]})],
+                                      limiter=QuotaLimiter(rate=0.001, burst=1, max_wait=0))
+        client.get('recipes/complexSearch', {'query': 'kale'})
+        client.cache.ttls['complexSearch'] = -1
+        client.cache.set('recipes/complexSearch', {'query': 'kale'}, {"results": ["old"]})
+
+        #the bucket is empty, so the expired answer is better than none
+        self.assertEqual(client.get('recipes/complexSearch', {'query': 'kale'}), {"results": ["old"]})
+        with self.assertRaises(QuotaExceededError):
+            client.get('recipes/complexSearch', {'query': 'chard'})
+        self.assertEqual(len(adapter.requests), 1)
+
+    def test_connection_error(self):
+        client, adapter = make_client([(None, requests.ConnectionError("refused"))])
+
+        with self.assertRaises(UpstreamError):
+            client.get('recipes/informationBulk', {'ids': '1'})
+        self.assertEqual(client.breaker.failures, 1)
+
+
+class SingleFlightTestCase(TestCase):
+    """Test coalescing identical requests."""
+
+    def test_concurrent_requests_share_one_fetch(self):
+        client, adapter = make_client([(200, {"results": []})])
+        release = threading.Event()
+        send = adapter.send
+
+        def slow_send(request, **kwargs):
+            release.wait(5)
+            return send(request, **kwargs)
+        adapter.send = slow_send
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(client.get('recipes/complexSearch', {'query': 'kale'})))
+                   for i in range(5)]
+        for thread in threads:
+            thread.start()
+
+        #wait until every other thread is parked on the leader's fetch
+        while client.flight.coalesced < 4:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [{"results": []}] * 5)
+        self.assertEqual(len(adapter.requests), 1)
+
+    def test_errors_are_shared(self):
+        flight = SingleFlight()
+
+        def fail():
+            raise UpstreamError("down")
+
+        with self.assertRaises(UpstreamError):
+            flight.do("key", fail)
+        #nothing is left in flight after a failure
+        self.assertEqual(flight.do("key", lambda: "ok"), "ok")
+
+    def test_waits_for_other_worker(self):
+        with tempfile.TemporaryDirectory() as lock_dir:
+            flight = SingleFlight(lock_dir)
+            fetched = []
+
+            #another worker holds the lock for this key
+            with open(flight.lock_path("key"), 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                result = []
+                thread = threading.Thread(target=lambda: result.append(
+                    flight.do("key", lambda: fetched.append(1), cached=lambda: "from cache")))
+                thread.start()
+                time.sleep(0.1)
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+            thread.join()
+            self.assertEqual(result, ["from cache"])
+            self.assertEqual(fetched, [])
+
+    def test_other_keys_dont_wait(self):
+        with tempfile.TemporaryDirectory() as lock_dir:
+            flight = SingleFlight(lock_dir, lock_timeout=5)
+
+            with open(flight.lock_path("key"), 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                started = time.monotonic()
+                self.assertEqual(flight.do("other key", lambda: "fetched", cached=lambda: "from cache"), "fetched")
+                self.assertLess(time.monotonic() - started, 1)
+
+            #lock files are removed once their fetch is done
+            self.assertEqual(os.listdir(lock_dir), [os.path.basename(flight.lock_path("key"))])
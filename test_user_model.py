@@ -9,6 +9,7 @@ from unittest import TestCase
 from sqlalchemy import exc 
 
 from models import db, User, Favorites, Rating, Recipe
+from passwords import password_hasher, hash_rounds
 
 #We will connect to a different database for testing before importing the app
 
@@ -103,6 +104,15 @@ class UserModelTestCase(TestCase):
     def test_wrong_password(self):
         self.assertFalse(User.authenticate(self.u1.username, "wrongpassword"))
 
+    def test_rehash_on_login(self):
+        rounds = password_hasher.rounds
+        self.addCleanup(setattr, password_hasher, 'rounds', rounds)
+        password_hasher.rounds = rounds - 1
+
+        u = User.authenticate(self.u1.username, "password")
+        self.assertEqual(hash_rounds(u.password), rounds - 1)
+        self.assertTrue(User.authenticate(self.u1.username, "password"))
+
 
     #######################
     # Signup Tests
@@ -5,14 +5,19 @@
 #      FLASK_ENV=production python -m unittest test_user_views.py
 
 import os
+import tempfile
 from unittest import TestCase
 
 from models import db, connect_db, User, Recipe, Favorites, Rating
+from auth import UserLoader
+from cache import SQLiteBackend
+from metrics import assert_max_queries
 from bs4 import BeautifulSoup
 
 os.environ['DATABASE_URL'] = "postgresql:///usemyfood_test"
 
-from app import app, CURR_USER_KEY
+from app import app, CURR_USER_KEY, favorites_cache
+from matcher import recipe_matcher
 
 db.create_all()
 
@@ -64,6 +69,41 @@ class UserViewTestCase(TestCase):
             self.assertIn("abc", str(resp.data))
             self.assertIn("delete", str(resp.data))
     
+    def test_delete_user(self):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u1_id
+
+            #load the user once so it is cached
+            resp = c.get(f'/users/{self.u1_id}')
+            self.assertEqual(resp.status_code, 200)
+
+            resp = c.post('/users/delete')
+            self.assertEqual(resp.status_code, 302)
+            self.assertIsNone(User.query.get(self.u1_id))
+
+            #a session still holding the deleted id is logged out instead of served from the cache
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u1_id
+
+            resp = c.post('/search', content_type='multipart/form-data', data={"searchRecipeTerm": "kale"})
+            self.assertEqual(resp.status_code, 401)
+
+    def test_delete_user_other_worker(self):
+        """Deleting an account clears the user cache every worker shares"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cache.sqlite3')
+            worker1 = UserLoader(60, SQLiteBackend(path, table='user_cache'))
+            worker2 = UserLoader(60, SQLiteBackend(path, table='user_cache'))
+
+            self.assertEqual(worker1.load(self.u1_id).id, self.u1_id)
+
+            User.query.filter(User.id == self.u1_id).delete()
+            db.session.commit()
+            worker2.invalidate(self.u1_id)
+
+            self.assertIsNone(worker1.load(self.u1_id))
+
     ###########################
     # Setup functions
     ###
@@ -102,7 +142,9 @@ class UserViewTestCase(TestCase):
             with c.session_transaction() as sess:
                 sess[CURR_USER_KEY] = self.testuser_id
 
-            resp = c.get(f"/users/{self.testuser_id}/favorites")
+            #the user, their favorites with recipes, and their ratings of them
+            with assert_max_queries(3):
+                resp = c.get(f"/users/{self.testuser_id}/favorites")
 
             self.assertEqual(resp.status_code, 200)
 
@@ -171,6 +213,58 @@ class UserViewTestCase(TestCase):
             #the favorite has been removed
             self.assertEqual(len(favorites), 0)
 
+    def test_favorites_state(self):
+        self.setup_recipes()
+        self.setup_favorites()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            resp = c.get('/users/curruser/favorites?ids=1234,5678')
+            self.assertEqual(resp.json, {"favIds": [1234]})
+
+            #toggling a favorite clears the cached answer
+            c.post('/users/toggle_favorite', json={"id": 6810})
+            resp = c.get('/users/curruser/favorites?ids=1234,5678')
+            self.assertEqual(resp.json, {"favIds": [1234, 5678]})
+
+    def test_search_recipes_by_ingredient(self):
+        self.setup_recipes()
+        self.setup_favorites()
+        favorites_cache.backend.clear()
+
+        #answer the search from the local catalog rather than the API
+        recipe_matcher.load([(1234, "testrecipe1", "testrecipe1.jpg", "tomatoes"),
+                             (5678, "testrecipe2", "testrecipe2.jpg", "tomatoes")])
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            resp = c.post('/ingredient-search/recipes', json={"number": 2, "ingStr": "Tomato"})
+            recipes = resp.json["recipes"]
+
+            self.assertEqual([recipe["id"] for recipe in recipes], [1234, 5678])
+            self.assertEqual(recipes[0]["title"], "testrecipe1")
+            self.assertEqual([recipe["favorited"] for recipe in recipes], [True, False])
+            self.assertEqual([recipe["rated"] for recipe in recipes], [False, False])
+
+    def test_toggle_many_favorites(self):
+        self.setup_recipes()
+        r = Recipe.query.filter(Recipe.name=="testrecipe1").one()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            resp = c.post('/users/toggle_favorites', data="not json")
+            self.assertEqual(resp.status_code, 400)
+
+            resp = c.post('/users/toggle_favorites', json={"ids": [r.id, 424242]})
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.json, {"favorited": [r.id], "unfavorited": [], "skipped": [424242]})
+
     def test_unauthenticated_favorite(self):
         self.setup_recipes()
         self.setup_favorites()
@@ -0,0 +1,183 @@
+"""Login throttling with sliding-window counters, keyed by username and by client IP.
+
+Each key keeps the attempts of the current fixed window and the one before it;
+the count used is current + previous weighted by how much of the previous
+window still overlaps the sliding window. Attempts over the limit are turned
+away before the database or bcrypt are touched, and are not counted, so a
+blocked key frees up on its own once the window has passed.
+"""
+
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from cache import SQLiteConnection
+from metrics import Counter, register
+
+DEFAULT_WINDOW = 15 * 60
+DEFAULT_MAX_KEYS = 100000
+
+#SQLite rows not touched for this many windows are deleted every PRUNE_EVERY writes
+PRUNE_EVERY = 1000
+
+throttled_logins = register(Counter('login_throttled_total', "Login attempts turned away by the throttle", ('key',)))
+
+
+class MemoryThrottleStore:
+    """Counters for a single process, dropping the least recently used keys past max_keys"""
+
+    def __init__(self, max_keys=DEFAULT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def transact(self, keys, update):
+        """Call update(states) with the states of keys locked together, saving their changes. Returns what update returns"""
+        with self._lock:
+            states = []
+            for key in keys:
+                states.append(self._states.setdefault(key, {}))
+                self._states.move_to_end(key)
+            result = update(states)
+
+            while len(self._states) > self.max_keys:
+                self._states.popitem(last=False)
+
+        return result
+
+
+class SQLiteThrottleStore:
+    """Counters in a sqlite file, so every gunicorn worker on the host sees the same attempts"""
+
+    def __init__(self, path, expire_after=2 * DEFAULT_WINDOW):
+        self.path = path
+        self.expire_after = expire_after
+        self.writes = 0
+        self.db = SQLiteConnection(path, [
+            """CREATE TABLE IF NOT EXISTS login_throttle (
+                   key TEXT PRIMARY KEY,
+                   state TEXT NOT NULL,
+                   updated_at REAL NOT NULL)""",
+            "CREATE INDEX IF NOT EXISTS login_throttle_updated_at_idx ON login_throttle (updated_at)",
+        ])
+
+    def transact(self, keys, update):
+        #the write lock is held throughout, so two workers can't both let the last attempt through
+        with self.db.transaction() as conn:
+            states = []
+            for key in keys:
+                row = conn.execute("SELECT state FROM login_throttle WHERE key = ?", (key,)).fetchone()
+                states.append(json.loads(row[0]) if row else {})
+            result = update(states)
+            now = time.time()
+            conn.executemany("INSERT OR REPLACE INTO login_throttle (key, state, updated_at) VALUES (?, ?, ?)",
+                             [(key, json.dumps(state), now) for key, state in zip(keys, states)])
+
+            self.writes += 1
+            if self.writes % PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM login_throttle WHERE updated_at < ?", (now - self.expire_after,))
+
+        return result
+
+
+def roll(state, now, window):
+    """Move a key's counters up to the window now falls in"""
+    start = now - now % window
+    if state.get('start') == start:
+        return
+
+    #the old current window only carries over if it is the one right before this one
+    previous = state.get('current', 0) if state.get('start') == start - window else 0
+    state.update(start=start, current=0, previous=previous)
+
+
+def estimate(state, now, window):
+    """Attempts in the sliding window ending now"""
+    overlap = 1 - (now - state['start']) / window
+    return state['current'] + state['previous'] * overlap
+
+
+def retry_after(state, now, window, most):
+    """Seconds until the sliding window count is back down to most"""
+    if most <= 0:
+        #with a limit of one, wait for every counted attempt to leave the window
+        until = state['start'] + (2 * window if state['current'] else window)
+    elif state['current'] < most:
+        #the previous window's share fades out over this window
+        until = state['start'] + window * (1 - (most - state['current']) / state['previous'])
+    else:
+        #wait for this window's attempts to become the previous window's and fade
+        until = state['start'] + window + window * (1 - most / state['current'])
+
+    return max(1, math.ceil(until - now))
+
+
+class LoginThrottle:
+    """Allow at most max_per_user attempts per username and max_per_ip per client IP in any window seconds"""
+
+    def __init__(self, max_per_user=10, max_per_ip=50, window=DEFAULT_WINDOW, store=None, proxies=0):
+        self.max_per_user = max_per_user
+        self.max_per_ip = max_per_ip
+        self.window = window
+        self.store = store if store is not None else MemoryThrottleStore()
+        self.proxies = proxies
+
+    def init_app(self, app):
+        """Configure the throttle from the Flask app config"""
+        config = app.config
+
+        self.max_per_user = int(config.get('LOGIN_MAX_ATTEMPTS_PER_USER', 10))
+        self.max_per_ip = int(config.get('LOGIN_MAX_ATTEMPTS_PER_IP', 50))
+        self.window = float(config.get('LOGIN_THROTTLE_WINDOW', DEFAULT_WINDOW))
+        self.proxies = int(config.get('LOGIN_THROTTLE_PROXIES', 0))
+
+        path = config.get('LOGIN_THROTTLE_PATH')
+        self.store = SQLiteThrottleStore(path, 2 * self.window) if path else MemoryThrottleStore()
+
+    def client_ip(self, request):
+        """The client's address, trusting X-Forwarded-For as far as the proxies in front of the app"""
+        route = request.access_route
+        if self.proxies and len(route) >= self.proxies:
+            return route[-self.proxies]
+        return request.remote_addr
+
+    def attempt(self, username, ip):
+        """Count a login attempt. Returns 0 if it may go ahead, otherwise seconds until it may be retried"""
+        username = (username or '').strip().lower()
+
+        kinds = ('ip', 'user')
+        limits = (self.max_per_ip, self.max_per_user)
+
+        def update(states):
+            now = time.time()
+            for state in states:
+                roll(state, now, self.window)
+
+            #check both keys before counting either, so a turned away attempt counts against neither
+            for kind, state, limit in zip(kinds, states, limits):
+                if estimate(state, now, self.window) + 1 > limit:
+                    return kind, retry_after(state, now, self.window, limit - 1)
+
+            for state in states:
+                state['current'] += 1
+            return None, 0
+
+        #one transaction for the check and the count, so concurrent attempts can't all pass before any is counted
+        kind, wait = self.store.transact((f'ip:{ip}', f'user:{username}'), update)
+        if wait:
+            throttled_logins.inc(kind)
+        return wait
+
+    def reset(self, username):
+        """Forget a username's attempts after it logs in"""
+        username = (username or '').strip().lower()
+        self.store.transact((f'user:{username}',), lambda states: states[0].clear())
+
+
+login_throttle = LoginThrottle()
+
+
+def connect_throttle(app):
+    login_throttle.init_app(app)
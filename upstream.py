@@ -0,0 +1,343 @@
+"""Client for the Spoonacular API, shared by every route"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from cache import ResponseCache, make_cache_key
+from quota import QuotaLimiter, INTERACTIVE
+from metrics import upstream_seconds, register_collector
+
+API_BASE_URL = "https://api.spoonacular.com"
+
+#Statuses worth retrying; anything else is returned to the caller straight away
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+#Recipe ids in API paths, replaced so every recipe's requests share one metrics label
+PATH_ID = re.compile(r'/\d+(?=/|$)')
+
+class UpstreamError(Exception):
+    """The API did not give a usable response"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class CircuitOpenError(UpstreamError):
+    """The API has been failing, so the request was refused without trying"""
+
+
+class QuotaExceededError(UpstreamError):
+    """The request was held back to stay within the API's rate limit or daily quota"""
+
+
+class CircuitBreaker:
+    """Fail fast after repeated upstream failures, then let a trial request through"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        """Return True if a request may be sent now"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+
+            #half open: let one request through and push the window forward for everyone else
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.opened_at = time.monotonic()
+                return True
+
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class _Call:
+    """A fetch in progress that other callers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run one fetch per key at a time, handing its result to every caller that asked meanwhile.
+
+    With a lock_dir the workers on a host also take a file lock per key, removed
+    again once the fetch is done. A worker that had to wait for another one's lock
+    checks the shared cache before fetching.
+    """
+
+    def __init__(self, lock_dir=None, lock_timeout=15):
+        self.lock_dir = lock_dir
+        self.lock_timeout = lock_timeout
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+
+    def do(self, key, fetch, cached=None):
+        """Return fetch(), or the result of the identical fetch already in flight"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._fetch_locked(key, fetch, cached)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+    def lock_path(self, key):
+        #one file per key, so requests for different keys never wait on each other
+        return os.path.join(self.lock_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.lock')
+
+    def _lock_file(self, path, deadline):
+        """Open and lock a key's lock file. Returns (file or None once past the deadline, whether it waited)"""
+        import fcntl
+
+        waited = False
+        while True:
+            f = open(path, 'a')
+
+            #poll rather than block, so a gevent worker keeps serving other requests meanwhile
+            while True:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() > deadline:
+                        f.close()
+                        return None, waited
+                    waited = True
+                    time.sleep(0.05)
+
+            #the worker before us removes the file when it is done, so only a lock on the file still there counts
+            try:
+                if os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+                    return f, waited
+            except FileNotFoundError:
+                pass
+            f.close()
+            waited = True
+
+    def _fetch_locked(self, key, fetch, cached):
+        """Fetch while holding the key's lock file, if workers share one"""
+        if not self.lock_dir:
+            return fetch()
+
+        path = self.lock_path(key)
+        f, waited = self._lock_file(path, time.monotonic() + self.lock_timeout)
+        if f is None:
+            return fetch()
+
+        try:
+            if waited and cached is not None:
+                data = cached()
+                if data is not None:
+                    with self._lock:
+                        self.coalesced += 1
+                    return data
+
+            return fetch()
+        finally:
+            #remove the file while still holding it, so the directory doesn't keep a file for every key
+            os.unlink(path)
+            f.close()
+
+
+class SpoonacularClient:
+    """Pooled, cached HTTP client for the Spoonacular API"""
+
+    def __init__(self, base_url=API_BASE_URL, api_key=None, cache=None, pool_size=10,
+                 connect_timeout=3.05, read_timeout=10, retries=2, backoff=0.3,
+                 failure_threshold=5, reset_timeout=30, lock_dir=None, limiter=None):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.cache = cache if cache is not None else ResponseCache()
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.flight = SingleFlight(lock_dir)
+        self.limiter = limiter if limiter is not None else QuotaLimiter()
+        self.session = self._make_session(pool_size, retries, backoff)
+
+    def init_app(self, app):
+        """Configure the client from the Flask app config"""
+        config = app.config
+
+        self.base_url = config.get('SPOONACULAR_BASE_URL', API_BASE_URL).rstrip('/')
+        self.api_key = config.get('API_SECRET_KEY')
+        self.cache = ResponseCache.from_config(config)
+        self.timeout = (float(config.get('UPSTREAM_CONNECT_TIMEOUT', 3.05)),
+                        float(config.get('UPSTREAM_READ_TIMEOUT', 10)))
+        self.breaker = CircuitBreaker(int(config.get('UPSTREAM_BREAKER_THRESHOLD', 5)),
+                                      float(config.get('UPSTREAM_BREAKER_RESET', 30)))
+        self.flight = SingleFlight(config.get('UPSTREAM_LOCK_DIR'))
+        self.limiter = QuotaLimiter.from_config(config)
+        self.session = self._make_session(int(config.get('UPSTREAM_POOL_SIZE', 10)),
+                                          int(config.get('UPSTREAM_RETRIES', 2)),
+                                          float(config.get('UPSTREAM_BACKOFF', 0.3)))
+
+    @staticmethod
+    def _make_session(pool_size, retries, backoff):
+        """Create a keep-alive session that retries idempotent requests on 429/5xx"""
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUSES,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def get(self, path, params=None, priority=INTERACTIVE):
+        """GET an API endpoint and return the decoded JSON, answering from the cache when possible.
+
+        Near the daily quota, or when the rate limit holds the request back, an
+        expired cached answer is returned instead if there is one.
+        """
+        params = dict(params or {})
+
+        data = self.cache.get(path, params)
+        if data is not None:
+            return data
+
+        if self.limiter.near_limit():
+            data = self.cache.get_stale(path, params)
+            if data is not None:
+                return data
+
+        try:
+            #identical requests made while this one is in flight wait for its answer
+            return self.flight.do(make_cache_key(path, params),
+                                  lambda: self._fetch(path, params, priority),
+                                  lambda: self.cache.get(path, params))
+        except QuotaExceededError:
+            data = self.cache.get_stale(path, params)
+            if data is None:
+                raise
+            return data
+
+    def _fetch(self, path, params, priority=INTERACTIVE):
+        """Send the request, then cache and return the decoded JSON"""
+        params = dict(params)
+
+        if not self.breaker.allow():
+            raise CircuitOpenError("The recipe service is unavailable, please try again shortly")
+
+        if not self.limiter.acquire(priority):
+            raise QuotaExceededError("The recipe service is busy, please try again shortly", 429)
+
+        params['apiKey'] = self.api_key
+
+        endpoint = PATH_ID.sub('/{id}', '/' + path.strip('/'))
+        started = time.perf_counter()
+
+        try:
+            resp = self.session.get(f'{self.base_url}/{path}', params=params, timeout=self.timeout)
+        except requests.RequestException as e:
+            upstream_seconds.observe(time.perf_counter() - started, endpoint, 'error')
+            self.breaker.record_failure()
+            raise UpstreamError(f"Could not reach the recipe service: {e}")
+
+        upstream_seconds.observe(time.perf_counter() - started, endpoint, str(resp.status_code))
+
+        self.limiter.record(resp.headers, resp.status_code)
+
+        if resp.status_code in RETRY_STATUSES:
+            self.breaker.record_failure()
+            raise UpstreamError("The recipe service is unavailable, please try again shortly", resp.status_code)
+
+        self.breaker.record_success()
+
+        if resp.status_code != 200:
+            raise UpstreamError(f"The recipe service rejected the request ({resp.status_code})", resp.status_code)
+
+        try:
+            data = resp.json()
+        except ValueError:
+            raise UpstreamError("The recipe service sent an invalid response", resp.status_code)
+
+        self.cache.set(path, params, data)
+        return data
+
+
+spoonacular = SpoonacularClient()
+
+
+@register_collector
+def upstream_samples():
+    """Cache, coalescing, rate limit and quota numbers of the shared client"""
+    samples = [
+        ('upstream_cache_hits_total', 'counter', "API responses answered from the cache", spoonacular.cache.hits),
+        ('upstream_cache_misses_total', 'counter', "API responses not in the cache", spoonacular.cache.misses),
+        ('upstream_cache_stale_hits_total', 'counter', "Expired API responses served near the quota", spoonacular.cache.stale_hits),
+        ('upstream_coalesced_total', 'counter', "Requests that shared an identical in-flight request", spoonacular.flight.coalesced),
+        ('upstream_throttled_total', 'counter', "Requests held back by the rate limiter", spoonacular.limiter.throttled),
+        ('upstream_circuit_open', 'gauge', "1 while the circuit breaker is refusing requests", int(spoonacular.breaker.is_open)),
+    ]
+
+    status = spoonacular.limiter.status()
+    if status['quota_left'] is not None:
+        samples.append(('upstream_quota_left', 'gauge', "API points left today", status['quota_left']))
+    if status['quota_used'] is not None:
+        samples.append(('upstream_quota_used', 'gauge', "API points used today", status['quota_used']))
+
+    return samples
+
+
+def connect_upstream(app):
+    """Connect the shared Spoonacular client to the Flask app"""
+
+    spoonacular.init_app(app)